@@ -11,6 +11,7 @@ export class ProductService {
     featured?: string | null;
     search?: string | null;
     sortBy?: string | null;
+    updatedSince?: string | null;
   }) {
     const {
       page = 1,
@@ -19,6 +20,7 @@ export class ProductService {
       featured,
       search,
       sortBy = 'newest',
+      updatedSince,
     } = params;
 
     const skip = (page - 1) * pageSize;
@@ -45,7 +47,12 @@ export class ProductService {
       ];
     }
     
-    let orderBy: Prisma.ProductOrderByWithRelationInput = { createdAt: 'desc' };
+    // Incremental sync: only products changed at or after the given time
+    if (updatedSince) {
+      where.updatedAt = { gte: new Date(updatedSince) };
+    }
+    
+    let orderBy: Prisma.ProductOrderByWithRelationInput | Prisma.ProductOrderByWithRelationInput[] = { createdAt: 'desc' };
     
     switch (sortBy) {
       case 'price_asc':
@@ -57,6 +64,9 @@ export class ProductService {
       case 'name':
         orderBy = { name: 'asc' };
         break;
+      case 'updated':
+        orderBy = [{ updatedAt: 'asc' }, { id: 'asc' }];
+        break;
     }
     
     const [products, total] = await Promise.all([
@@ -9,6 +9,7 @@ const searchParamsSchema = z.object({
   featured: z.string().optional(),
   search: z.string().optional(),
   sortBy: z.string().optional().default('newest'),
+  updatedSince: z.string().datetime().optional(),
 })
 
 export async function getAllProductsHandler(request: NextRequest) {
@@ -0,0 +1,263 @@
+"""
+Adaptive concurrency limits (load shedding) for backend API calls.
+
+Timeouts bound a single call, but when the API slows down every worker
+thread still ends up waiting on it, and pages that could be answered from
+cache queue behind them. AdmissionControl caps the calls in flight per
+(method, endpoint) and sheds the excess:
+
+- Each endpoint has an AIMD limit: it grows by about one slot per limit's
+  worth of successful calls while the slots are in use, and is multiplied
+  by `backoff` (once per round trip of calls) when a call fails, returns a
+  5xx or takes more than `tolerance` times the endpoint's usual latency.
+  The usual latency is a slow moving average, so a backend that got
+  permanently slower is eventually accepted as the new normal.
+- Calls over the limit wait in a FIFO queue of at most `max_queue` callers
+  for at most `queue_timeout` seconds. A full queue or an expired wait
+  raises OverloadedError right away.
+
+OverloadedError subclasses `requests.exceptions.ConnectionError`, so the
+routes' existing `except RequestException` fallbacks (stale caches, empty
+banners, "could not fetch" pages) are the degraded path. Rejected calls
+never reach the API and do not count as circuit breaker failures.
+
+One instance is shared by the sync client and the ASGI mode's async client,
+since both talk to the same backend.
+"""
+import asyncio
+import threading
+import time
+from collections import deque
+
+import requests
+
+from metrics import endpoint_label
+
+
+class OverloadedError(requests.exceptions.ConnectionError):
+    """Raised instead of calling the API when an endpoint's limit and queue are full."""
+
+    def __init__(self, message, reason):
+        super().__init__(message)
+        self.reason = reason
+
+
+class _Limit:
+    """Limit and queue of one (method, endpoint); guarded by AdmissionControl._lock."""
+
+    __slots__ = ('limit', 'in_flight', 'waiters', 'latency', 'decreased_at')
+
+    def __init__(self, initial):
+        self.limit = float(initial)
+        self.in_flight = 0
+        self.waiters = deque()
+        # Moving average of successful call latency, None until the first sample
+        self.latency = None
+        self.decreased_at = 0.0
+
+
+class _Waiter:
+    """A queued thread; `granted` is set under the lock when a slot is handed over."""
+
+    def __init__(self):
+        self.granted = False
+        self._event = threading.Event()
+
+    def grant(self):
+        self.granted = True
+        self._event.set()
+
+    def wait(self, timeout):
+        self._event.wait(timeout)
+
+
+class _AsyncWaiter:
+    """A queued coroutine; slots can be handed over from any thread."""
+
+    def __init__(self):
+        self.granted = False
+        self._loop = asyncio.get_running_loop()
+        self._future = self._loop.create_future()
+
+    def grant(self):
+        self.granted = True
+        self._loop.call_soon_threadsafe(self._resolve)
+
+    def _resolve(self):
+        if not self._future.done():
+            self._future.set_result(None)
+
+    async def wait(self, timeout):
+        try:
+            await asyncio.wait_for(asyncio.shield(self._future), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+
+class Permit:
+    """A slot of one endpoint's limit; pass it back to AdmissionControl.release()."""
+
+    __slots__ = ('key', 'queued')
+
+    def __init__(self, key, queued):
+        self.key = key
+        self.queued = queued
+
+
+class AdmissionControl:
+    """Per-endpoint adaptive concurrency limits with a bounded wait queue."""
+
+    def __init__(self, initial_limit=20, min_limit=2, max_limit=200, max_queue=50, queue_timeout=1.0,
+                 tolerance=2.0, backoff=0.9, min_latency=0.05, smoothing=0.02):
+        self.initial_limit = initial_limit
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.tolerance = tolerance
+        self.backoff = backoff
+        # Calls faster than this never count as slow, however fast the endpoint usually is
+        self.min_latency = min_latency
+        self.smoothing = smoothing
+        self._limits = {}
+        self._lock = threading.Lock()
+        # Callables observer(method, endpoint, queued_seconds, rejected_reason_or_None)
+        # run for every call that was queued or rejected
+        self.observers = []
+
+    @classmethod
+    def from_env(cls, environ):
+        """Admission control from API_LIMIT_* settings, or None when API_CONCURRENCY_LIMIT=0."""
+        if environ.get('API_CONCURRENCY_LIMIT', '1') != '1':
+            return None
+        return cls(
+            initial_limit=int(environ.get('API_LIMIT_INITIAL', 20)),
+            min_limit=int(environ.get('API_LIMIT_MIN', 2)),
+            max_limit=int(environ.get('API_LIMIT_MAX', 200)),
+            max_queue=int(environ.get('API_LIMIT_QUEUE', 50)),
+            queue_timeout=float(environ.get('API_LIMIT_QUEUE_TIMEOUT', 1)),
+            tolerance=float(environ.get('API_LIMIT_LATENCY_TOLERANCE', 2)),
+            backoff=float(environ.get('API_LIMIT_BACKOFF', 0.9)),
+        )
+
+    def _entry(self, key):
+        entry = self._limits.get(key)
+        if entry is None:
+            entry = self._limits[key] = _Limit(min(max(self.initial_limit, self.min_limit), self.max_limit))
+        return entry
+
+    def _try_admit(self, key):
+        """True if a slot was taken, else the entry to queue on, or None if its queue is full (lock held)."""
+        entry = self._entry(key)
+        if entry.in_flight < int(entry.limit) and not entry.waiters:
+            entry.in_flight += 1
+            return True
+        if len(entry.waiters) >= self.max_queue:
+            return None
+        return entry
+
+    def _reject(self, key, reason, queued=0.0):
+        method, endpoint = key
+        self._notify(method, endpoint, queued, reason)
+        detail = 'queue full' if reason == 'queue_full' else f"no slot within {self.queue_timeout:g}s"
+        return OverloadedError(f"Backend overloaded, shedding {method} {endpoint} ({detail})", reason)
+
+    def _finish_wait(self, key, waiter, started):
+        """Permit for a waiter that stopped waiting, or raise if it was not granted a slot."""
+        queued = time.perf_counter() - started
+        with self._lock:
+            granted = waiter.granted
+            if not granted:
+                self._limits[key].waiters.remove(waiter)
+        if not granted:
+            raise self._reject(key, 'queue_timeout', queued)
+        self._notify(key[0], key[1], queued, None)
+        return Permit(key, queued)
+
+    def acquire(self, method, path):
+        """Permit for a call, waiting in the endpoint's queue if needed; raises OverloadedError."""
+        key = (method, endpoint_label(path))
+        with self._lock:
+            admitted = self._try_admit(key)
+            if admitted is True:
+                return Permit(key, 0.0)
+            if admitted is not None:
+                waiter = _Waiter()
+                admitted.waiters.append(waiter)
+        if admitted is None:
+            raise self._reject(key, 'queue_full')
+        started = time.perf_counter()
+        waiter.wait(self.queue_timeout)
+        return self._finish_wait(key, waiter, started)
+
+    async def acquire_async(self, method, path):
+        """Like acquire() for coroutines, without blocking the event loop while queued."""
+        key = (method, endpoint_label(path))
+        with self._lock:
+            admitted = self._try_admit(key)
+            if admitted is True:
+                return Permit(key, 0.0)
+            if admitted is not None:
+                waiter = _AsyncWaiter()
+                admitted.waiters.append(waiter)
+        if admitted is None:
+            raise self._reject(key, 'queue_full')
+        started = time.perf_counter()
+        try:
+            await waiter.wait(self.queue_timeout)
+        except BaseException:
+            # Cancelled while queued: give back a slot handed over in the meantime
+            with self._lock:
+                if waiter.granted:
+                    self._release(key, None, False)
+                else:
+                    self._limits[key].waiters.remove(waiter)
+            raise
+        return self._finish_wait(key, waiter, started)
+
+    def release(self, permit, elapsed=None, dropped=False):
+        """Return a permit; `elapsed` (seconds) and `dropped` (error, timeout or 5xx) adapt the limit.
+
+        Pass elapsed=None for calls that never reached the API.
+        """
+        with self._lock:
+            self._release(permit.key, elapsed, dropped)
+
+    def _release(self, key, elapsed, dropped):
+        entry = self._limits[key]
+        if elapsed is not None:
+            self._adapt(entry, elapsed, dropped)
+        entry.in_flight -= 1
+        # Hand freed (or newly added) slots to the queue in arrival order
+        while entry.waiters and entry.in_flight < int(entry.limit):
+            entry.in_flight += 1
+            entry.waiters.popleft().grant()
+
+    def _adapt(self, entry, elapsed, dropped):
+        slow = (entry.latency is not None
+                and elapsed > max(entry.latency * self.tolerance, self.min_latency))
+        if dropped or slow:
+            now = time.monotonic()
+            # Calls in flight together see the same slowdown: only calls sent after
+            # the last decrease can lower the limit again
+            if now - elapsed >= entry.decreased_at:
+                entry.limit = max(self.min_limit, entry.limit * self.backoff)
+                entry.decreased_at = now
+        elif entry.in_flight * 2 >= entry.limit:
+            # Only grow while at least half the slots are used
+            entry.limit = min(self.max_limit, entry.limit + 1.0 / entry.limit)
+        if not dropped:
+            entry.latency = elapsed if entry.latency is None else entry.latency + self.smoothing * (elapsed - entry.latency)
+
+    def _notify(self, method, endpoint, queued, reason):
+        for observer in self.observers:
+            try:
+                observer(method, endpoint, queued, reason)
+            except Exception as e:
+                print(f"Admission control observer failed: {e}")
+
+    def snapshot(self):
+        """[(method, endpoint, limit, in_flight, queued)] of every endpoint seen so far."""
+        with self._lock:
+            return [(method, endpoint, int(entry.limit), entry.in_flight, len(entry.waiters))
+                    for (method, endpoint), entry in self._limits.items()]
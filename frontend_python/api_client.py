@@ -0,0 +1,326 @@
+"""
+Shared HTTP client for all calls from the Flask frontend to the Next.js API.
+
+A single pooled `requests.Session` is reused by every route so connections to
+API_BASE_URL are kept alive, every call has a connect/read timeout, idempotent
+GETs are retried with backoff, a circuit breaker stops hammering the API
+while it is down and optional admission control (admission.py) sheds calls
+beyond each endpoint's adaptive concurrency limit while it is slow.
+"""
+import contextvars
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from admission import OverloadedError
+from singleflight import flight_key
+
+# Never forwarded by the admin API proxies: hop-by-hop headers (RFC 9110 7.6.1) and
+# cookies, since the browser only holds this app's own session cookie
+PROXY_SKIP_HEADERS = frozenset({
+    'connection', 'keep-alive', 'proxy-authenticate', 'proxy-authorization', 'proxy-connection',
+    'te', 'trailer', 'transfer-encoding', 'upgrade', 'host', 'cookie', 'set-cookie',
+})
+
+
+def proxy_headers(headers):
+    """(name, value) pairs of `headers` that a proxy passes through unchanged."""
+    return [(name, value) for name, value in headers.items() if name.lower() not in PROXY_SKIP_HEADERS]
+
+
+class SizedStream:
+    """File-like request body of known length.
+
+    `requests` chunk-encodes file objects whose size it cannot determine;
+    this lets a proxied upload stream through with its Content-Length.
+    """
+
+    def __init__(self, stream, length):
+        self.stream = stream
+        self.length = length
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        return iter(lambda: self.stream.read(64 * 1024), b'')
+
+    def read(self, size=-1):
+        return self.stream.read(size)
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """Raised instead of calling the API while the circuit breaker is open.
+
+    Subclasses ConnectionError so existing `except RequestException` blocks
+    in the routes handle it like any other unreachable-backend error.
+    """
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker (closed -> open -> half-open)."""
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state()
+
+    def _state(self):
+        if self._opened_at is None:
+            return 'closed'
+        if time.monotonic() - self._opened_at >= self.reset_timeout:
+            return 'half-open'
+        return 'open'
+
+    def allow_request(self):
+        """Return True if a call may go through right now."""
+        if self.failure_threshold <= 0:
+            return True
+        with self._lock:
+            state = self._state()
+            if state == 'closed':
+                return True
+            if state == 'half-open' and not self._trial_in_flight:
+                # Let exactly one trial request probe the backend
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+
+
+class BackendClient:
+    """Pooled, timeout-bounded client for the backend API.
+
+    Paths are relative to `base_url`, e.g. `client.get('/categories')`.
+    Responses are plain `requests.Response` objects so callers keep using
+    `raise_for_status()` / `.json()` / `.status_code` as before.
+    """
+
+    RETRY_STATUSES = (502, 503, 504)
+
+    def __init__(self, base_url, pool_size=20, connect_timeout=3.05, read_timeout=10.0,
+                 max_retries=2, retry_backoff=0.3, breaker_threshold=5, breaker_reset=30.0):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = (connect_timeout, read_timeout)
+        self.breaker = CircuitBreaker(breaker_threshold, breaker_reset)
+        self.session = self._build_session(pool_size, max_retries, retry_backoff)
+        # Callables observer(method, path, elapsed_seconds, response, error) run after every call
+        self.observers = []
+        # Optional singleflight.SingleFlight merging identical concurrent GETs
+        self.single_flight = None
+        # Callables observer(method, path, response, error) run when a GET got another caller's result
+        self.coalesced_observers = []
+        # Optional admission.AdmissionControl limiting concurrent calls per endpoint
+        self.admission = None
+
+    @classmethod
+    def from_env(cls, base_url, environ):
+        """Build a client from API_* settings in `environ` (usually os.environ)."""
+        return cls(
+            base_url,
+            pool_size=int(environ.get('API_POOL_SIZE', 20)),
+            connect_timeout=float(environ.get('API_CONNECT_TIMEOUT', 3.05)),
+            read_timeout=float(environ.get('API_READ_TIMEOUT', 10)),
+            max_retries=int(environ.get('API_MAX_RETRIES', 2)),
+            retry_backoff=float(environ.get('API_RETRY_BACKOFF', 0.3)),
+            breaker_threshold=int(environ.get('API_BREAKER_THRESHOLD', 5)),
+            breaker_reset=float(environ.get('API_BREAKER_RESET', 30)),
+        )
+
+    def _build_session(self, pool_size, max_retries, retry_backoff):
+        # Only idempotent methods are retried on read errors / 5xx; urllib3
+        # still retries connect errors for every method since nothing was sent.
+        retry = Retry(
+            total=max_retries,
+            connect=max_retries,
+            read=max_retries,
+            status=max_retries,
+            backoff_factor=retry_backoff,
+            status_forcelist=self.RETRY_STATUSES,
+            allowed_methods=frozenset({'GET', 'HEAD', 'OPTIONS'}),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        session = requests.Session()
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    def url(self, path):
+        return f"{self.base_url}/{path.lstrip('/')}"
+
+    def request(self, method, path, **kwargs):
+        """Send a request to the API through admission control, the pool and circuit breaker."""
+        started = time.perf_counter()
+        permit = None
+        if self.admission is not None:
+            try:
+                permit = self.admission.acquire(method, path)
+            except OverloadedError as e:
+                self._notify(method, path, started, None, e)
+                raise
+        # Admission comes first: a shed call must not take the breaker's half-open trial
+        if not self.breaker.allow_request():
+            if permit is not None:
+                self.admission.release(permit)
+            error = CircuitOpenError(f"Backend circuit open, skipping {method} {path}")
+            self._notify(method, path, started, None, error)
+            raise error
+        kwargs.setdefault('timeout', self.timeout)
+        sent = time.perf_counter()
+        try:
+            response = self.session.request(method, self.url(path), **kwargs)
+        except requests.exceptions.RequestException as e:
+            self.breaker.record_failure()
+            if permit is not None:
+                self.admission.release(permit, time.perf_counter() - sent, dropped=True)
+            self._notify(method, path, started, None, e)
+            raise
+        except BaseException:
+            if permit is not None:
+                self.admission.release(permit)
+            raise
+        if response.status_code >= 500:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        if permit is not None:
+            self.admission.release(permit, time.perf_counter() - sent, dropped=response.status_code >= 500)
+        self._notify(method, path, started, response, None)
+        return response
+
+    def _notify(self, method, path, started, response, error):
+        elapsed = time.perf_counter() - started
+        for observer in self.observers:
+            try:
+                observer(method, path, elapsed, response, error)
+            except Exception as e:
+                print(f"API client observer failed: {e}")
+
+    def get(self, path, **kwargs):
+        if self.single_flight is None or kwargs.get('stream'):
+            return self.request('GET', path, **kwargs)
+        key = flight_key(self.url(path), kwargs.get('params'), kwargs.get('headers'))
+        called = []
+
+        def call():
+            called.append(True)
+            return self.request('GET', path, **kwargs)
+
+        try:
+            response = self.single_flight.do(key, call)
+        except requests.exceptions.RequestException as e:
+            if not called:
+                self._notify_coalesced('GET', path, None, e)
+            raise
+        if not called:
+            self._notify_coalesced('GET', path, response, None)
+        return response
+
+    def _notify_coalesced(self, method, path, response, error):
+        # Observers only see the call in the thread that made it
+        for observer in self.coalesced_observers:
+            try:
+                observer(method, path, response, error)
+            except Exception as e:
+                print(f"API client observer failed: {e}")
+
+    def post(self, path, **kwargs):
+        return self.request('POST', path, **kwargs)
+
+    def put(self, path, **kwargs):
+        return self.request('PUT', path, **kwargs)
+
+    def delete(self, path, **kwargs):
+        return self.request('DELETE', path, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+
+class FanOut:
+    """Runs the independent backend calls of one page render concurrently.
+
+    Shared by all requests: `max_workers` bounds the threads of the whole
+    process and `max_concurrency` how many calls a single request may have
+    in flight at once. Each call runs in a copy of the caller's contextvars
+    context, so request-scoped state (e.g. per-request timings) follows it
+    into the pool; pass headers/tokens in explicitly rather than reading
+    the Flask session from a call.
+    """
+
+    def __init__(self, max_workers=32, max_concurrency=4, timeout=15.0):
+        self.max_concurrency = max(1, max_concurrency)
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='api-fanout')
+
+    @classmethod
+    def from_env(cls, environ):
+        return cls(
+            max_workers=int(environ.get('API_FANOUT_WORKERS', 32)),
+            max_concurrency=int(environ.get('API_FANOUT_PER_REQUEST', 4)),
+            timeout=float(environ.get('API_FANOUT_TIMEOUT', 15)),
+        )
+
+    def gather(self, timeout=None, **calls):
+        """Run zero-argument callables concurrently and return {name: result}.
+
+        A call that raises or does not finish within `timeout` seconds
+        (measured from the start of gather) is logged and yields None, so
+        one slow upstream cannot fail the whole page.
+        """
+        if not calls:
+            return {}
+        deadline = time.monotonic() + (self.timeout if timeout is None else timeout)
+        pending_calls = list(calls.items())
+        running = {}
+        results = dict.fromkeys(calls)
+
+        while pending_calls or running:
+            while pending_calls and len(running) < self.max_concurrency:
+                name, call = pending_calls.pop(0)
+                running[self._executor.submit(contextvars.copy_context().run, call)] = name
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            done, _ = wait(running, timeout=remaining, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    results[name] = future.result()
+                except Exception as e:
+                    print(f"Concurrent call '{name}' failed: {e}")
+
+        for future, name in running.items():
+            future.cancel()
+            print(f"Concurrent call '{name}' timed out")
+        for name, _ in pending_calls:
+            print(f"Concurrent call '{name}' skipped, deadline reached")
+        return results
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -1,7 +1,35 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, session, g, jsonify
+import time
+# Process start reference for the time-to-ready report of the startup warm-up
+STARTED_AT = time.perf_counter()
+
+from flask import Flask, render_template, stream_template, stream_with_context, make_response, request, redirect, url_for, flash, session, g, jsonify, abort, Response, send_file, send_from_directory, has_request_context
+from flask.signals import before_render_template, template_rendered
 import requests
+import urllib3
 import os
+import hashlib
+import io
+import json
+import secrets
 from dotenv import load_dotenv
+from jinja2 import FileSystemBytecodeCache
+from admission import AdmissionControl
+from api_client import BackendClient, FanOut, SizedStream, proxy_headers
+from singleflight import SingleFlight, FileSingleFlight
+from cache import StaleWhileRevalidate, LRUCache
+from page_cache import PageCache
+from models import ProductNormalizer
+from related import RelatedProductsIndex
+from search import SearchIndex, effective_price, tokenize
+from replica import CatalogReplica
+from bulk_import import BulkImporter, ImportInProgress, IMPORT_ID, PARSERS, import_format
+from images import ThumbnailStore, decode_data_uri, SIZE_BUCKETS, FORMATS
+from sessions import ServerSideSession, ServerSideSessionInterface
+from auth_tokens import TokenVerifier
+from static_assets import AssetManifest, AssetBuildError, build as build_assets
+from http_cache import Compressor, data_etag, record_versions, template_fingerprint
+from warmup import warm_up, compile_templates
+from metrics import Registry, RequestTimings, SlowRequestProfiler, endpoint_label, SIZE_BUCKETS as BYTE_BUCKETS
 
 # Load environment variables from the root .env file
 dotenv_path = os.path.join(os.path.dirname(__file__), '..', '.env')
@@ -10,12 +38,305 @@ load_dotenv(dotenv_path=dotenv_path)
 app = Flask(__name__)
 app.secret_key = os.getenv("FLASK_SECRET_KEY", "a_default_secret_key_for_development")
 
+# Compiled templates are kept on disk so new workers skip parsing/compiling them
+# (entries are keyed by a checksum of the template source, so edits are picked up)
+TEMPLATE_BYTECODE_CACHE_DIR = os.getenv('TEMPLATE_BYTECODE_CACHE_DIR') or os.path.join(app.instance_path, 'template_cache')
+if os.getenv('TEMPLATE_BYTECODE_CACHE', '1') == '1':
+    try:
+        os.makedirs(TEMPLATE_BYTECODE_CACHE_DIR, exist_ok=True)
+        app.jinja_options = {**app.jinja_options,
+                             'bytecode_cache': FileSystemBytecodeCache(TEMPLATE_BYTECODE_CACHE_DIR)}
+    except OSError as e:
+        print(f"Template bytecode cache disabled: {e}")
+
 # Increase max content length to 16MB for avatar uploads
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024
 
+# Optional server-side sessions: the cookie then only carries an opaque session id
+if os.getenv('SESSION_BACKEND', 'cookie').lower() != 'cookie':
+    app.session_interface = ServerSideSessionInterface.from_env(os.environ, app.instance_path)
+
 # Define the base URL of your Next.js API from environment variables
 API_BASE_URL = os.getenv('API_BASE_URL', 'http://localhost:3000/api')
 
+# Shared pooled client used for every backend call (timeouts, retries, circuit breaker)
+api = BackendClient.from_env(API_BASE_URL, os.environ)
+
+# Adaptive per-endpoint concurrency limits: calls beyond them are shed (OverloadedError)
+# so the routes fall back to cached or empty data instead of tying up every worker thread
+api.admission = AdmissionControl.from_env(os.environ)
+
+# Runs independent backend calls of a single page render in parallel
+fanout = FanOut.from_env(os.environ)
+
+# Identical concurrent GETs (same URL and auth scope) share one backend call, so an
+# expiring cache does not send a herd of requests; optionally also across local workers
+if os.getenv('API_SINGLE_FLIGHT', '1') == '1':
+    shared_flights = None
+    if os.getenv('API_SINGLE_FLIGHT_SHARED', '0') == '1':
+        shared_flights = FileSingleFlight(
+            os.getenv('API_SINGLE_FLIGHT_DIR') or os.path.join(app.instance_path, 'single_flight'),
+            wait_timeout=api.timeout[1]
+        )
+    api.single_flight = SingleFlight(shared=shared_flights)
+# Coalescing stats per client ('async' is added by asgi.py)
+SINGLE_FLIGHTS = {'sync': api.single_flight} if api.single_flight else {}
+
+# --------------------- Instrumentation ---------------------
+
+metrics = Registry()
+REQUEST_SECONDS = metrics.histogram(
+    'storefront_request_duration_seconds', 'Time to produce a response, per route', ('route', 'method', 'status'))
+RESPONSE_BYTES = metrics.histogram(
+    'storefront_response_bytes', 'Size of non-streamed responses, per route', ('route',), buckets=BYTE_BUCKETS)
+UPSTREAM_SECONDS = metrics.histogram(
+    'storefront_upstream_request_duration_seconds', 'Backend API call latency', ('endpoint', 'method', 'status'))
+UPSTREAM_BYTES = metrics.histogram(
+    'storefront_upstream_response_bytes', 'Backend API response size', ('endpoint',), buckets=BYTE_BUCKETS)
+UPSTREAM_ERRORS = metrics.counter(
+    'storefront_upstream_errors_total', 'Backend API calls that failed', ('endpoint', 'error'))
+UPSTREAM_QUEUE_SECONDS = metrics.histogram(
+    'storefront_upstream_queue_seconds', 'Time backend calls waited for a concurrency slot', ('endpoint', 'method'))
+UPSTREAM_REJECTIONS = metrics.counter(
+    'storefront_upstream_rejections_total', 'Backend calls shed by admission control', ('endpoint', 'method', 'reason'))
+TEMPLATE_SECONDS = metrics.histogram(
+    'storefront_template_render_seconds', 'Jinja template render time', ('template',))
+
+SERVER_TIMING = os.getenv('SERVER_TIMING', '0') == '1'
+profiler = SlowRequestProfiler(
+    threshold=float(os.getenv('PROFILE_SLOW_REQUESTS_MS', 1000)) / 1000,
+    interval=float(os.getenv('PROFILE_SAMPLE_INTERVAL_MS', 5)) / 1000,
+    output_dir=os.getenv('PROFILE_OUTPUT_DIR') or None
+)
+if os.getenv('PROFILE_SLOW_REQUESTS', '0') == '1':
+    profiler.enable()
+
+
+def _record_upstream_call(method, path, elapsed, response, error):
+    """API client observer: per-endpoint latency, size and error metrics"""
+    endpoint = endpoint_label(path)
+    if response is not None:
+        UPSTREAM_SECONDS.observe(elapsed, endpoint, method, str(response.status_code))
+        if response.status_code >= 500:
+            UPSTREAM_ERRORS.inc(endpoint, f'http_{response.status_code}')
+        size = response.headers.get('Content-Length')
+        if size and size.isdigit():
+            UPSTREAM_BYTES.observe(int(size), endpoint)
+    else:
+        UPSTREAM_SECONDS.observe(elapsed, endpoint, method, 'error')
+        UPSTREAM_ERRORS.inc(endpoint, type(error).__name__)
+    if (error is not None or response.status_code >= 500) and has_request_context():
+        # The page falls back to partial data; keep it out of the page cache (page_cache.py)
+        g.upstream_failed = True
+    timings = RequestTimings.current()
+    if timings:
+        timings.add_upstream(elapsed)
+
+
+def _record_coalesced_call(method, path, response, error):
+    """API client observer for GETs answered by another caller's request (see singleflight.py)"""
+    if (error is not None or response.status_code >= 500) and has_request_context():
+        # The leader's hook only marks its own request; this page fell back to partial data too
+        g.upstream_failed = True
+
+
+api.observers.append(_record_upstream_call)
+api.coalesced_observers.append(_record_coalesced_call)
+
+
+def _record_admission(method, endpoint, queued, reason):
+    """Admission control observer: queue time of queued calls and rejections"""
+    UPSTREAM_QUEUE_SECONDS.observe(queued, endpoint, method)
+    if reason:
+        UPSTREAM_REJECTIONS.inc(endpoint, method, reason)
+
+
+if api.admission is not None:
+    api.admission.observers.append(_record_admission)
+
+
+def _on_before_render(sender, template, context, **extra):
+    g.setdefault('template_started', []).append(time.perf_counter())
+
+
+def _on_rendered(sender, template, context, **extra):
+    started = g.get('template_started')
+    if not started:
+        return
+    elapsed = time.perf_counter() - started.pop()
+    TEMPLATE_SECONDS.observe(elapsed, template.name or 'string')
+    timings = RequestTimings.current()
+    if timings:
+        timings.add_render(elapsed)
+
+
+before_render_template.connect(_on_before_render, app)
+template_rendered.connect(_on_rendered, app)
+
+
+@app.before_request
+def start_request_timer():
+    """Start per-request timings (registered first so it covers the other hooks)"""
+    g.request_timings = RequestTimings.start()
+    profiler.begin()
+
+
+@app.after_request
+def record_request_metrics(response):
+    timings = g.get('request_timings')
+    if not timings:
+        return response
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    REQUEST_SECONDS.observe(time.perf_counter() - timings.started, route, request.method, str(response.status_code))
+    if not response.is_streamed:
+        RESPONSE_BYTES.observe(response.calculate_content_length() or 0, route)
+    if SERVER_TIMING:
+        response.headers['Server-Timing'] = timings.header()
+    return response
+
+
+@app.teardown_request
+def finish_request_profile(exc):
+    timings = g.get('request_timings')
+    if timings and profiler.enabled:
+        profiler.end(f"{request.method} {request.path}", time.perf_counter() - timings.started)
+
+
+def _cache_metrics():
+    caches = {
+        'categories': category_cache,
+        'avatars': avatar_cache,
+        'pages': page_cache,
+        'products': product_normalizer,
+        'related': related_index,
+        'thumbnails': thumbnail_store,
+    }
+    if compressor:
+        caches['compressed'] = compressor
+    if catalog_replica is not None:
+        caches['replica'] = catalog_replica
+    if isinstance(app.session_interface, ServerSideSessionInterface):
+        caches['sessions'] = app.session_interface
+    if token_verifier is not None:
+        caches['tokens'] = token_verifier
+    yield ('storefront_cache_hits_total', 'counter', 'Cache lookups served from cache',
+           [({'cache': name}, cache.hits) for name, cache in caches.items()])
+    yield ('storefront_cache_misses_total', 'counter', 'Cache lookups that had to load',
+           [({'cache': name}, cache.misses) for name, cache in caches.items()])
+    yield ('storefront_search_documents', 'gauge', 'Products in the in-memory search index',
+           [({}, len(search_index))])
+    yield ('storefront_searches_total', 'counter', 'Queries answered from the search index',
+           [({}, search_index.searches)])
+    yield ('storefront_upstream_flights_total', 'counter', 'Backend GETs sent on behalf of coalesced callers',
+           [({'client': name}, flights.calls) for name, flights in SINGLE_FLIGHTS.items()])
+    yield ('storefront_upstream_coalesced_total', 'counter', 'GETs answered by an identical call in flight',
+           [({'client': name, 'scope': 'process'}, flights.coalesced) for name, flights in SINGLE_FLIGHTS.items()]
+           + [({'client': name, 'scope': 'host'}, flights.shared.reused)
+              for name, flights in SINGLE_FLIGHTS.items() if getattr(flights, 'shared', None)])
+    yield ('storefront_upstream_dedup_ratio', 'gauge', 'Share of GETs served without their own backend call',
+           [({'client': name}, flights.dedup_ratio) for name, flights in SINGLE_FLIGHTS.items()])
+    if catalog_replica is not None and catalog_replica.ready:
+        yield ('storefront_replica_age_seconds', 'gauge', 'Time since the catalog replica last synced',
+               [({}, time.time() - catalog_replica.synced_at)])
+        yield ('storefront_replica_products', 'gauge', 'Products in the catalog replica',
+               [({}, len(catalog_replica))])
+    yield ('storefront_bulk_import_rows_total', 'counter', 'Rows of admin bulk imports, by outcome',
+           [({'status': status}, count) for status, count in bulk_importer.rows.items()])
+    if api.admission is not None:
+        limits = api.admission.snapshot()
+        yield ('storefront_upstream_concurrency_limit', 'gauge', 'Current adaptive concurrency limit per endpoint',
+               [({'endpoint': endpoint, 'method': method}, limit) for method, endpoint, limit, _, _ in limits])
+        yield ('storefront_upstream_in_flight', 'gauge', 'Backend calls in flight per endpoint',
+               [({'endpoint': endpoint, 'method': method}, in_flight) for method, endpoint, _, in_flight, _ in limits])
+        yield ('storefront_upstream_queued', 'gauge', 'Backend calls waiting for a concurrency slot',
+               [({'endpoint': endpoint, 'method': method}, queued) for method, endpoint, _, _, queued in limits])
+    yield ('storefront_circuit_open', 'gauge', '1 while the backend circuit breaker is open',
+           [({}, int(api.breaker.state == 'open'))])
+    if startup_report and startup_report.ready_seconds is not None:
+        yield ('storefront_startup_seconds', 'gauge', 'Duration of each startup phase of this worker',
+               [({'phase': name}, seconds) for name, seconds in startup_report.phases.items()]
+               + [({'phase': 'ready'}, startup_report.ready_seconds)])
+
+
+metrics.register_collector(_cache_metrics)
+
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """
+    Prometheus-style metrics for this worker process.
+    """
+    token = os.getenv('METRICS_TOKEN')
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        abort(401)
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
+# Rendered catalog pages for anonymous visitors, invalidated by admin writes
+page_cache = PageCache.from_env(os.environ)
+
+# Parses API product dicts into records once per (id, updatedAt)
+product_normalizer = ProductNormalizer(max_items=int(os.getenv('PRODUCT_MEMO_SIZE', 4096)))
+
+# Optional local sqlite copy of the catalog, shared by the workers of this host
+catalog_replica = CatalogReplica.from_env(os.environ, app.instance_path, api) if os.getenv('CATALOG_REPLICA', '0') == '1' else None
+
+
+def _replica():
+    """The catalog replica if it holds a complete snapshot, else None (read from the API)"""
+    if catalog_replica is None:
+        return None
+    if not catalog_replica.ready:
+        catalog_replica.misses += 1
+        return None
+    return catalog_replica
+
+# gzip/brotli for text responses, keeping compressed bodies of hot anonymous pages
+compressor = Compressor.from_env(os.environ) if os.getenv('COMPRESSION', '1') == '1' else None
+
+
+@app.after_request
+def compress_response(response):
+    """Compress text responses (runs before the metrics hook, so sizes are on-the-wire sizes)"""
+    if compressor and request.endpoint != 'built_asset':
+        anonymous = request.method == 'GET' and 'current_user' not in session
+        compressor.apply(request, response, cacheable=anonymous)
+    return response
+
+
+def _page_etag(template, versions):
+    """Strong ETag of a catalog page from the versions of the data it shows"""
+    return data_etag(
+        template,
+        versions,
+        record_versions(g.get('all_categories')),
+        session.get('current_user'),
+        template_fingerprint(app.jinja_env),
+        asset_manifest.version
+    )
+
+
+def _render_page(template, versions, status=200, **context):
+    """Render a catalog page with an ETag, answering If-None-Match with 304 before rendering"""
+    if status != 200:
+        # Not-found pages get no validator, and the page cache only stores 200s
+        return render_template(template, **context), status
+    if '_flashes' in session:
+        # Flashes are shown once, so this exact page will never be served again
+        return render_template(template, **context)
+
+    etag = _page_etag(template, versions)
+    if request.if_none_match.contains_weak(etag):
+        response = make_response('', 304)
+    else:
+        response = make_response(render_template(template, **context))
+    response.set_etag(etag)
+    # Browsers may keep the page but must revalidate it, which the ETag makes cheap
+    response.cache_control.no_cache = True
+    if 'current_user' in session:
+        response.cache_control.private = True
+    return response
+
 
 def _filter_user_for_session(user):
     """Filter user data to only include essential fields for session storage.
@@ -30,47 +351,226 @@ def _filter_user_for_session(user):
         'address': user.get('address'),
         'role': user.get('role'),
         'createdAt': user.get('createdAt'),
-        'hasAvatar': bool(user.get('avatarUrl'))  # Just store flag, not the actual data
+        'hasAvatar': bool(user.get('avatarUrl')),  # Just store flag, not the actual data
+        'avatarVersion': _avatar_version(user.get('avatarUrl'))  # Busts browser cache of /avatar URL
     }
 
 
-def _fetch_categories():
-    """Helper function to fetch categories from API"""
-    try:
-        response = requests.get(f'{API_BASE_URL}/categories')
+def _avatar_version(avatar_url):
+    """Short content hash of an avatar, used as its ETag and cache-busting version"""
+    if not avatar_url:
+        return None
+    return hashlib.sha1(avatar_url.encode('utf-8')).hexdigest()[:16]
+
+
+def _load_categories():
+    """Fetch categories from the replica or API and index them by slug (raises on failure)"""
+    replica = _replica()
+    if replica is not None:
+        categories = replica.categories()
+    else:
+        response = api.get('/categories')
         response.raise_for_status()
         data = response.json()
-        return data.get('categories', [])
+        categories = data.get('categories', [])
+    return categories, {cat['slug']: cat for cat in categories}
+
+
+# Categories rarely change, so keep them in memory and refresh in the background
+category_cache = StaleWhileRevalidate(
+    _load_categories,
+    ttl=float(os.getenv('CATEGORY_CACHE_TTL', 60)),
+    max_stale=float(os.getenv('CATEGORY_CACHE_MAX_STALE', 600)),
+    name='categories'
+)
+
+
+def _fetch_categories():
+    """Helper function to get categories from the cache (loaded from API on miss)"""
+    try:
+        categories, _ = category_cache.get()
+        return categories
     except requests.exceptions.RequestException as e:
         print(f"Could not fetch categories: {e}")
         return []
 
 
+def _find_category_by_slug(slug):
+    """Look up a category by slug using the cached slug index"""
+    try:
+        _, by_slug = category_cache.get()
+        return by_slug.get(slug)
+    except requests.exceptions.RequestException as e:
+        print(f"Could not fetch categories: {e}")
+        return None
+
+
+def _fetch_current_user(token):
+    """The API's user record for `token`, or None if the API rejects it (raises on failure)"""
+    response = api.get('/auth/me', headers={'Authorization': f'Bearer {token}'})
+    if response.status_code in (401, 403):
+        return None
+    response.raise_for_status()
+    return response.json().get('user')
+
+
+# Verifies session tokens with the shared JWT_SECRET instead of calling /auth/me
+token_verifier = TokenVerifier.from_env(
+    os.environ, confirm=lambda token: _filter_user_for_session(_fetch_current_user(token)))
+
+
 def _fetch_user_avatar(token):
     """Fetch current user's avatar from API"""
     if not token:
         return None
     try:
-        headers = {'Authorization': f'Bearer {token}'}
-        response = requests.get(f'{API_BASE_URL}/auth/me', headers=headers)
-        response.raise_for_status()
-        data = response.json()
-        user = data.get('user', {})
+        user = _fetch_current_user(token) or {}
         return user.get('avatarUrl')
     except requests.exceptions.RequestException as e:
         print(f"Could not fetch user avatar: {e}")
         return None
 
 
+# Disk cache of decoded data-URI images and their resized thumbnails
+thumbnail_store = ThumbnailStore(
+    os.getenv('IMAGE_CACHE_DIR', os.path.join(app.instance_path, 'image_cache')),
+    max_bytes=int(os.getenv('IMAGE_CACHE_MAX_BYTES', 512 * 1024 * 1024)),
+    quality=int(os.getenv('IMAGE_THUMB_QUALITY', 80))
+)
+IMAGE_THUMB_FORMAT = os.getenv('IMAGE_THUMB_FORMAT', 'webp')
+
+
+# Stands in for an inline image that is already in the thumbnail store (see thumbnail_key)
+THUMBNAIL_KEY_PREFIX = 'thumb:'
+
+
+def thumbnail_key(image_url):
+    """Compact reference to a data-URI image that thumbnail_url() resolves, for long-lived records"""
+    if image_url and image_url.startswith('data:'):
+        digest = thumbnail_store.register(image_url)
+        if digest:
+            return THUMBNAIL_KEY_PREFIX + digest
+    return image_url
+
+
+@app.template_filter('thumbnail_url')
+def thumbnail_url(image_url, size=400):
+    """Replace an inline data-URI image (or its thumbnail_key) with the URL of a resized thumbnail"""
+    if image_url and image_url.startswith(THUMBNAIL_KEY_PREFIX):
+        digest = image_url[len(THUMBNAIL_KEY_PREFIX):]
+    elif not image_url or not image_url.startswith('data:'):
+        return image_url
+    else:
+        digest = thumbnail_store.register(image_url)
+        if not digest:
+            return image_url
+    bucket = next((bucket for bucket in SIZE_BUCKETS if bucket >= size), SIZE_BUCKETS[-1])
+    return url_for('image_thumbnail', digest=digest, size=bucket, fmt=IMAGE_THUMB_FORMAT)
+
+
+@app.route('/img/<digest>/<int:size>.<fmt>')
+def image_thumbnail(digest, size, fmt):
+    """
+    Serves a size-bucketed thumbnail; URLs are content-addressed so cache forever.
+    The original served in place of a thumbnail Pillow could not create is revalidated instead.
+    """
+    if size not in SIZE_BUCKETS or fmt not in FORMATS or not digest.isalnum():
+        abort(404)
+    result = thumbnail_store.thumbnail(digest, size, fmt)
+    if not result:
+        # Search documents only keep the thumbnail_key; re-fetching the products registers the image again
+        search_index.refresh_image(THUMBNAIL_KEY_PREFIX + digest)
+        abort(404)
+    if not result.immutable:
+        response = send_file(result.path, mimetype=result.mimetype, max_age=0)
+        response.cache_control.no_cache = True
+        return response
+    response = send_file(result.path, mimetype=result.mimetype, max_age=31536000)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
+# Decoded avatars per user id, so the multi-hundred-KB /auth/me payload is fetched once
+avatar_cache = LRUCache(
+    max_items=int(os.getenv('AVATAR_CACHE_SIZE', 256)),
+    max_bytes=int(os.getenv('AVATAR_CACHE_MAX_BYTES', 32 * 1024 * 1024))
+)
+
+
+@app.route('/avatar/<user_id>')
+def avatar(user_id):
+    """
+    Serves the logged-in user's avatar as image bytes with ETag/Cache-Control.
+    """
+    user = session.get('current_user')
+    if not user or user.get('id') != user_id or not user.get('hasAvatar'):
+        abort(404)
+
+    entry = avatar_cache.get(user_id)
+    requested_version = request.args.get('v')
+    if entry is None or (requested_version and entry['version'] != requested_version):
+        avatar_url = _fetch_user_avatar(session.get('user_token'))
+        if not avatar_url:
+            abort(404)
+        if not avatar_url.startswith('data:'):
+            # Avatar hosted elsewhere, let the browser fetch it directly
+            return redirect(avatar_url)
+        decoded = decode_data_uri(avatar_url)
+        if not decoded:
+            abort(404)
+        mimetype, body = decoded
+        entry = {'version': _avatar_version(avatar_url), 'mimetype': mimetype, 'body': body}
+        avatar_cache.set(user_id, entry, size=len(body))
+
+    response = Response(entry['body'], mimetype=entry['mimetype'])
+    response.set_etag(entry['version'])
+    response.cache_control.private = True
+    # Versioned URLs change whenever the avatar does, so they can be cached for long
+    response.cache_control.max_age = 31536000 if requested_version == entry['version'] else 60
+    return response.make_conditional(request)
+
+
+@app.before_request
+def verify_session_token():
+    """Check the session token locally and log out sessions whose token is expired or invalid"""
+    g.token_claims = None
+    if request.endpoint == 'built_asset':
+        return
+    token = session.get('user_token')
+    if token_verifier is None or not token:
+        return
+    try:
+        claims = token_verifier.claims(token)
+    except requests.exceptions.RequestException as e:
+        # Keep the session as it is until the token can be checked
+        print(f"Could not confirm session token: {e}")
+        return
+
+    user = session.get('current_user')
+    if claims is None or (user and user.get('id') != claims.get('userId')):
+        session.clear()
+        flash('Your session has expired, please log in again.', 'warning')
+        return
+    g.token_claims = claims
+    if user and user.get('role') != claims.get('role'):
+        # The backend authorizes with the token's role, so the session copy follows it
+        session['current_user'] = {**user, 'role': claims.get('role')}
+
+
 @app.before_request
 def load_categories():
     """Load categories before each request so they are available in route handlers"""
+    # Fingerprinted assets are the same for everyone; don't touch the session (Vary: Cookie) or the API
+    if request.endpoint == 'built_asset':
+        return
     if 'all_categories' not in g:
         g.all_categories = _fetch_categories()
     
-    # Load user avatar if logged in
-    if 'current_user' in session and session['current_user'].get('hasAvatar'):
-        g.user_avatar = _fetch_user_avatar(session.get('user_token'))
+    # Templates only get the avatar URL; the image itself is served by /avatar/<user_id>
+    user = session.get('current_user')
+    if user and user.get('hasAvatar'):
+        g.user_avatar = url_for('avatar', user_id=user.get('id'), v=user.get('avatarVersion'))
     else:
         g.user_avatar = None
 
@@ -83,97 +583,303 @@ def inject_categories():
         user_avatar=g.get('user_avatar')
     )
 
+FEATURED_PRODUCTS_COUNT = 8
+FEATURED_PRODUCTS_PATH = f"/products?featured=true&pageSize={FEATURED_PRODUCTS_COUNT}"
+
+
+def _fetch_featured_products():
+    """Helper function to fetch featured products for the home page"""
+    replica = _replica()
+    if replica is not None:
+        products, _ = replica.product_page(page_size=FEATURED_PRODUCTS_COUNT, featured=True)
+        return product_normalizer.normalize_many(products)
+    try:
+        response = api.get(FEATURED_PRODUCTS_PATH)
+        response.raise_for_status()
+        return product_normalizer.normalize_many(response.json().get('products', []))
+    except requests.exceptions.RequestException as e:
+        print(f"Error fetching featured products: {e}")
+        return []
+
+
+def _fetch_banners(query=''):
+    """Helper function to fetch banners from the replica (active ones) or API"""
+    replica = _replica()
+    if replica is not None and not query:
+        return replica.banners()
+    try:
+        response = api.get(f"/banners{query}")
+        response.raise_for_status()
+        return response.json().get('banners', [])
+    except requests.exceptions.RequestException as e:
+        print(f"Error fetching banners: {e}")
+        return []
+
+
 @app.route('/')
+@page_cache.cached(tags=('products', 'banners', 'categories'))
 def home():
     """
     Renders the home page with a list of products and banners.
     """
-    products = []
-    banners = []
-    try:
-        # Fetch products from the existing Next.js API
-        products_response = requests.get(f"{API_BASE_URL}/products?featured=true&pageSize=8")
-        products_response.raise_for_status()
-        products_data = products_response.json()
-        products = products_data.get('products', [])
+    # Featured products and banners are independent, fetch them concurrently
+    results = fanout.gather(products=_fetch_featured_products, banners=_fetch_banners)
+    products = results['products'] or []
+    banners = results['banners'] or []
         
-        # Convert price from string to float for each product
-        for product in products:
-            if 'price' in product and isinstance(product['price'], str):
-                try:
-                    product['price'] = float(product['price'])
-                except (ValueError, TypeError):
-                    product['price'] = 0.0
-
-        # Fetch active banners
-        banners_response = requests.get(f"{API_BASE_URL}/banners")
-        banners_response.raise_for_status()
-        banners_data = banners_response.json()
-        banners = banners_data.get('banners', [])
+    return _render_page('index.html', (record_versions(products), record_versions(banners)),
+                        products=products, banners=banners)
 
-    except requests.exceptions.RequestException as e:
-        print(f"Error fetching data: {e}")
-        
-    return render_template('index.html', products=products, banners=banners)
+# Listing pagination: values accepted from the query string and passed to /products
+LISTING_SORT_OPTIONS = ('newest', 'price_asc', 'price_desc', 'name')
+LISTING_PAGE_SIZE = int(os.getenv('LISTING_PAGE_SIZE', 24))
+LISTING_MAX_PAGE_SIZE = int(os.getenv('LISTING_MAX_PAGE_SIZE', 500))
+# Listings with a larger pageSize are streamed, fetching upstream in chunks of this size
+LISTING_STREAM_CHUNK = int(os.getenv('LISTING_STREAM_CHUNK', 48))
 
-@app.route('/category/<slug>')
-def category(slug):
+
+def _listing_params(default_page_size=LISTING_PAGE_SIZE):
+    """Read page/pageSize/sortBy/search from the query string"""
+    page = max(request.args.get('page', 1, type=int) or 1, 1)
+    page_size = request.args.get('pageSize', default_page_size, type=int) or default_page_size
+    page_size = min(max(page_size, 1), LISTING_MAX_PAGE_SIZE)
+    sort_by = request.args.get('sortBy', 'newest')
+    if sort_by not in LISTING_SORT_OPTIONS:
+        sort_by = 'newest'
+    search = (request.args.get('search') or '').strip()
+    return {'page': page, 'pageSize': page_size, 'sortBy': sort_by, 'search': search}
+
+
+# Fingerprinted CSS/JS from `flask build-assets`; templates fall back to the CDN until it has run
+STATIC_ASSETS_DIR = os.getenv('STATIC_ASSETS_DIR') or os.path.join(app.root_path, 'static', 'dist')
+asset_manifest = AssetManifest(STATIC_ASSETS_DIR, auto_reload=app.debug)
+
+
+@app.template_global()
+def asset_url(name):
+    """URL of a built asset such as 'app.css', or None if the assets are not built"""
+    filename = asset_manifest.filename(name)
+    return url_for('built_asset', filename=filename) if filename else None
+
+
+@app.route('/static/dist/<path:filename>')
+def built_asset(filename):
+    """Serve a fingerprinted asset, precompressed if the client accepts it; the name changes with the content"""
+    path, encoding = asset_manifest.variant(filename, request.accept_encodings)
+    response = send_from_directory(
+        STATIC_ASSETS_DIR, path,
+        mimetype=asset_manifest.mimetype(filename),
+        max_age=365 * 24 * 3600,
+        etag=False
+    )
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
+@app.template_global()
+def url_for_page(page):
+    """URL of the current listing with only the page number changed"""
+    args = {**request.args.to_dict(), **request.view_args, 'page': page}
+    return url_for(request.endpoint, **args)
+
+
+def _product_page_query(params, category_slug=None):
+    """Query string for /products from listing params"""
+    query = {key: value for key, value in params.items() if value}
+    if category_slug:
+        query['category'] = category_slug
+    return query
+
+
+def _parse_product_page(data, params):
+    """(products, pagination) from a /products response body"""
+    products = product_normalizer.normalize_many(data.get('products', []))
+
+    total = len(products)
+    pagination = data.get('pagination') or {
+        'page': params['page'], 'pageSize': params['pageSize'], 'total': total, 'totalPages': 1 if total else 0
+    }
+    return products, pagination
+
+
+def _fetch_product_page(params, category_slug=None, live=False):
+    """Fetch one page of products from the replica or API (raises on failure)
+
+    `live` always asks the API, for admin pages that must show writes immediately.
+    """
+    replica = None if live or params.get('search') else _replica()
+    if replica is not None:
+        products, pagination = replica.product_page(params['page'], params['pageSize'], params['sortBy'], category_slug)
+        return product_normalizer.normalize_many(products), pagination
+    response = api.get('/products', params=_product_page_query(params, category_slug))
+    response.raise_for_status()
+    return _parse_product_page(response.json(), params)
+
+
+def _stream_product_pages(params, category_slug=None):
+    """Fetch a long listing lazily in upstream chunks.
+
+    The first chunk is fetched eagerly (so errors and totals are known before
+    rendering starts); the rest are fetched while the template is streaming.
+    Returns (pagination, products iterator).
+    """
+    page_size = params['pageSize']
+    # Fixed-size upstream chunks covering our page's offset range; the first and
+    # last ones are trimmed, so any page size takes at most page_size / chunk + 1 calls
+    chunk = min(LISTING_STREAM_CHUNK, page_size)
+    offset = (params['page'] - 1) * page_size
+    first_upstream_page = offset // chunk + 1
+    chunk_params = dict(params, page=first_upstream_page, pageSize=chunk)
+
+    first_products, upstream_pagination = _fetch_product_page(chunk_params, category_slug)
+    total = upstream_pagination.get('total', len(first_products))
+    pagination = {
+        'page': params['page'], 'pageSize': page_size,
+        'total': total, 'totalPages': -(-total // page_size)
+    }
+
+    def generate():
+        remaining = page_size
+        products = first_products[offset % chunk:]
+        upstream_page = first_upstream_page
+        while True:
+            products = products[:remaining]
+            yield from products
+            remaining -= len(products)
+            upstream_page += 1
+            if remaining <= 0 or (upstream_page - 1) * chunk >= total:
+                return
+            try:
+                products, _ = _fetch_product_page(dict(chunk_params, page=upstream_page), category_slug)
+            except requests.exceptions.RequestException as e:
+                # Headers are already sent, so just end the listing early
+                print(f"Error streaming products page {upstream_page}: {e}")
+                return
+            if not products:
+                return
+
+    return pagination, generate()
+
+
+def _streams_listing(params):
+    """Whether a listing page is rendered with stream_template"""
+    # Flashes are consumed while rendering, which must finish before headers are sent
+    return params['pageSize'] > LISTING_STREAM_CHUNK and '_flashes' not in session
+
+
+def _redirect_past_last_page(params, pagination):
+    """Redirect a ?page= beyond the last page of a listing to the last page, or None"""
+    total_pages = pagination.get('totalPages') or 0
+    if total_pages and params['page'] > total_pages:
+        return redirect(url_for_page(total_pages))
+    return None
+
+
+def _render_listing(params, category_slug, **context):
+    """Render category.html for one page of products, streaming long pages"""
+    if _streams_listing(params):
+        pagination, products = _stream_product_pages(params, category_slug)
+        past_last_page = _redirect_past_last_page(params, pagination)
+        if past_last_page:
+            return past_last_page
+        return stream_template('category.html', products=products, pagination=pagination,
+                               listing_params=params, **context)
+
+    products, pagination = _fetch_product_page(params, category_slug)
+    past_last_page = _redirect_past_last_page(params, pagination)
+    if past_last_page:
+        return past_last_page
+    return _render_page('category.html', (record_versions(products), pagination),
+                        products=products, pagination=pagination, listing_params=params, **context)
+
+
+def _category_page_context(slug):
+    """Template context of /category/<slug> besides the products, or None for an unknown slug"""
     if slug == 'all':
-        try:
-            response = requests.get(f'{API_BASE_URL}/products')
-            response.raise_for_status()
-            data = response.json()
-            products = data.get('products', [])
-            
-            # Convert price from string to float for each product
-            for product in products:
-                if 'price' in product and isinstance(product['price'], str):
-                    try:
-                        product['price'] = float(product['price'])
-                    except (ValueError, TypeError):
-                        product['price'] = 0.0
-            
-            category_name = 'All Products'
-            return render_template('category.html', products=products, category_name=category_name, current_slug=slug, category=None)
-        except requests.exceptions.RequestException as e:
-            print(f"Error fetching all products: {e}")
-            return render_template('category.html', products=[], category_name='Error', error="Could not fetch products.", current_slug=slug, category=None)
-
-    # Find the category object from the globally available list
-    target_category = None
-    if 'all_categories' in g:
-        for cat in g.all_categories:
-            if cat['slug'] == slug:
-                target_category = cat
-                break
-    
+        return {'category_name': 'All Products', 'current_slug': slug, 'category': None}
+
+    # Find the category object from the cached slug index
+    target_category = _find_category_by_slug(slug)
     if not target_category:
-        print(f"Category with slug '{slug}' not found in global list.")
-        return render_template('category.html', products=[], category_name="Category Not Found", error="The category you are looking for does not exist.", current_slug=slug, category=None)
+        return None
+    return {'category_name': target_category['name'], 'current_slug': slug, 'category': target_category}
+
+
+def _render_category_not_found(slug):
+    print(f"Category with slug '{slug}' not found in category index.")
+    return render_template('category.html', products=[], category_name="Category Not Found", error="The category you are looking for does not exist.", current_slug=slug, category=None), 404
+
 
-    # Fetch products for that category using its ID
+def _render_category_error(context, error):
+    target_category = context['category']
+    if not target_category:
+        print(f"Error fetching all products: {error}")
+        return render_template('category.html', products=[], category_name='Error', error="Could not fetch products.", current_slug=context['current_slug'], category=None)
+    print(f"Error fetching products for category id {target_category.get('id')}: {error}")
+    return render_template('category.html', products=[], error="Could not fetch products for this category.", **context)
+
+
+@app.route('/category/<slug>')
+@page_cache.cached(tags=('products', 'categories'))
+def category(slug):
+    params = _listing_params()
+    context = _category_page_context(slug)
+    if context is None:
+        return _render_category_not_found(slug)
+
+    # Fetch products (all, or of that category) through the paginated products endpoint
     try:
-        category_id = target_category['id']
-        response = requests.get(f'{API_BASE_URL}/products/category/{category_id}')
-        response.raise_for_status()
-        data = response.json()
-        products = data.get('products', [])
-        
-        # Convert price from string to float for each product
-        for product in products:
-            if 'price' in product and isinstance(product['price'], str):
-                try:
-                    product['price'] = float(product['price'])
-                except (ValueError, TypeError):
-                    product['price'] = 0.0
-        
-        return render_template('category.html', products=products, category_name=target_category['name'], current_slug=slug, category=target_category)
+        return _render_listing(params, context['category'] and slug, **context)
     except requests.exceptions.RequestException as e:
-        print(f"Error fetching products for category id {target_category.get('id')}: {e}")
-        return render_template('category.html', products=[], category_name=target_category['name'], error="Could not fetch products for this category.", current_slug=slug, category=target_category)
+        return _render_category_error(context, e)
+
+
+def _fetch_product(product_id, live=False):
+    """A single product, or None if it does not exist (raises on failure)"""
+    replica = None if live else _replica()
+    if replica is not None:
+        data = replica.product(product_id)
+        if data:
+            return product_normalizer.normalize(data)
+        # Not in the snapshot (yet), e.g. created since the last sync
+    response = api.get(f"/products/{product_id}")
+    if response.status_code == 404:
+        return None
+    response.raise_for_status()
+    return product_normalizer.normalize(response.json().get('product'))
+
+
+RELATED_CANDIDATES = int(os.getenv('RELATED_CANDIDATES', 100))
+
+
+def _load_related_candidates(category_slug):
+    """Fetch a bounded list of products in a category for related-product scoring"""
+    params = {'page': 1, 'pageSize': RELATED_CANDIDATES, 'sortBy': 'newest', 'search': ''}
+    products, _ = _fetch_product_page(params, category_slug)
+    return products
+
+
+related_index = RelatedProductsIndex(
+    _load_related_candidates,
+    limit=int(os.getenv('RELATED_LIMIT', 4)),
+    ttl=float(os.getenv('RELATED_CACHE_TTL', 300)),
+    max_stale=float(os.getenv('RELATED_CACHE_MAX_STALE', 1800))
+)
+
+
+def _product_page_status(product):
+    """404 for a product the API does not have, so any id cannot fill the page cache"""
+    if product is None and not g.get('upstream_failed'):
+        return 404
+    return 200
 
 
 @app.route('/product/<product_id>')
+@page_cache.cached(tags=('products', 'categories'))
 def product_detail(product_id):
     """
     Renders the product detail page for a single product.
@@ -181,43 +887,142 @@ def product_detail(product_id):
     product = None
     related_products = []
     try:
-        response = requests.get(f"{API_BASE_URL}/products/{product_id}")
-        response.raise_for_status()
-        product_data = response.json()
-        product = product_data.get('product')
-
-        # Convert price to float
-        if product and 'price' in product and isinstance(product['price'], str):
-            try:
-                product['price'] = float(product['price'])
-            except (ValueError, TypeError):
-                product['price'] = 0.0
+        product = _fetch_product(product_id)
         
-        # Fetch related products from the same category
-        if product and product.get('category'):
+        # Pick related products from the cached, bounded candidate list of its category
+        if product:
             try:
-                category_id = product['category'].get('id')
-                if category_id:
-                    rel_response = requests.get(f"{API_BASE_URL}/products/category/{category_id}")
-                    if rel_response.status_code == 200:
-                        rel_data = rel_response.json()
-                        all_related = rel_data.get('products', [])
-                        # Filter out current product and convert prices
-                        for p in all_related:
-                            if p.get('id') != product_id:
-                                if 'price' in p and isinstance(p['price'], str):
-                                    try:
-                                        p['price'] = float(p['price'])
-                                    except (ValueError, TypeError):
-                                        p['price'] = 0.0
-                                related_products.append(p)
+                related_products = related_index.for_product(product)
             except requests.exceptions.RequestException as e:
                 print(f"Error fetching related products: {e}")
 
     except requests.exceptions.RequestException as e:
         print(f"Error fetching product {product_id}: {e}")
         
-    return render_template('product_detail.html', product=product, related_products=related_products)
+    return _render_page('product_detail.html', (record_versions([product] if product else []),
+                                                record_versions(related_products)),
+                        status=_product_page_status(product),
+                        product=product, related_products=related_products)
+
+
+# --------------------- Search ---------------------
+
+def _load_search_page(page, page_size, updated_since=None):
+    """One page of the catalog, or of the products updated since a time, for the search index"""
+    if updated_since:
+        # The replica has no updatedSince filter; these pages are small
+        params = {'page': page, 'pageSize': page_size, 'sortBy': 'updated', 'search': '', 'updatedSince': updated_since}
+        products, pagination = _fetch_product_page(params, live=True)
+    else:
+        params = {'page': page, 'pageSize': page_size, 'sortBy': 'newest', 'search': ''}
+        products, pagination = _fetch_product_page(params)
+    return products, pagination.get('totalPages', 1)
+
+
+search_index = SearchIndex(
+    _load_search_page,
+    # Called right after admin writes, before the replica has synced them
+    lambda product_id: _fetch_product(product_id, live=True),
+    ttl=float(os.getenv('SEARCH_INDEX_TTL', 300)),
+    page_size=int(os.getenv('SEARCH_SYNC_PAGE_SIZE', 200)),
+    full_sync_interval=float(os.getenv('SEARCH_FULL_SYNC_INTERVAL', 3600)),
+    image_key=thumbnail_key
+)
+SEARCH_SORT_OPTIONS = ('relevance',) + LISTING_SORT_OPTIONS
+SEARCH_SUGGEST_LIMIT = int(os.getenv('SEARCH_SUGGEST_LIMIT', 6))
+
+
+def _search_params():
+    """Read q/category/minPrice/maxPrice/featured/sortBy/page/pageSize from the query string"""
+    params = _listing_params()
+    if request.args.get('sortBy') not in SEARCH_SORT_OPTIONS:
+        params['sortBy'] = 'relevance'
+    params['q'] = (request.args.get('q') or '').strip()
+    params['category'] = request.args.get('category') or ''
+    params['minPrice'] = request.args.get('minPrice', type=float)
+    params['maxPrice'] = request.args.get('maxPrice', type=float)
+    params['featured'] = request.args.get('featured') == 'true'
+    return params
+
+
+def _run_search(params, offset, limit):
+    """(products, total) from the search index, building it on first use (raises on failure)"""
+    search_index.ensure_fresh()
+    return search_index.search(
+        params['q'],
+        category=params['category'] or None,
+        min_price=params['minPrice'],
+        max_price=params['maxPrice'],
+        featured=True if params['featured'] else None,
+        sort_by=params['sortBy'],
+        offset=offset,
+        limit=limit
+    )
+
+
+@app.route('/search')
+def search():
+    """
+    Renders search results from the in-memory product index.
+    """
+    params = _search_params()
+    try:
+        products, total = _run_search(params, (params['page'] - 1) * params['pageSize'], params['pageSize'])
+    except requests.exceptions.RequestException as e:
+        print(f"Error building the search index: {e}")
+        return render_template('search.html', products=[], pagination=None, search_params=params,
+                               sort_options=SEARCH_SORT_OPTIONS, error="Search is temporarily unavailable.")
+
+    pagination = {
+        'page': params['page'], 'pageSize': params['pageSize'],
+        'total': total, 'totalPages': -(-total // params['pageSize'])
+    }
+    past_last_page = _redirect_past_last_page(params, pagination)
+    if past_last_page:
+        return past_last_page
+    return _render_page('search.html', (record_versions(products), pagination),
+                        products=products, pagination=pagination, search_params=params,
+                        sort_options=SEARCH_SORT_OPTIONS)
+
+
+@app.route('/search/suggest')
+def search_suggest():
+    """
+    JSON typeahead for the topbar search box: top products and matching categories.
+    """
+    params = _search_params()
+    suggestions = {'query': params['q'], 'products': [], 'categories': [], 'total': 0}
+    if not params['q']:
+        return jsonify(suggestions)
+    try:
+        products, total = _run_search(dict(params, sortBy='relevance'), 0, SEARCH_SUGGEST_LIMIT)
+    except requests.exceptions.RequestException as e:
+        print(f"Error building the search index: {e}")
+        return jsonify(suggestions), 503
+
+    words = tokenize(params['q'])
+    suggestions['total'] = total
+    suggestions['products'] = [{
+        'id': product.id,
+        'name': product.name,
+        'price': effective_price(product),
+        'imageUrl': thumbnail_url(product.imageUrl, 160),
+        'url': url_for('product_detail', product_id=product.id),
+    } for product in products]
+    for category in g.get('all_categories', []):
+        names = tokenize(category.get('name'))
+        if all(any(name.startswith(word) for name in names) for word in words):
+            suggestions['categories'].append({
+                'name': category.get('name'),
+                'url': url_for('category', slug=category.get('slug')),
+            })
+
+    response = jsonify(suggestions)
+    response.set_etag(data_etag(params['q'], record_versions(products), suggestions['categories'], total))
+    # Typing the same prefix again (or backspacing to it) is answered by the browser cache
+    response.cache_control.public = True
+    response.cache_control.max_age = 60
+    return response.make_conditional(request)
 
 @app.route('/login', methods=['GET', 'POST'])
 def login():
@@ -229,10 +1034,13 @@ def login():
         password = request.form.get('password')
         
         try:
-            response = requests.post(f"{API_BASE_URL}/auth/login", json={'email': email, 'password': password})
+            response = api.post("/auth/login", json={'email': email, 'password': password})
             
             if response.status_code == 200:
                 data = response.json()
+                if isinstance(session, ServerSideSession):
+                    # New session id on login, so a planted id cannot be reused
+                    session.regenerate()
                 session['user_token'] = data.get('token')
                 session['current_user'] = _filter_user_for_session(data.get('user'))
                 flash('Login successful!', 'success')
@@ -286,14 +1094,16 @@ def edit_profile():
         try:
             token = session.get('user_token')
             headers = {'Authorization': f'Bearer {token}'}
-            response = requests.put(
-                f"{API_BASE_URL}/auth/update-profile",
+            response = api.put(
+                "/auth/update-profile",
                 json=payload,
                 headers=headers
             )
             
             if response.status_code == 200:
                 data = response.json()
+                # Drop the cached avatar so /avatar serves the new one
+                avatar_cache.pop(session['current_user'].get('id'))
                 # Update session with new user data (filtered to exclude large avatarUrl)
                 session['current_user'] = _filter_user_for_session(data.get('user'))
                 flash('Profile updated successfully!', 'success')
@@ -313,6 +1123,8 @@ def logout():
     """
     Logs the user out by clearing the session.
     """
+    if token_verifier is not None and session.get('user_token'):
+        token_verifier.forget(session['user_token'])
     session.clear()
     flash('You have been logged out.', 'info')
     return redirect(url_for('home'))
@@ -327,14 +1139,11 @@ def refresh_session():
         flash('Please login first', 'error')
         return redirect(url_for('login'))
     
+    token = session['user_token']
     try:
-        headers = {'Authorization': f'Bearer {session["user_token"]}'}
-        response = requests.get(f'{API_BASE_URL}/auth/me', headers=headers)
-        response.raise_for_status()
-        data = response.json()
-        user = data.get('user')
+        user = _filter_user_for_session(_fetch_current_user(token))
         if user:
-            session['current_user'] = _filter_user_for_session(user)
+            session['current_user'] = user
             flash(f'Session refreshed! Role: {user.get("role")}', 'success')
         else:
             flash('Could not get user data', 'error')
@@ -364,7 +1173,7 @@ def register():
         }
 
         try:
-            response = requests.post(f"{API_BASE_URL}/auth/register", json=payload)
+            response = api.post("/auth/register", json=payload)
             
             if response.status_code == 201:
                 flash('Registration successful! Please log in.', 'success')
@@ -383,6 +1192,14 @@ def register():
     return render_template('register.html')
 
 
+def _is_admin(user):
+    """Role check against the verified token claims, else the role stored at login"""
+    if not user:
+        return False
+    claims = g.get('token_claims')
+    return (claims.get('role') if claims else user.get('role')) == 'ADMIN'
+
+
 def admin_required(f):
     """Decorator to require admin access for a route"""
     from functools import wraps
@@ -392,7 +1209,7 @@ def admin_required(f):
         if not user:
             flash('Please login to access admin area', 'error')
             return redirect(url_for('login'))
-        if user.get('role') != 'ADMIN':
+        if not _is_admin(user):
             flash('You do not have permission to access admin area', 'error')
             return redirect(url_for('home'))
         return f(*args, **kwargs)
@@ -413,33 +1230,23 @@ def admin_products():
     """
     Renders the admin products management page.
     """
-    products = []
-    categories = []
-    try:
-        # Fetch all products from the API
-        products_response = requests.get(f"{API_BASE_URL}/products?pageSize=100") # Fetch more products for admin view
-        products_response.raise_for_status()
-        products_data = products_response.json()
-        products = products_data.get('products', [])
-        
-        # Convert price from string to float for each product
-        for product in products:
-            if 'price' in product and isinstance(product['price'], str):
-                try:
-                    product['price'] = float(product['price'])
-                except (ValueError, TypeError):
-                    product['price'] = 0.0
-        
+    # Page through products using page/pageSize/sortBy/search from the query string
+    params = _listing_params(default_page_size=100)
+
+    def fetch_products():
+        return _fetch_product_page(params, live=True)
+
+    def fetch_categories():
         # Fetch categories for the dropdown
-        categories_response = requests.get(f"{API_BASE_URL}/categories")
-        categories_response.raise_for_status()
-        categories_data = categories_response.json()
-        categories = categories_data.get('categories', [])
+        response = api.get("/categories")
+        response.raise_for_status()
+        return response.json().get('categories', [])
 
-    except requests.exceptions.RequestException as e:
-        print(f"Error fetching products for admin: {e}")
+    results = fanout.gather(products=fetch_products, categories=fetch_categories)
+    products, pagination = results['products'] or ([], None)
+    categories = results['categories'] or []
         
-    return render_template('admin_products.html', products=products, categories=categories)
+    return render_template('admin_products.html', products=products, categories=categories, pagination=pagination)
 
 @app.route('/admin/categories')
 @admin_required
@@ -450,7 +1257,7 @@ def admin_categories():
     categories = []
     try:
         # Fetch all categories from the API
-        categories_response = requests.get(f"{API_BASE_URL}/categories")
+        categories_response = api.get("/categories")
         categories_response.raise_for_status()
         categories_data = categories_response.json()
         categories = categories_data.get('categories', [])
@@ -470,7 +1277,7 @@ def admin_users():
     try:
         # Fetch all users from the API (requires auth)
         headers = _get_auth_headers()
-        users_response = requests.get(f"{API_BASE_URL}/users", headers=headers)
+        users_response = api.get("/users", headers=headers)
         users_response.raise_for_status()
         users_data = users_response.json()
         users = users_data.get('users', [])
@@ -487,16 +1294,8 @@ def admin_banners():
     """
     Renders the admin banners management page.
     """
-    banners = []
-    try:
-        # Fetch all banners from the API
-        banners_response = requests.get(f"{API_BASE_URL}/banners?all=true")
-        banners_response.raise_for_status()
-        banners_data = banners_response.json()
-        banners = banners_data.get('banners', [])
-
-    except requests.exceptions.RequestException as e:
-        print(f"Error fetching banners for admin: {e}")
+    # Fetch all banners (including inactive ones) from the API
+    banners = _fetch_banners("?all=true")
         
     return render_template('admin_banners.html', banners=banners)
 
@@ -511,73 +1310,242 @@ def _get_auth_headers():
     return {'Content-Type': 'application/json'}
 
 
-@app.route('/api/admin/categories', methods=['POST'])
-@app.route('/api/admin/categories/<category_id>', methods=['PUT', 'DELETE'])
-def admin_api_categories(category_id=None):
-    """API proxy for admin category CRUD operations"""
-    headers = _get_auth_headers()
-    try:
-        if request.method == 'POST':
-            response = requests.post(f"{API_BASE_URL}/categories", json=request.json, headers=headers)
-        elif request.method == 'PUT':
-            response = requests.put(f"{API_BASE_URL}/categories/{category_id}", json=request.json, headers=headers)
-        elif request.method == 'DELETE':
-            response = requests.delete(f"{API_BASE_URL}/categories/{category_id}", headers=headers)
-        
-        return jsonify(response.json()), response.status_code
-    except requests.exceptions.RequestException as e:
-        return jsonify({'error': str(e)}), 500
+def _invalidate_after_admin_write(resource, item_id=None):
+    """Drop cached data made stale by a successful admin write to `resource`"""
+    if resource == 'categories':
+        category_cache.invalidate()
+        # Category names/slugs appear in the topbar and on product pages
+        page_cache.invalidate('categories', 'products')
+        related_index.invalidate()
+        # Products embed their category, which a rename does not version
+        product_normalizer.clear()
+        # Category names are indexed with each product
+        search_index.refresh(full=True)
+    elif resource == 'products':
+        page_cache.invalidate('products')
+        related_index.invalidate()
+        if request.method == 'DELETE':
+            search_index.remove(item_id)
+        elif item_id:
+            search_index.refresh_product_in_background(item_id)
+        else:
+            # The new product's id is only in the (streamed) response body
+            search_index.refresh()
+    elif resource == 'banners':
+        page_cache.invalidate('banners')
 
+    if catalog_replica is not None and resource in ('categories', 'products', 'banners'):
+        if request.method == 'DELETE':
+            catalog_replica.delete(resource, item_id)
+        # Pull the change into the snapshot now; its sync drops the caches again once it has
+        catalog_replica.sync_soon()
 
-@app.route('/api/admin/products', methods=['POST'])
-@app.route('/api/admin/products/<product_id>', methods=['PUT', 'DELETE'])
-def admin_api_products(product_id=None):
-    """API proxy for admin product CRUD operations"""
+
+def _invalidate_after_replica_sync(kinds):
+    """Drop in-memory caches built from an older catalog replica snapshot"""
+    category_cache.invalidate()
+    page_cache.invalidate(*kinds)
+    related_index.invalidate()
+    if 'categories' in kinds:
+        product_normalizer.clear()
+    search_index.refresh(full='categories' in kinds)
+
+
+# Admin API proxy routing table: resource -> (methods allowed on /api/admin/<resource>,
+# methods allowed on /api/admin/<resource>/<id>), forwarded to the same path under API_BASE_URL
+ADMIN_API_ROUTES = {
+    'categories': (('POST',), ('PUT', 'DELETE')),
+    'products': (('POST',), ('PUT', 'DELETE')),
+    'banners': (('POST',), ('PUT', 'DELETE')),
+    'users': ((), ('PUT', 'DELETE')),
+}
+ADMIN_API_RESOURCES = ', '.join(ADMIN_API_ROUTES)
+# Product/banner payloads carry base64 images, so bodies are relayed in chunks of this size
+PROXY_CHUNK_SIZE = 64 * 1024
+
+
+def _admin_api_path(resource, item_id=None):
+    """Upstream API path for an admin proxy call (aborts if the method is not routed)"""
+    collection_methods, item_methods = ADMIN_API_ROUTES[resource]
+    if request.method not in (item_methods if item_id else collection_methods):
+        abort(405)
+    return f"/{resource}/{item_id}" if item_id else f"/{resource}"
+
+
+def _admin_api_request_headers():
+    """Session token plus the client's own body headers"""
     headers = _get_auth_headers()
+    if request.content_type:
+        headers['Content-Type'] = request.content_type
+    if request.content_length is not None:
+        headers['Content-Length'] = str(request.content_length)
+    return headers
+
+
+def _relay_upstream_body(upstream):
+    """Yield the upstream body as received (still encoded), closing the connection at the end"""
     try:
-        if request.method == 'POST':
-            response = requests.post(f"{API_BASE_URL}/products", json=request.json, headers=headers)
-        elif request.method == 'PUT':
-            response = requests.put(f"{API_BASE_URL}/products/{product_id}", json=request.json, headers=headers)
-        elif request.method == 'DELETE':
-            response = requests.delete(f"{API_BASE_URL}/products/{product_id}", headers=headers)
-        
-        return jsonify(response.json()), response.status_code
-    except requests.exceptions.RequestException as e:
-        return jsonify({'error': str(e)}), 500
+        yield from upstream.raw.stream(PROXY_CHUNK_SIZE, decode_content=False)
+    except (requests.exceptions.RequestException, urllib3.exceptions.HTTPError) as e:
+        # Status and headers are already sent, so the client just sees a truncated body
+        print(f"Error relaying API response for {upstream.url}: {e}")
+    finally:
+        upstream.close()
 
 
-@app.route('/api/admin/banners', methods=['POST'])
-@app.route('/api/admin/banners/<banner_id>', methods=['PUT', 'DELETE'])
-def admin_api_banners(banner_id=None):
-    """API proxy for admin banner CRUD operations"""
-    headers = _get_auth_headers()
+@app.route(f'/api/admin/<any({ADMIN_API_RESOURCES}):resource>', methods=['POST'])
+@app.route(f'/api/admin/<any({ADMIN_API_RESOURCES}):resource>/<item_id>', methods=['PUT', 'DELETE'])
+def admin_api_proxy(resource, item_id=None):
+    """API proxy for admin CRUD operations.
+
+    Request and response bodies are streamed through unchanged, so multi-MB
+    image payloads are never parsed or re-serialized here.
+    """
+    path = _admin_api_path(resource, item_id)
+    body = SizedStream(request.stream, request.content_length) if request.content_length else None
     try:
-        if request.method == 'POST':
-            response = requests.post(f"{API_BASE_URL}/banners", json=request.json, headers=headers)
-        elif request.method == 'PUT':
-            response = requests.put(f"{API_BASE_URL}/banners/{banner_id}", json=request.json, headers=headers)
-        elif request.method == 'DELETE':
-            response = requests.delete(f"{API_BASE_URL}/banners/{banner_id}", headers=headers)
-        
-        return jsonify(response.json()), response.status_code
+        upstream = api.request(request.method, path, data=body, headers=_admin_api_request_headers(), stream=True)
     except requests.exceptions.RequestException as e:
         return jsonify({'error': str(e)}), 500
 
+    if upstream.status_code < 400:
+        _invalidate_after_admin_write(resource, item_id)
+    return Response(_relay_upstream_body(upstream), status=upstream.status_code,
+                    headers=proxy_headers(upstream.headers))
+
+
+# Bulk product import: streamed CSV/NDJSON in, batched parallel writes to the API out
+bulk_importer = BulkImporter.from_env(os.environ, app.instance_path, api)
+# Import uploads may be far larger than MAX_CONTENT_LENGTH; they are parsed as a stream
+BULK_IMPORT_MAX_BYTES = int(os.getenv('BULK_IMPORT_MAX_BYTES', 1024 * 1024 * 1024))
+
+
+def _detach_upload(upload):
+    """Take over an uploaded file, which Flask closes as soon as the view returns"""
+    stream = upload.stream
+    upload.stream = io.BytesIO()
+    return stream
+
+
+def _import_upload():
+    """(uploaded rows file or None for a raw CSV/NDJSON body, format) of an import request"""
+    if request.mimetype == 'multipart/form-data':
+        # Werkzeug spools large parts to temporary files rather than keeping them in memory
+        upload = request.files.get('file')
+        if upload is None:
+            abort(400, "Upload the rows as the 'file' field")
+        return upload, import_format(upload.filename, upload.mimetype)
+    return None, import_format(mimetype=request.mimetype)
+
+
+@app.route('/api/admin/products/import', methods=['POST'])
+def admin_import_products():
+    """Create/update products from a CSV or NDJSON upload (see bulk_import.py).
+
+    Responds with NDJSON: one line per row as it is written, then a summary.
+    Send the same `X-Import-Id` (or `importId`) again to resume an interrupted import.
+    """
+    user = session.get('current_user')
+    if not _is_admin(user):
+        return jsonify({'error': 'Admin access required'}), 403
+    # Per-request limit (Flask 3.1+, see requirements.txt)
+    request.max_content_length = BULK_IMPORT_MAX_BYTES
+
+    import_id = request.headers.get('X-Import-Id') or request.args.get('importId') or secrets.token_hex(8)
+    if not IMPORT_ID.match(import_id):
+        return jsonify({'error': 'Import ids may only contain letters, digits, _ and -'}), 400
+    upload, upload_format = _import_upload()
+    upload_format = request.args.get('format') or upload_format
+    if upload_format not in PARSERS:
+        return jsonify({'error': 'Upload a .csv or .ndjson file (or pass ?format=csv|ndjson)'}), 415
+    key = f"{user.get('id')}:{import_id}"
+    try:
+        lock_file = bulk_importer.checkpoints.lock(key)
+    except ImportInProgress:
+        return jsonify({'error': f"Import {import_id} is already running"}), 409
 
-@app.route('/api/admin/users/<user_id>', methods=['PUT', 'DELETE'])
-def admin_api_users(user_id):
-    """API proxy for admin user CRUD operations"""
+    if upload is None:
+        stream, images, files = request.stream, {}, []
+    else:
+        stream = _detach_upload(upload)
+        images = {os.path.basename(image.filename): _detach_upload(image)
+                  for image in request.files.getlist('images') if image.filename}
+        files = [stream, *images.values()]
+    bulk_importer.checkpoints.prune()
+    categories = _fetch_categories()
     headers = _get_auth_headers()
+
+    def on_batch():
+        # Storefront caches catch up batch by batch rather than only at the end
+        _invalidate_after_admin_write('products')
+
+    def events():
+        try:
+            yield json.dumps({'importId': import_id}) + '\n'
+            for event in bulk_importer.run(key, PARSERS[upload_format](stream), headers, categories,
+                                           images=images, on_batch=on_batch):
+                yield json.dumps(event, ensure_ascii=False) + '\n'
+        finally:
+            lock_file.close()
+            for file in files:
+                file.close()
+
+    response = Response(stream_with_context(events()), mimetype='application/x-ndjson')
+    response.headers['X-Import-Id'] = import_id
+    # Progress lines must reach the client as they are written
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
+# --------------------- Startup ---------------------
+
+@app.cli.command('compile-templates')
+def compile_templates_command():
+    """Compile all templates into the bytecode cache (e.g. while building an image)."""
+    if 'bytecode_cache' not in app.jinja_options:
+        print("TEMPLATE_BYTECODE_CACHE is disabled, nothing to write")
+        return
+    count = compile_templates(app.jinja_env)
+    print(f"Compiled {count} templates into {TEMPLATE_BYTECODE_CACHE_DIR}")
+
+
+@app.cli.command('clear-page-cache')
+def clear_page_cache_command():
+    """Drop all cached pages, e.g. after a deploy changed templates (PAGE_CACHE_BACKEND=redis)."""
+    if not page_cache.enabled:
+        print("PAGE_CACHE_BACKEND=none, nothing to clear")
+        return
+    page_cache.clear()
+    print("Page cache cleared")
+
+
+@app.cli.command('build-assets')
+def build_assets_command():
+    """Build the Tailwind CSS bundle and vendored JS into fingerprinted, precompressed files."""
+    tailwind_bin = os.getenv('TAILWIND_BIN')
     try:
-        if request.method == 'PUT':
-            response = requests.put(f"{API_BASE_URL}/users/{user_id}", json=request.json, headers=headers)
-        elif request.method == 'DELETE':
-            response = requests.delete(f"{API_BASE_URL}/users/{user_id}", headers=headers)
-        
-        return jsonify(response.json()), response.status_code
-    except requests.exceptions.RequestException as e:
-        return jsonify({'error': str(e)}), 500
+        manifest = build_assets(STATIC_ASSETS_DIR, tailwind_command=tailwind_bin.split() if tailwind_bin else None)
+    except AssetBuildError as e:
+        raise SystemExit(f"Asset build failed: {e}")
+    for name, filename in manifest['files'].items():
+        print(f"{name} -> {filename}")
+    print(f"Wrote {len(manifest['files'])} assets to {STATIC_ASSETS_DIR} (version {manifest['version']})")
+
+
+# Each worker runs a replica sync thread; a lock file lets one of them sync at a time
+if catalog_replica is not None:
+    catalog_replica.on_change = _invalidate_after_replica_sync
+    catalog_replica.start()
+
+# Fast startup: gunicorn/uvicorn workers import this module before accepting
+# connections, so templates are compiled and caches primed before the first request
+startup_report = None
+if os.getenv('STARTUP_WARMUP', '0') == '1':
+    startup_report = warm_up(
+        app,
+        paths=[path.strip() for path in os.getenv('WARMUP_PATHS', '/,/category/all').split(',') if path.strip()],
+        started=STARTED_AT
+    )
 
 
 if __name__ == '__main__':
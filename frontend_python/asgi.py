@@ -0,0 +1,486 @@
+"""
+Async (ASGI) serving mode for the storefront.
+
+    uvicorn asgi:application --port 5001 --workers 4
+
+The catalog pages (home, category, product detail) and the admin API
+proxies run as coroutines on the event loop and call the backend through
+the pooled `AsyncBackendClient`, so a page waiting on the API holds no
+thread and one process can keep thousands of page loads in flight. Every
+other route is the unchanged Flask view, run in a bounded thread pool.
+With the catalog replica (CATALOG_REPLICA=1) holding a snapshot, the
+catalog pages need no network I/O and are served by their sync views.
+Request bodies of sync views are read into memory first, up to
+MAX_CONTENT_LENGTH. Bulk product imports are the exception: an async view
+rejects non-admins before any of the upload is read, then the sync view
+parses the body as it arrives (see `BlockingBody`).
+
+The async views go through Flask's own request handling: each request
+pushes a normal request context, runs the before_request hooks, the page
+cache of the matching Flask view and `finalize_request` (metrics, session
+cookie), so templates, flashes and caching behave as in sync mode. Those
+steps and the template rendering may block (session and category loads
+through the sync client, Redis, thumbnail and session files), so they run
+in threads with `asyncio.to_thread`; only the views' own backend calls
+stay on the event loop.
+
+The sync mode (`python app.py`, any WSGI server) is unaffected; this module
+is only imported when serving through ASGI and needs the optional 'httpx'
+and 'uvicorn' packages.
+"""
+import asyncio
+import io
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from flask import request, session, jsonify, Response
+from werkzeug.exceptions import HTTPException, RequestEntityTooLarge
+
+import app as storefront
+from api_client import proxy_headers
+from http_cache import record_versions
+from singleflight import AsyncSingleFlight
+from async_client import AsyncBackendClient, raise_for_status, httpx
+
+# Returned by an async view to hand the request to its sync Flask view instead
+SYNC_FALLBACK = object()
+
+api = AsyncBackendClient.from_env(storefront.API_BASE_URL, os.environ, breaker=storefront.api.breaker,
+                                   admission=storefront.api.admission)
+api.observers.extend(storefront.api.observers)
+api.coalesced_observers.extend(storefront.api.coalesced_observers)
+if storefront.api.single_flight:
+    api.single_flight = AsyncSingleFlight()
+    storefront.SINGLE_FLIGHTS['async'] = api.single_flight
+
+# Async views by Flask endpoint name; the URL rules stay defined in app.py
+ASYNC_VIEWS = {}
+
+
+def async_view(endpoint):
+    def decorator(f):
+        ASYNC_VIEWS[endpoint] = f
+        return f
+    return decorator
+
+
+# --------------------- Async views ---------------------
+
+async def _get_json(path, **kwargs):
+    response = await api.get(path, **kwargs)
+    raise_for_status(response)
+    return response.json()
+
+
+def _reads_replica():
+    """Whether the catalog pages read the local catalog replica, which needs no network I/O"""
+    return storefront.catalog_replica is not None and storefront.catalog_replica.ready
+
+
+@async_view('home')
+async def home():
+    """
+    Renders the home page, fetching featured products and banners concurrently.
+    """
+    if _reads_replica():
+        return SYNC_FALLBACK
+    products_data, banners_data = await asyncio.gather(
+        _get_json(storefront.FEATURED_PRODUCTS_PATH), _get_json('/banners'), return_exceptions=True)
+
+    products = []
+    if isinstance(products_data, Exception):
+        print(f"Error fetching featured products: {products_data}")
+    else:
+        products = storefront.product_normalizer.normalize_many(products_data.get('products', []))
+    banners = []
+    if isinstance(banners_data, Exception):
+        print(f"Error fetching banners: {banners_data}")
+    else:
+        banners = banners_data.get('banners', [])
+
+    return await asyncio.to_thread(storefront._render_page, 'index.html',
+                                   (record_versions(products), record_versions(banners)),
+                                   products=products, banners=banners)
+
+
+@async_view('category')
+async def category(slug):
+    """
+    Renders one page of a category listing (long, streamed pages use the sync view).
+    """
+    params = storefront._listing_params()
+    if storefront._streams_listing(params) or _reads_replica():
+        return SYNC_FALLBACK
+    # The category index is cached, but a miss loads it with the sync client
+    context = await asyncio.to_thread(storefront._category_page_context, slug)
+    if context is None:
+        return await asyncio.to_thread(storefront._render_category_not_found, slug)
+
+    try:
+        query = storefront._product_page_query(params, context['category'] and slug)
+        products, pagination = storefront._parse_product_page(await _get_json('/products', params=query), params)
+    except requests.exceptions.RequestException as e:
+        return await asyncio.to_thread(storefront._render_category_error, context, e)
+    past_last_page = storefront._redirect_past_last_page(params, pagination)
+    if past_last_page:
+        return past_last_page
+    return await asyncio.to_thread(storefront._render_page, 'category.html', (record_versions(products), pagination),
+                                   products=products, pagination=pagination, listing_params=params, **context)
+
+
+@async_view('product_detail')
+async def product_detail(product_id):
+    """
+    Renders the product detail page for a single product.
+    """
+    if _reads_replica():
+        return SYNC_FALLBACK
+    product = None
+    related_products = []
+    try:
+        product_data = await _get_json(f"/products/{product_id}")
+        product = storefront.product_normalizer.normalize(product_data.get('product'))
+
+        # The related index is cached and only blocks on the first load of a category
+        if product:
+            try:
+                related_products = await asyncio.to_thread(storefront.related_index.for_product, product)
+            except requests.exceptions.RequestException as e:
+                print(f"Error fetching related products: {e}")
+
+    except requests.exceptions.RequestException as e:
+        print(f"Error fetching product {product_id}: {e}")
+
+    return await asyncio.to_thread(storefront._render_page, 'product_detail.html',
+                                   (record_versions([product] if product else []), record_versions(related_products)),
+                                   status=storefront._product_page_status(product),
+                                   product=product, related_products=related_products)
+
+
+def streams_request_body(view):
+    """Mark an async view that reads the request body itself from `request.environ['asgi.body']`"""
+    view.streams_request_body = True
+    return view
+
+
+@async_view('admin_api_proxy')
+@streams_request_body
+async def admin_api_proxy(resource, item_id=None):
+    """
+    Streams an admin write through to the API, like the sync admin_api_proxy.
+    """
+    path = storefront._admin_api_path(resource, item_id)
+    body = request.environ['asgi.body'] if request.content_length else None
+    try:
+        upstream = await api.request(request.method, path, stream=True, content=body,
+                                     headers=storefront._admin_api_request_headers())
+    except requests.exceptions.RequestException as e:
+        return jsonify({'error': str(e)}), 500
+
+    if upstream.status_code < 400:
+        await asyncio.to_thread(storefront._invalidate_after_admin_write, resource, item_id)
+    return Response(_relay_upstream_body(upstream), status=upstream.status_code,
+                    headers=proxy_headers(upstream.headers))
+
+
+@async_view('admin_import_products')
+@streams_request_body
+async def admin_import_products():
+    """
+    Rejects non-admins before the upload is read; the sync view parses it from the stream.
+    """
+    if not storefront._is_admin(session.get('current_user')):
+        return jsonify({'error': 'Admin access required'}), 403
+    return SYNC_FALLBACK
+
+
+async def _relay_upstream_body(upstream):
+    try:
+        async for chunk in upstream.aiter_raw(storefront.PROXY_CHUNK_SIZE):
+            yield chunk
+    except httpx.HTTPError as e:
+        print(f"Error relaying API response for {upstream.url}: {e}")
+    finally:
+        await upstream.aclose()
+
+
+# --------------------- ASGI application ---------------------
+
+class BlockingBody(io.RawIOBase):
+    """`wsgi.input` for a sync view that reads an async request body from a worker thread."""
+
+    def __init__(self, chunks, loop):
+        self._chunks = chunks
+        self._loop = loop
+        self._buffer = b''
+        self._done = False
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self._buffer and not self._done:
+            try:
+                self._buffer = asyncio.run_coroutine_threadsafe(anext(self._chunks), self._loop).result()
+            except StopAsyncIteration:
+                self._done = True
+        size = min(len(buffer), len(self._buffer))
+        buffer[:size] = self._buffer[:size]
+        self._buffer = self._buffer[size:]
+        return size
+
+
+def build_environ(scope, body):
+    """WSGI environ for an ASGI HTTP scope whose request body was fully read."""
+    script_name = scope.get('root_path', '')
+    path = scope['path']
+    if script_name and path.startswith(script_name):
+        path = path[len(script_name):]
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': script_name.encode('utf-8').decode('latin-1'),
+        'PATH_INFO': path.encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1] or 80),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    if scope.get('client'):
+        environ['REMOTE_ADDR'], environ['REMOTE_PORT'] = scope['client'][0], str(scope['client'][1])
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1')
+        key = name.upper().replace('-', '_')
+        if key not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            key = f'HTTP_{key}'
+        value = value.decode('latin-1')
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    if body and 'CONTENT_LENGTH' not in environ:
+        environ['CONTENT_LENGTH'] = str(len(body))
+    return environ
+
+
+class StorefrontASGI:
+    """ASGI app serving `ASYNC_VIEWS` natively and the rest of a Flask app in threads."""
+
+    def __init__(self, flask_app, client, views, sync_workers=32, body_limits=None):
+        self.flask_app = flask_app
+        self.client = client
+        self.views = views
+        self.max_body = flask_app.config.get('MAX_CONTENT_LENGTH')
+        # Endpoints accepting larger bodies than MAX_CONTENT_LENGTH: {endpoint: bytes}
+        self.body_limits = body_limits or {}
+        self._executor = ThreadPoolExecutor(max_workers=sync_workers, thread_name_prefix='wsgi')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self._lifespan(receive, send)
+        if scope['type'] != 'http':
+            raise ValueError(f"Unsupported ASGI scope type {scope['type']!r}")
+
+        endpoint = self._endpoint(scope)
+        view = self.views.get(endpoint)
+        max_body = self.body_limits.get(endpoint, self.max_body)
+        if getattr(view, 'streams_request_body', False):
+            # The view forwards the body as it arrives instead of buffering it
+            environ = build_environ(scope, b'')
+            chunks = environ['asgi.body'] = self._iter_body(receive, max_body)
+            response = await self._dispatch(view, environ)
+            if response is not None:
+                return await self._send_response(response, environ, send)
+            # The sync view reads the same stream, one chunk at a time
+            environ['wsgi.input'] = BlockingBody(chunks, asyncio.get_running_loop())
+            environ['wsgi.input_terminated'] = True
+            return await self._call_wsgi(environ, send)
+
+        try:
+            body = await self._read_body(receive, max_body)
+        except RequestEntityTooLarge:
+            # Answered without reading the rest of the upload
+            environ = build_environ(scope, b'')
+            return await self._send_response(Response('Request Entity Too Large', status=413), environ, send)
+        if body is None:
+            return
+        environ = build_environ(scope, body)
+
+        if view is not None:
+            response = await self._dispatch(view, environ)
+            if response is not None:
+                return await self._send_response(response, environ, send)
+            environ['wsgi.input'] = io.BytesIO(body)
+        await self._call_wsgi(environ, send)
+
+    def _endpoint(self, scope):
+        adapter = self.flask_app.url_map.bind('localhost')
+        try:
+            endpoint, _ = adapter.match(scope['path'], method=scope['method'])
+        except HTTPException:
+            # 404 / 405 / redirects are produced by the sync app
+            return None
+        return endpoint
+
+    async def _read_body(self, receive, max_body):
+        chunks = []
+        size = 0
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return None
+            chunk = message.get('body', b'')
+            size += len(chunk)
+            if max_body is not None and size > max_body:
+                raise RequestEntityTooLarge()
+            chunks.append(chunk)
+            if not message.get('more_body'):
+                return b''.join(chunks)
+
+    @staticmethod
+    async def _iter_body(receive, max_body):
+        size = 0
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                raise ConnectionResetError("Client disconnected while sending the request body")
+            chunk = message.get('body', b'')
+            size += len(chunk)
+            if max_body is not None and size > max_body:
+                raise RequestEntityTooLarge()
+            if chunk:
+                yield chunk
+            if not message.get('more_body'):
+                return
+
+    async def _dispatch(self, view, environ):
+        """Run an async view like Flask's full_dispatch_request; None means use the sync view.
+
+        The request context is a context variable, so the hooks run by
+        `asyncio.to_thread` see it too. The session is opened in a thread
+        before the context is pushed (push() keeps a session that is set),
+        as server-side backends read SQLite or Redis (sessions.py).
+        """
+        flask_app = self.flask_app
+        ctx = flask_app.request_context(environ)
+        ctx.session = await asyncio.to_thread(self._open_session, ctx.request)
+        with ctx:
+            try:
+                try:
+                    rv = await asyncio.to_thread(flask_app.preprocess_request)
+                    if rv is None:
+                        rv = await self._cached_view(view)
+                except Exception as e:
+                    rv = flask_app.handle_user_exception(e)
+                if rv is SYNC_FALLBACK:
+                    return None
+                return await asyncio.to_thread(flask_app.finalize_request, rv)
+            except Exception as e:
+                return flask_app.handle_exception(e)
+
+    def _open_session(self, flask_request):
+        interface = self.flask_app.session_interface
+        opened = interface.open_session(self.flask_app, flask_request)
+        return opened if opened is not None else interface.make_null_session(self.flask_app)
+
+    async def _cached_view(self, view):
+        # Same page cache and tags as the sync view registered for this endpoint
+        page_cache = storefront.page_cache
+        tags = getattr(self.flask_app.view_functions[request.endpoint], 'page_cache_tags', None)
+        if tags is None or not page_cache.enabled or not page_cache.is_cacheable_request():
+            return await view(**request.view_args)
+        # The backend may be Redis, through a blocking client
+        response = await asyncio.to_thread(page_cache.lookup)
+        if response is not None:
+            return response
+        rv = await view(**request.view_args)
+        if rv is SYNC_FALLBACK:
+            return rv
+        return await asyncio.to_thread(page_cache.store, self.flask_app.make_response(rv), tags)
+
+    async def _send_response(self, response, environ, send):
+        headers = response.get_wsgi_headers(environ)
+        await send({
+            'type': 'http.response.start',
+            'status': response.status_code,
+            'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers.items()],
+        })
+        try:
+            if hasattr(response.response, '__aiter__'):
+                # Body relayed from an async upstream response
+                if environ['REQUEST_METHOD'] != 'HEAD':
+                    async for chunk in response.response:
+                        await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+                else:
+                    await response.response.aclose()
+            else:
+                for chunk in response.get_app_iter(environ):
+                    if chunk:
+                        await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        finally:
+            response.close()
+        await send({'type': 'http.response.body', 'body': b''})
+
+    async def _call_wsgi(self, environ, send):
+        """Run the Flask WSGI app in the thread pool, forwarding its output as it is produced."""
+        loop = asyncio.get_running_loop()
+
+        def emit(message):
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        def run():
+            started = {}
+
+            def start_response(status, headers, exc_info=None):
+                started['message'] = {
+                    'type': 'http.response.start',
+                    'status': int(status.split(' ', 1)[0]),
+                    'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers],
+                }
+
+            iterable = self.flask_app(environ, start_response)
+            try:
+                for chunk in iterable:
+                    if 'message' in started:
+                        emit(started.pop('message'))
+                    if chunk:
+                        emit({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            finally:
+                if hasattr(iterable, 'close'):
+                    iterable.close()
+            if 'message' in started:
+                emit(started.pop('message'))
+            emit({'type': 'http.response.body', 'body': b''})
+
+        await loop.run_in_executor(self._executor, run)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.client.aclose()
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+
+application = StorefrontASGI(storefront.app, api, ASYNC_VIEWS,
+                             sync_workers=int(os.getenv('ASGI_SYNC_WORKERS', 32)),
+                             # Import uploads are streamed (see admin_import_products)
+                             body_limits={'admin_import_products': storefront.BULK_IMPORT_MAX_BYTES})
+
+
+if __name__ == '__main__':
+    try:
+        import uvicorn
+    except ImportError:
+        raise SystemExit("The ASGI serving mode requires 'uvicorn' (pip install uvicorn httpx)")
+    uvicorn.run(application, port=5001)
@@ -0,0 +1,9 @@
+/** @type {import('tailwindcss').Config} */
+module.exports = {
+  // Only classes that appear in the templates end up in the bundle
+  content: ['../templates/**/*.html'],
+  theme: {
+    extend: {},
+  },
+  plugins: [],
+}
@@ -0,0 +1,203 @@
+"""
+Async counterpart of `api_client.BackendClient`, used by the ASGI serving
+mode (asgi.py).
+
+Same contract as the sync client: paths relative to API_BASE_URL, connect
+and read timeouts, idempotent GETs retried with backoff, the circuit
+breaker and admission control (usually shared with the sync client so both
+see the same backend health) and observers called after every request. Transport errors are
+raised as the matching `requests` exceptions, so view code keeps catching
+`requests.exceptions.RequestException` in both modes.
+
+Requires the optional 'httpx' package.
+"""
+import asyncio
+import time
+
+import requests
+
+from admission import OverloadedError
+from api_client import BackendClient, CircuitBreaker, CircuitOpenError
+from singleflight import flight_key
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+
+def raise_for_status(response):
+    """Like `requests.Response.raise_for_status` for an httpx response."""
+    if response.status_code >= 400:
+        raise requests.exceptions.HTTPError(
+            f"{response.status_code} Error for url: {response.url}", response=response)
+
+
+class AsyncBackendClient:
+    """Pooled httpx.AsyncClient wrapper for the backend API.
+
+    The underlying client is created on first use, inside the serving event
+    loop, and closed by `aclose()` on ASGI lifespan shutdown.
+    """
+
+    RETRY_STATUSES = BackendClient.RETRY_STATUSES
+    RETRY_METHODS = frozenset({'GET', 'HEAD', 'OPTIONS'})
+
+    def __init__(self, base_url, pool_size=100, connect_timeout=3.05, read_timeout=10.0,
+                 max_retries=2, retry_backoff=0.3, breaker=None, admission=None):
+        if httpx is None:
+            raise RuntimeError("The ASGI serving mode requires the 'httpx' package (pip install httpx)")
+        self.base_url = base_url.rstrip('/')
+        self.pool_size = pool_size
+        self.timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.breaker = breaker or CircuitBreaker()
+        # Optional admission.AdmissionControl limiting concurrent calls per endpoint
+        self.admission = admission
+        # Callables observer(method, path, elapsed_seconds, response, error) run after every call
+        self.observers = []
+        # Optional singleflight.AsyncSingleFlight merging identical concurrent GETs
+        self.single_flight = None
+        # Callables observer(method, path, response, error) run when a GET got another caller's result
+        self.coalesced_observers = []
+        self._client = None
+
+    @classmethod
+    def from_env(cls, base_url, environ, breaker=None, admission=None):
+        """Build a client from API_* settings in `environ` (usually os.environ)."""
+        return cls(
+            base_url,
+            pool_size=int(environ.get('API_ASYNC_POOL_SIZE', 100)),
+            connect_timeout=float(environ.get('API_CONNECT_TIMEOUT', 3.05)),
+            read_timeout=float(environ.get('API_READ_TIMEOUT', 10)),
+            max_retries=int(environ.get('API_MAX_RETRIES', 2)),
+            retry_backoff=float(environ.get('API_RETRY_BACKOFF', 0.3)),
+            breaker=breaker,
+            admission=admission,
+        )
+
+    @property
+    def client(self):
+        if self._client is None:
+            limits = httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size)
+            self._client = httpx.AsyncClient(timeout=self.timeout, limits=limits)
+        return self._client
+
+    def url(self, path):
+        return f"{self.base_url}/{path.lstrip('/')}"
+
+    async def request(self, method, path, stream=False, **kwargs):
+        """Send a request to the API through admission control, the pool and circuit breaker.
+
+        With `stream=True` only the headers are read; iterate the body with
+        `response.aiter_raw()` / `aiter_bytes()` and then `aclose()` it.
+        """
+        started = time.perf_counter()
+        permit = None
+        if self.admission is not None:
+            try:
+                permit = await self.admission.acquire_async(method, path)
+            except OverloadedError as e:
+                self._notify(method, path, started, None, e)
+                raise
+        if not self.breaker.allow_request():
+            if permit is not None:
+                self.admission.release(permit)
+            error = CircuitOpenError(f"Backend circuit open, skipping {method} {path}")
+            self._notify(method, path, started, None, error)
+            raise error
+        sent = time.perf_counter()
+        try:
+            response = await self._send(method, path, stream, **kwargs)
+        except requests.exceptions.RequestException as e:
+            self.breaker.record_failure()
+            if permit is not None:
+                self.admission.release(permit, time.perf_counter() - sent, dropped=True)
+            self._notify(method, path, started, None, e)
+            raise
+        except BaseException:
+            # Cancelled, e.g. the client went away: free the slot without a latency sample
+            if permit is not None:
+                self.admission.release(permit)
+            raise
+        if response.status_code >= 500:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        if permit is not None:
+            self.admission.release(permit, time.perf_counter() - sent, dropped=response.status_code >= 500)
+        self._notify(method, path, started, response, None)
+        return response
+
+    async def _send(self, method, path, stream, **kwargs):
+        # Mirrors the sync client's urllib3 Retry: idempotent methods are retried
+        # on transport errors and 502/503/504, others only if nothing was sent.
+        url = self.url(path)
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                await asyncio.sleep(self.retry_backoff * 2 ** (attempt - 1))
+            last_attempt = attempt == self.max_retries
+            try:
+                response = await self.client.send(self.client.build_request(method, url, **kwargs), stream=stream)
+            except httpx.ConnectError as e:
+                if last_attempt:
+                    raise requests.exceptions.ConnectionError(str(e) or repr(e)) from e
+                continue
+            except httpx.TimeoutException as e:
+                if last_attempt or method not in self.RETRY_METHODS:
+                    raise requests.exceptions.Timeout(str(e) or repr(e)) from e
+                continue
+            except httpx.HTTPError as e:
+                if last_attempt or method not in self.RETRY_METHODS:
+                    raise requests.exceptions.ConnectionError(str(e) or repr(e)) from e
+                continue
+            if (not last_attempt and method in self.RETRY_METHODS
+                    and response.status_code in self.RETRY_STATUSES):
+                await response.aclose()
+                continue
+            return response
+
+    def _notify(self, method, path, started, response, error):
+        elapsed = time.perf_counter() - started
+        for observer in self.observers:
+            try:
+                observer(method, path, elapsed, response, error)
+            except Exception as e:
+                print(f"API client observer failed: {e}")
+
+    async def get(self, path, **kwargs):
+        if self.single_flight is None or kwargs.get('stream'):
+            return await self.request('GET', path, **kwargs)
+        key = flight_key(self.url(path), kwargs.get('params'), kwargs.get('headers'))
+        called = []
+
+        def call():
+            called.append(True)
+            return self.request('GET', path, **kwargs)
+
+        try:
+            response = await self.single_flight.do(key, call)
+        except requests.exceptions.RequestException as e:
+            if not called:
+                self._notify_coalesced('GET', path, None, e)
+            raise
+        if not called:
+            self._notify_coalesced('GET', path, response, None)
+        return response
+
+    _notify_coalesced = BackendClient._notify_coalesced
+
+    async def post(self, path, **kwargs):
+        return await self.request('POST', path, **kwargs)
+
+    async def put(self, path, **kwargs):
+        return await self.request('PUT', path, **kwargs)
+
+    async def delete(self, path, **kwargs):
+        return await self.request('DELETE', path, **kwargs)
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
@@ -0,0 +1,169 @@
+"""
+Local verification of the backend's session tokens.
+
+At login the backend signs `{userId, role}` with JWT_SECRET (HS256, 7 day
+expiry), and its own middleware trusts the role in the token. The frontend
+shares the secret, so it checks tokens the same way instead of asking
+`GET /auth/me` on every request:
+
+- Verified claims are kept in an LRU keyed by a hash of the token, and each
+  entry expires together with the token. Role checks and the user's
+  identity are answered in-process until the token changes or expires.
+  The user record itself stays in the session.
+- Expired and malformed tokens are rejected without an API call. A token
+  whose signature does not match is confirmed once with `confirm(token)`,
+  which usually calls /auth/me. That way a JWT_SECRET that differs from the
+  backend's costs one API call per token instead of logging everyone out.
+
+Only the standard library is needed; other algorithms than HS256 are
+rejected, like the backend does.
+"""
+import base64
+import hashlib
+import hmac
+import json
+import time
+
+from cache import LRUCache
+
+
+class InvalidToken(ValueError):
+    """The token is malformed, expired or not signed with the secret."""
+
+
+class ExpiredToken(InvalidToken):
+    pass
+
+
+class BadSignature(InvalidToken):
+    pass
+
+
+def _b64decode(segment):
+    return base64.urlsafe_b64decode(segment + '=' * (-len(segment) % 4))
+
+
+def decode_hs256(token, secret, leeway=0, now=None):
+    """Claims of an HS256 JWT signed with `secret` (bytes); raises InvalidToken."""
+    now = time.time() if now is None else now
+    try:
+        header_segment, payload_segment, signature_segment = token.split('.')
+        header = json.loads(_b64decode(header_segment))
+        signature = _b64decode(signature_segment)
+        signing_input = f"{header_segment}.{payload_segment}".encode('ascii')
+    except (ValueError, TypeError, AttributeError) as e:
+        raise InvalidToken(f"Malformed token: {e}") from None
+    if not isinstance(header, dict) or header.get('alg') != 'HS256':
+        raise InvalidToken("Unsupported token algorithm")
+
+    expected = hmac.new(secret, signing_input, hashlib.sha256).digest()
+    if not hmac.compare_digest(signature, expected):
+        raise BadSignature("Token signature does not match")
+
+    claims = unverified_claims(token)
+    if claims is None:
+        raise InvalidToken("Malformed token payload")
+    exp = claims.get('exp')
+    if isinstance(exp, (int, float)) and exp + leeway <= now:
+        raise ExpiredToken("Token has expired")
+    nbf = claims.get('nbf')
+    if isinstance(nbf, (int, float)) and nbf - leeway > now:
+        raise InvalidToken("Token is not valid yet")
+    return claims
+
+
+def unverified_claims(token):
+    """Payload of a JWT without checking it, or None if it cannot be read."""
+    try:
+        claims = json.loads(_b64decode(token.split('.')[1]))
+    except (ValueError, TypeError, AttributeError, IndexError):
+        return None
+    return claims if isinstance(claims, dict) else None
+
+
+class TokenVerifier:
+    """Cached verification of session tokens.
+
+    `confirm(token)` returns the API's user dict for a token, None if the
+    API rejects it, and raises `requests` exceptions if the API cannot be
+    reached. It is only used for tokens that fail the signature check.
+    """
+
+    # How long a token without `exp` or a rejected token is remembered
+    DEFAULT_TTL = 300.0
+    REJECTED_TTL = 60.0
+
+    def __init__(self, secret, confirm=None, max_items=10000, leeway=30.0):
+        self.secret = secret.encode('utf-8')
+        self.confirm = confirm
+        self.leeway = leeway
+        self._entries = LRUCache(max_items=max_items)
+        self._warned = False
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_env(cls, environ, confirm=None):
+        """A verifier for JWT_SECRET, or None when unset or JWT_LOCAL_VERIFY=0."""
+        secret = environ.get('JWT_SECRET')
+        if not secret or environ.get('JWT_LOCAL_VERIFY', '1') != '1':
+            return None
+        return cls(
+            secret,
+            confirm=confirm,
+            max_items=int(environ.get('JWT_CACHE_SIZE', 10000)),
+            leeway=float(environ.get('JWT_LEEWAY', 30)),
+        )
+
+    @staticmethod
+    def _key(token):
+        return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+    def _entry(self, token):
+        key = self._key(token)
+        entry = self._entries.get(key)
+        if entry is not None and entry['expires'] > time.time():
+            self.hits += 1
+            return entry
+        self.misses += 1
+        entry = self._verify(token)
+        self._entries.set(key, entry)
+        return entry
+
+    def _verify(self, token):
+        now = time.time()
+        try:
+            claims = decode_hs256(token, self.secret, self.leeway, now)
+        except BadSignature:
+            return self._confirm(token, now)
+        except ExpiredToken:
+            return {'claims': None, 'expires': now + self.DEFAULT_TTL}
+        except InvalidToken:
+            return {'claims': None, 'expires': now + self.REJECTED_TTL}
+        exp = claims.get('exp')
+        expires = exp + self.leeway if isinstance(exp, (int, float)) else now + self.DEFAULT_TTL
+        return {'claims': claims, 'expires': expires}
+
+    def _confirm(self, token, now):
+        user = self.confirm(token) if self.confirm else None
+        if not user:
+            return {'claims': None, 'expires': now + self.REJECTED_TTL}
+        if not self._warned:
+            self._warned = True
+            print("Session token signature did not match JWT_SECRET but the API accepted it; "
+                  "check that JWT_SECRET matches the backend's")
+        # Trust the API's answer for the rest of the token's lifetime
+        claims = unverified_claims(token) or {}
+        exp = claims.get('exp')
+        expires = exp if isinstance(exp, (int, float)) and exp > now else now + self.DEFAULT_TTL
+        return {'claims': {**claims, 'userId': user.get('id'), 'role': user.get('role')}, 'expires': expires}
+
+    def claims(self, token):
+        """Verified claims (`userId`, `role`, `exp`) of `token`, or None if it is not valid.
+
+        May raise `requests` exceptions while confirming a token with the API.
+        """
+        return self._entry(token)['claims']
+
+    def forget(self, token):
+        self._entries.pop(self._key(token))
@@ -0,0 +1,286 @@
+"""
+Load test / latency benchmark for the Flask storefront.
+
+Starts the mock backend (benchmarks/mock_api.py) and the Flask app in
+separate processes, drives the selected pages at a fixed concurrency and
+reports per scenario:
+
+- p50 / p95 / p99 latency and requests per second
+- errors (non-2xx responses, including redirects to the login page, and
+  connection failures)
+- upstream API calls per page, broken down by endpoint
+- the app process's current and peak RSS
+
+Examples (from frontend_python/):
+
+    python benchmarks/bench.py
+    python benchmarks/bench.py --concurrency 32 --requests 500 --latency-ms 50
+    python benchmarks/bench.py --scenarios home,product_detail --image-kb 400 --json results.json
+    python benchmarks/bench.py --server asgi --concurrency 256 --latency-ms 100
+    python benchmarks/bench.py --target http://127.0.0.1:5001 --app-pid 12345
+"""
+import argparse
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+import mock_api
+
+FRONTEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+Scenario = namedtuple('Scenario', 'method path admin body')
+
+
+def build_scenarios(args):
+    categories = args.categories
+    products = args.categories * args.products_per_category
+    image = mock_api.make_data_uri(args.image_kb, seed=42)
+
+    def product_payload():
+        return {'name': 'Bench product', 'description': 'Updated by benchmark', 'price': 199000,
+                'stock': 5, 'categoryId': 'cat0', 'imageUrl': image, 'imageUrls': [image] * args.images_per_product}
+
+    return {
+        'home': Scenario('GET', lambda: '/', False, None),
+        'category': Scenario('GET', lambda: f'/category/category-{random.randrange(categories)}', False, None),
+        'category_all': Scenario('GET', lambda: '/category/all', False, None),
+        'product_detail': Scenario('GET', lambda: f'/product/prod{random.randrange(products)}', False, None),
+        'admin_products': Scenario('GET', lambda: '/admin/products', True, None),
+        'admin_api_products': Scenario('PUT', lambda: f'/api/admin/products/prod{random.randrange(products)}',
+                                       True, product_payload),
+        'admin_api_categories': Scenario('PUT', lambda: f'/api/admin/categories/cat{random.randrange(categories)}',
+                                         True, lambda: {'name': 'Bench category', 'imageUrl': image}),
+        'admin_api_banners': Scenario('PUT', lambda: '/api/admin/banners/banner0', True,
+                                      lambda: {'title': 'Bench banner', 'imageUrl': image}),
+    }
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(round(pct / 100 * len(sorted_values))))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def wait_for_port(host, port, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        with socket.socket() as sock:
+            if sock.connect_ex((host, port)) == 0:
+                return
+        time.sleep(0.1)
+    raise RuntimeError(f"Nothing listening on {host}:{port} after {timeout}s")
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def read_rss_kb(pid):
+    """(current, peak) resident set size in KB from /proc; (None, None) elsewhere."""
+    values = {}
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                key, _, value = line.partition(':')
+                if key in ('VmRSS', 'VmHWM'):
+                    values[key] = int(value.split()[0])
+    except (OSError, ValueError):
+        return None, None
+    return values.get('VmRSS'), values.get('VmHWM')
+
+
+def start_mock(args, port):
+    command = [sys.executable, os.path.join(FRONTEND_DIR, 'benchmarks', 'mock_api.py'), '--port', str(port),
+               '--latency-ms', str(args.latency_ms), '--jitter-ms', str(args.jitter_ms),
+               '--categories', str(args.categories), '--products-per-category', str(args.products_per_category),
+               '--banners', str(args.banners), '--image-kb', str(args.image_kb),
+               '--images-per-product', str(args.images_per_product), '--avatar-kb', str(args.avatar_kb)]
+    # The secret goes through the environment rather than the command line
+    env = dict(os.environ, JWT_SECRET=args.jwt_secret)
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL, env=env)
+    wait_for_port('127.0.0.1', port)
+    return process
+
+
+def start_app(api_base_url, port, log, server='werkzeug', jwt_secret=''):
+    if server == 'asgi':
+        # Async serving mode (asgi.py) under uvicorn
+        code = f"import uvicorn, asgi; uvicorn.run(asgi.application, port={port}, log_level='warning')"
+    else:
+        # Same app object as `python app.py`, served by a threaded werkzeug server without debug/reloader
+        code = (
+            "import logging, app; from werkzeug.serving import make_server;"
+            "logging.getLogger('werkzeug').setLevel(logging.ERROR);"
+            f"make_server('127.0.0.1', {port}, app.app, threaded=True).serve_forever()"
+        )
+    env = dict(os.environ, API_BASE_URL=api_base_url)
+    if jwt_secret:
+        # Verify the mock's tokens locally, like a production setup
+        env['JWT_SECRET'] = jwt_secret
+    process = subprocess.Popen([sys.executable, '-c', code], cwd=FRONTEND_DIR, env=env,
+                               stdout=log, stderr=log)
+    wait_for_port('127.0.0.1', port)
+    return process
+
+
+def admin_cookies(target):
+    session = requests.Session()
+    response = session.post(f'{target}/login', data={'email': 'admin@bench.local', 'password': 'bench'},
+                            allow_redirects=False)
+    if response.status_code != 302 or not session.cookies:
+        raise RuntimeError(f"Admin login against the mock backend failed ({response.status_code})")
+    # A session the app rejects would make every admin scenario measure a redirect to /login
+    response = session.get(f'{target}/admin/products', allow_redirects=False)
+    if response.status_code != 200:
+        raise RuntimeError(f"The app did not accept the admin session ({response.status_code}); "
+                           f"check that the app and the mock use the same JWT_SECRET")
+    return session.cookies
+
+
+def run_scenario(target, scenario, total, concurrency, cookies, timeout):
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+    local = threading.local()
+    remaining = iter(range(total))
+
+    def worker():
+        nonlocal errors
+        if not hasattr(local, 'session'):
+            local.session = requests.Session()
+            if cookies is not None:
+                local.session.cookies.update(cookies)
+        while True:
+            with lock:
+                if next(remaining, None) is None:
+                    return
+            body = scenario.body() if scenario.body else None
+            started = time.perf_counter()
+            try:
+                response = local.session.request(scenario.method, target + scenario.path(), json=body,
+                                                 allow_redirects=False, timeout=timeout)
+                response.content  # make sure the whole body was received
+                # No scenario redirects when it works; a 3xx is a lost session or a failed write
+                failed = response.status_code >= 300
+            except requests.exceptions.RequestException:
+                failed = True
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+                errors += failed
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for future in [pool.submit(worker) for _ in range(concurrency)]:
+            future.result()
+    wall = time.perf_counter() - started
+    return sorted(latencies), errors, wall
+
+
+def upstream_stats(mock_url, reset=False):
+    path = '/__bench/reset' if reset else '/__bench/stats'
+    response = requests.post(mock_url + path) if reset else requests.get(mock_url + path)
+    return response.json()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scenarios', default='home,category,category_all,product_detail,admin_products,'
+                                               'admin_api_products,admin_api_categories,admin_api_banners',
+                        help='comma-separated scenario names')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=200, help='measured requests per scenario')
+    parser.add_argument('--warmup', type=int, default=10, help='unmeasured requests per scenario')
+    parser.add_argument('--timeout', type=float, default=30.0, help='client timeout per request')
+    parser.add_argument('--logged-in', action='store_true', help='run storefront pages with an admin session')
+    parser.add_argument('--server', choices=('werkzeug', 'asgi'), default='werkzeug',
+                        help='serve the app with threaded werkzeug (sync mode) or uvicorn + asgi.py')
+    parser.add_argument('--target', help='benchmark an already running app instead of starting one')
+    parser.add_argument('--app-pid', type=int, help='pid of --target, for RSS reporting')
+    parser.add_argument('--mock-url', help='stats URL of an already running mock (with --target)')
+    parser.add_argument('--json', dest='json_path', help='also write results to this file')
+    mock_api.add_arguments(parser)
+    args = parser.parse_args()
+
+    scenarios = build_scenarios(args)
+    selected = [name.strip() for name in args.scenarios.split(',') if name.strip()]
+    unknown = [name for name in selected if name not in scenarios]
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(unknown)} (choose from {', '.join(scenarios)})")
+
+    processes = []
+    try:
+        if args.target:
+            target, app_pid = args.target.rstrip('/'), args.app_pid
+            mock_url = args.mock_url
+        else:
+            mock_port, app_port = free_port(), free_port()
+            processes.append(start_mock(args, mock_port))
+            mock_url = f'http://127.0.0.1:{mock_port}'
+            app_process = start_app(f'{mock_url}/api', app_port, subprocess.DEVNULL, args.server, args.jwt_secret)
+            processes.append(app_process)
+            target, app_pid = f'http://127.0.0.1:{app_port}', app_process.pid
+
+        cookies = admin_cookies(target) if any(scenarios[name].admin for name in selected) or args.logged_in else None
+        results = []
+        print(f"{'scenario':<22}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'errors':>8}"
+              f"{'upstream/req':>14}{'rss MB':>9}")
+        for name in selected:
+            scenario = scenarios[name]
+            use_cookies = cookies if scenario.admin or args.logged_in else None
+            if args.warmup:
+                run_scenario(target, scenario, args.warmup, min(args.concurrency, args.warmup), use_cookies, args.timeout)
+            if mock_url:
+                upstream_stats(mock_url, reset=True)
+            latencies, errors, wall = run_scenario(target, scenario, args.requests, args.concurrency,
+                                                   use_cookies, args.timeout)
+            upstream = upstream_stats(mock_url) if mock_url else None
+            rss_kb, peak_kb = read_rss_kb(app_pid) if app_pid else (None, None)
+
+            result = {
+                'scenario': name,
+                'requests': len(latencies),
+                'concurrency': args.concurrency,
+                'rps': len(latencies) / wall if wall else 0.0,
+                'p50_ms': percentile(latencies, 50) * 1000,
+                'p95_ms': percentile(latencies, 95) * 1000,
+                'p99_ms': percentile(latencies, 99) * 1000,
+                'errors': errors,
+                'upstream_per_request': upstream['total'] / len(latencies) if upstream and latencies else None,
+                'upstream_routes': upstream['routes'] if upstream else None,
+                'rss_kb': rss_kb,
+                'peak_rss_kb': peak_kb,
+            }
+            results.append(result)
+            per_request = f"{result['upstream_per_request']:.2f}" if upstream else 'n/a'
+            rss = f"{rss_kb / 1024:.1f}" if rss_kb else 'n/a'
+            print(f"{name:<22}{result['rps']:>9.1f}{result['p50_ms']:>9.1f}{result['p95_ms']:>9.1f}"
+                  f"{result['p99_ms']:>9.1f}{errors:>8}{per_request:>14}{rss:>9}")
+
+        peak = results[-1]['peak_rss_kb'] if results else None
+        print(f"\npeak RSS of app process: {peak / 1024:.1f} MB" if peak else "\npeak RSS of app process: n/a")
+        if args.json_path:
+            with open(args.json_path, 'w') as f:
+                json.dump({'settings': vars(args), 'results': results}, f, indent=2)
+            print(f"results written to {args.json_path}")
+    finally:
+        for process in reversed(processes):
+            process.terminate()
+            process.wait(timeout=10)
+
+
+if __name__ == '__main__':
+    main()
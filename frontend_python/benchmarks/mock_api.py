@@ -0,0 +1,270 @@
+"""
+Local stand-in for the Next.js `/api/*` endpoints used by the Flask frontend.
+
+Serves a synthetic catalog (categories, products, banners, users) with
+configurable latency and payload sizes, and counts every call so the
+benchmark can report upstream calls per page:
+
+    GET  /__bench/stats   -> {"total": n, "routes": {"GET /products": n, ...}}
+    POST /__bench/reset   -> zero the counters
+
+Logins return an HS256 token signed with --jwt-secret (default: the
+JWT_SECRET environment variable), so an app configured with the same secret
+verifies it like a real session token.
+
+Run standalone:  python benchmarks/mock_api.py --port 3999 --latency-ms 20
+"""
+import argparse
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import os
+import random
+import struct
+import threading
+import time
+import zlib
+from collections import Counter
+
+from werkzeug.serving import make_server
+from werkzeug.wrappers import Request, Response
+
+
+def make_png(width, height, seed=0):
+    """Build a noisy RGB PNG (noise keeps it from compressing, like a photo)."""
+    rng = random.Random(seed)
+    raw = b''.join(b'\x00' + rng.randbytes(width * 3) for _ in range(height))
+
+    def chunk(kind, data):
+        body = kind + data
+        return struct.pack('>I', len(data)) + body + struct.pack('>I', zlib.crc32(body) & 0xffffffff)
+
+    header = struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)
+    return b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', header) + chunk(b'IDAT', zlib.compress(raw, 1)) + chunk(b'IEND', b'')
+
+
+def make_data_uri(size_kb, seed=0):
+    """A PNG data URI whose decoded size is roughly `size_kb` KB."""
+    side = max(1, int((size_kb * 1024 / 3) ** 0.5))
+    return 'data:image/png;base64,' + base64.b64encode(make_png(side, side, seed)).decode('ascii')
+
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+def sign_token(claims, secret):
+    """An HS256 JWT of `claims`, shaped like the backend's login tokens."""
+    header = _b64encode(json.dumps({'alg': 'HS256', 'typ': 'JWT'}).encode('utf-8'))
+    payload = _b64encode(json.dumps(claims).encode('utf-8'))
+    signature = hmac.new(secret.encode('utf-8'), f"{header}.{payload}".encode('ascii'), hashlib.sha256).digest()
+    return f"{header}.{payload}.{_b64encode(signature)}"
+
+
+class MockCatalog:
+    """Synthetic catalog shaped like the Prisma models the API returns."""
+
+    def __init__(self, categories=6, products_per_category=40, banners=3,
+                 image_kb=60, images_per_product=3, avatar_kb=150, distinct_images=8):
+        images = [make_data_uri(image_kb, seed) for seed in range(distinct_images)]
+        self.avatar = make_data_uri(avatar_kb, seed=999)
+        stamp = '2024-01-01T00:00:00.000Z'
+
+        self.categories = [{
+            'id': f'cat{c}', 'name': f'Category {c}', 'slug': f'category-{c}',
+            'description': f'Things for room {c}', 'imageUrl': images[c % len(images)],
+            'createdAt': stamp, 'updatedAt': stamp,
+        } for c in range(categories)]
+
+        self.products = []
+        for c, category in enumerate(self.categories):
+            for i in range(products_per_category):
+                n = c * products_per_category + i
+                self.products.append({
+                    'id': f'prod{n}', 'name': f'Product {n}', 'slug': f'product-{n}',
+                    'description': f'Description of product {n}. ' * 5,
+                    'price': f'{(n * 37) % 2000 + 50}000.00', 'discount': str(n % 4 * 5),
+                    'stock': n % 25, 'featured': n % 7 == 0,
+                    'imageUrl': images[n % len(images)],
+                    'imageUrls': [images[(n + k) % len(images)] for k in range(images_per_product)],
+                    'categoryId': category['id'], 'category': category,
+                    'createdAt': stamp, 'updatedAt': stamp,
+                })
+        self.products_by_id = {p['id']: p for p in self.products}
+
+        self.banners = [{
+            'id': f'banner{b}', 'title': f'Banner {b}', 'subtitle': 'Sale', 'imageUrl': images[b % len(images)],
+            'link': '/category/all', 'order': b, 'active': True, 'createdAt': stamp, 'updatedAt': stamp,
+        } for b in range(banners)]
+
+        self.admin = {
+            'id': 'admin1', 'name': 'Bench Admin', 'email': 'admin@bench.local', 'phone': None,
+            'address': None, 'role': 'ADMIN', 'avatarUrl': self.avatar, 'createdAt': stamp,
+        }
+        self.users = [self.admin] + [dict(self.admin, id=f'user{u}', role='CUSTOMER', email=f'u{u}@bench.local')
+                                     for u in range(20)]
+
+
+class MockApi:
+    """WSGI app emulating the backend routes, with latency and call counting."""
+
+    # Same lifetime as the backend's tokens
+    TOKEN_TTL = 7 * 24 * 3600
+
+    def __init__(self, catalog, latency_ms=0.0, jitter_ms=0.0, jwt_secret=''):
+        self.catalog = catalog
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        # Without a secret the app skips local verification, so any key will do
+        self.jwt_secret = jwt_secret or 'bench-secret'
+        self.calls = Counter()
+        self._lock = threading.Lock()
+
+    def _sleep(self):
+        delay = self.latency_ms + random.uniform(-self.jitter_ms, self.jitter_ms)
+        if delay > 0:
+            time.sleep(delay / 1000)
+
+    @staticmethod
+    def _json(data, status=200):
+        return Response(json.dumps(data), status=status, mimetype='application/json')
+
+    def _route_name(self, method, parts):
+        # Collapse ids so stats group by endpoint, e.g. "GET /products/:id"
+        named = [parts[0]] + [':id' if part not in ('category', 'me', 'login', 'register', 'update-profile') else part
+                              for part in parts[1:]]
+        return f"{method} /{'/'.join(named)}"
+
+    def __call__(self, environ, start_response):
+        return self.dispatch(Request(environ))(environ, start_response)
+
+    def dispatch(self, request):
+        path = request.path
+        if path == '/__bench/stats':
+            with self._lock:
+                return self._json({'total': sum(self.calls.values()), 'routes': dict(self.calls)})
+        if path == '/__bench/reset':
+            with self._lock:
+                self.calls.clear()
+            return self._json({'ok': True})
+        if not path.startswith('/api/'):
+            return self._json({'error': 'Not found'}, 404)
+
+        parts = path[len('/api/'):].strip('/').split('/')
+        with self._lock:
+            self.calls[self._route_name(request.method, parts)] += 1
+        self._sleep()
+        return self.handle(request, parts)
+
+    def login_token(self, user):
+        now = int(time.time())
+        claims = {'userId': user['id'], 'role': user['role'], 'iat': now, 'exp': now + self.TOKEN_TTL}
+        return sign_token(claims, self.jwt_secret)
+
+    def handle(self, request, parts):
+        catalog = self.catalog
+        method = request.method
+        resource = parts[0]
+
+        if method != 'GET':
+            # Admin writes: drain the body like the real API would and echo an id
+            request.get_data()
+            if resource == 'auth' and parts[1:] == ['login']:
+                return self._json({'token': self.login_token(catalog.admin), 'user': catalog.admin})
+            if resource == 'auth' and parts[1:] == ['register']:
+                return self._json({'user': catalog.admin}, 201)
+            if resource == 'auth' and parts[1:] == ['update-profile']:
+                return self._json({'user': catalog.admin})
+            status = 201 if method == 'POST' else 200
+            key = {'categories': 'category', 'products': 'product', 'banners': 'banner'}.get(resource, 'user')
+            return self._json({key: {'id': parts[1] if len(parts) > 1 else 'new'}}, status)
+
+        if resource == 'categories':
+            return self._json({'categories': catalog.categories})
+        if resource == 'banners':
+            return self._json({'banners': catalog.banners})
+        if resource == 'users':
+            return self._json({'users': catalog.users})
+        if resource == 'auth' and parts[1:] == ['me']:
+            return self._json({'user': catalog.admin})
+        if resource == 'products':
+            if len(parts) == 3 and parts[1] == 'category':
+                return self._json({'products': [p for p in catalog.products if p['categoryId'] == parts[2]]})
+            if len(parts) == 2:
+                product = catalog.products_by_id.get(parts[1])
+                if not product:
+                    return self._json({'error': 'Product not found'}, 404)
+                return self._json({'product': product})
+            return self._json(self.list_products(request.args))
+        return self._json({'error': 'Not found'}, 404)
+
+    def list_products(self, args):
+        products = self.catalog.products
+        if args.get('category'):
+            products = [p for p in products if p['category']['slug'] == args['category']]
+        if args.get('featured') == 'true':
+            products = [p for p in products if p['featured']]
+        if args.get('search'):
+            term = args['search'].lower()
+            products = [p for p in products if term in p['name'].lower() or term in p['description'].lower()]
+        if args.get('updatedSince'):
+            products = [p for p in products if p['updatedAt'] >= args['updatedSince']]
+        sort_by = args.get('sortBy', 'newest')
+        if sort_by == 'updated':
+            products = sorted(products, key=lambda p: (p['updatedAt'], p['id']))
+        elif sort_by in ('price_asc', 'price_desc'):
+            products = sorted(products, key=lambda p: float(p['price']), reverse=sort_by == 'price_desc')
+        elif sort_by == 'name':
+            products = sorted(products, key=lambda p: p['name'])
+        page = max(int(args.get('page', 1)), 1)
+        page_size = max(int(args.get('pageSize', 20)), 1)
+        total = len(products)
+        return {
+            'products': products[(page - 1) * page_size:page * page_size],
+            'pagination': {'page': page, 'pageSize': page_size, 'total': total,
+                           'totalPages': -(-total // page_size)},
+        }
+
+
+def add_arguments(parser):
+    group = parser.add_argument_group('mock backend')
+    group.add_argument('--latency-ms', type=float, default=10.0, help='added latency per upstream call')
+    group.add_argument('--jitter-ms', type=float, default=0.0, help='+/- random jitter on the latency')
+    group.add_argument('--categories', type=int, default=6)
+    group.add_argument('--products-per-category', type=int, default=40)
+    group.add_argument('--banners', type=int, default=3)
+    group.add_argument('--image-kb', type=float, default=60.0, help='decoded size of each product image')
+    group.add_argument('--images-per-product', type=int, default=3)
+    group.add_argument('--avatar-kb', type=float, default=150.0)
+    group.add_argument('--jwt-secret', default=os.environ.get('JWT_SECRET', ''),
+                       help='secret that signs login tokens (default: $JWT_SECRET)')
+
+
+def build_app(args):
+    catalog = MockCatalog(
+        categories=args.categories,
+        products_per_category=args.products_per_category,
+        banners=args.banners,
+        image_kb=args.image_kb,
+        images_per_product=args.images_per_product,
+        avatar_kb=args.avatar_kb,
+    )
+    return MockApi(catalog, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, jwt_secret=args.jwt_secret)
+
+
+def serve(args, host='127.0.0.1', port=3999):
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = make_server(host, port, build_app(args), threaded=True)
+    print(f"Mock API listening on http://{host}:{port}/api (pid {os.getpid()})", flush=True)
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=3999)
+    add_arguments(parser)
+    cli_args = parser.parse_args()
+    serve(cli_args, cli_args.host, cli_args.port)
@@ -0,0 +1,445 @@
+"""
+Bulk product import for the admin (POST /api/admin/products/import).
+
+The upload is either a raw CSV / NDJSON body or a multipart form with the
+rows in `file` plus any number of `images` files:
+
+- Rows are parsed one at a time straight from the request stream, so a
+  catalog of thousands of products is never held in memory.
+- A row with an `id` updates that product (PUT /products/<id>, only the
+  non-empty columns), any other row creates one (POST /products). Rows are
+  written in batches of `batch_size` with at most `concurrency` writes in
+  flight per import.
+- `imageUrl` / `imageUrls` (separated by `|` in CSV) may be URLs or data
+  URIs, which are passed through, names of uploaded `images` files, or
+  paths below `image_dir`. Files are inlined as base64 data URIs, like the
+  admin form does.
+- `category` may be given as a slug or name instead of `categoryId`.
+- Every finished row yields a progress event, and a summary comes last.
+
+Progress is checkpointed per import id after every batch. Re-sending the
+same upload with the same id skips rows that were already written, so an
+interrupted import resumes after the last committed row. Rows rejected by
+the API (4xx) count as done and are reported; connection errors, 5xx and
+auth failures stop the import after the current batch so it can be retried.
+"""
+import base64
+import csv
+import hashlib
+import io
+import json
+import mimetypes
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from search import fold
+
+IMPORT_ID = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+# Columns sent to the API as they are (after type conversion)
+NUMBER_FIELDS = ('price', 'stock', 'discount')
+TEXT_FIELDS = ('name', 'description')
+TRUE_VALUES = ('1', 'true', 'yes', 'y')
+FALSE_VALUES = ('0', 'false', 'no', 'n')
+# API statuses that fail every following row as well, so the import stops instead
+STOP_STATUSES = (401, 403)
+
+
+class RowError(ValueError):
+    """A row that cannot be sent to the API; reported, and counted as done."""
+
+
+class ImportInProgress(Exception):
+    """Another request is running the same import."""
+
+
+def import_format(filename=None, mimetype=None):
+    """'csv' or 'ndjson' from an upload's file name or content type, else None."""
+    extension = os.path.splitext(filename or '')[1].lower()
+    if extension == '.csv' or mimetype in ('text/csv', 'application/csv'):
+        return 'csv'
+    if extension in ('.ndjson', '.jsonl') or mimetype in ('application/x-ndjson', 'application/jsonl',
+                                                         'application/json'):
+        return 'ndjson'
+    return None
+
+
+def _text(stream):
+    # utf-8-sig drops the BOM spreadsheet programs put in front of CSV exports
+    return io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+
+
+def iter_csv(stream):
+    """Yield (row number, dict) for the data rows of a CSV stream with a header row."""
+    for number, record in enumerate(csv.DictReader(_text(stream)), 1):
+        # Cells beyond the header end up under the None key
+        yield number, {key.strip(): value for key, value in record.items() if key}
+
+
+def iter_ndjson(stream):
+    """Yield (row number, dict or RowError) for the non-blank lines of an NDJSON stream."""
+    number = 0
+    for line in _text(stream):
+        if not line.strip():
+            continue
+        number += 1
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            yield number, RowError(f"Invalid JSON: {e}")
+            continue
+        yield number, record if isinstance(record, dict) else RowError("Expected a JSON object")
+
+
+PARSERS = {'csv': iter_csv, 'ndjson': iter_ndjson}
+
+# Image columns may hold whole base64 data URIs, far above the csv module's 128 KB default
+csv.field_size_limit(max(csv.field_size_limit(), 64 * 1024 * 1024))
+
+
+def _blank(value):
+    return value is None or (isinstance(value, str) and not value.strip())
+
+
+def _parse_bool(value, field):
+    if isinstance(value, bool):
+        return value
+    text = str(value).strip().lower()
+    if text in TRUE_VALUES:
+        return True
+    if text in FALSE_VALUES:
+        return False
+    raise RowError(f"{field}: expected true or false, got {value!r}")
+
+
+def _parse_number(value, field):
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return value
+    try:
+        number = float(str(value).strip().replace(',', ''))
+    except ValueError:
+        raise RowError(f"{field}: expected a number, got {value!r}") from None
+    return int(number) if number.is_integer() else number
+
+
+class ImportCheckpoints:
+    """Progress of each import as small JSON files in `directory`.
+
+    A checkpoint holds `committed` (every row up to it is done) and `done`
+    (finished rows above it, from a batch that was cut short).
+    """
+
+    def __init__(self, directory, max_age=7 * 24 * 3600):
+        self.directory = directory
+        self.max_age = max_age
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(key.encode('utf-8')).hexdigest() + '.json')
+
+    def load(self, key):
+        """(committed, done) of an import; (0, set()) for a new one."""
+        try:
+            with open(self._path(key)) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return 0, set()
+        return state.get('committed', 0), set(state.get('done', ()))
+
+    def save(self, key, committed, done, summary):
+        path = self._path(key)
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(temp_path, 'w') as f:
+                json.dump({'committed': committed, 'done': sorted(done), 'summary': summary}, f)
+            os.replace(temp_path, path)
+        except OSError as e:
+            print(f"Could not save import checkpoint {path}: {e}")
+
+    def lock(self, key):
+        """Open and exclusively lock the import's lock file; raises ImportInProgress if taken."""
+        lock_file = open(self._path(key) + '.lock', 'a')
+        if fcntl is not None:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                lock_file.close()
+                raise ImportInProgress(key) from None
+        return lock_file
+
+    def prune(self):
+        """Delete checkpoints of imports not touched for `max_age` seconds."""
+        cutoff = time.time() - self.max_age
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return
+        for name in names:
+            path = os.path.join(self.directory, name)
+            try:
+                if os.stat(path).st_mtime < cutoff:
+                    os.remove(path)
+            except OSError:
+                pass
+
+
+class BulkImporter:
+    """Writes parsed rows to the products API in batches with bounded concurrency.
+
+    `concurrency` is per import; `max_workers` bounds the write threads of
+    the whole process when several imports run at once.
+    """
+
+    def __init__(self, api, checkpoints, batch_size=50, concurrency=4, max_workers=16,
+                 image_dir=None, max_image_bytes=5 * 1024 * 1024):
+        self.api = api
+        self.checkpoints = checkpoints
+        self.batch_size = max(1, batch_size)
+        self.concurrency = max(1, concurrency)
+        self.image_dir = os.path.realpath(image_dir) if image_dir else None
+        self.max_image_bytes = max_image_bytes
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='bulk-import')
+        self._image_lock = threading.Lock()
+        # Rows imported by this process, by outcome ('created', 'updated', 'failed')
+        self.rows = {}
+
+    @classmethod
+    def from_env(cls, environ, instance_path, api):
+        return cls(
+            api,
+            ImportCheckpoints(environ.get('BULK_IMPORT_DIR') or os.path.join(instance_path, 'imports')),
+            batch_size=int(environ.get('BULK_IMPORT_BATCH_SIZE', 50)),
+            concurrency=int(environ.get('BULK_IMPORT_CONCURRENCY', 4)),
+            max_workers=int(environ.get('BULK_IMPORT_WORKERS', 16)),
+            image_dir=environ.get('BULK_IMPORT_IMAGE_DIR') or None,
+            max_image_bytes=int(environ.get('BULK_IMPORT_MAX_IMAGE_BYTES', 5 * 1024 * 1024)),
+        )
+
+    def run(self, key, rows, headers, categories, images=None, on_batch=None):
+        """Import `rows` ((number, dict or RowError) pairs) and yield progress events.
+
+        `key` identifies the import for checkpoints and must already be
+        locked by the caller. `categories` is the API category list used to
+        resolve `category` columns, `images` maps upload file names to file
+        objects, and `on_batch()` runs after each batch that wrote products.
+        """
+        committed, done = self.checkpoints.load(key)
+        resolver = _CategoryResolver(categories)
+        images = images or {}
+        summary = {'created': 0, 'updated': 0, 'failed': 0, 'skipped': 0}
+        batch = []
+        stopped = None
+
+        def flush():
+            nonlocal committed, stopped
+            results = []
+            try:
+                yield from self._write_batch(batch, headers, resolver, images, results)
+            finally:
+                # Also runs when the client disconnects mid-batch, so written rows are never lost
+                batch.clear()
+                written = 0
+                for result in results:
+                    status = result['status']
+                    if result.get('retry'):
+                        stopped = stopped or result['error']
+                        continue
+                    summary[status] += 1
+                    self.rows[status] = self.rows.get(status, 0) + 1
+                    written += status != 'failed'
+                    done.add(result['row'])
+                while committed + 1 in done:
+                    committed += 1
+                    done.discard(committed)
+                self.checkpoints.save(key, committed, done, summary)
+                if written and on_batch:
+                    on_batch()
+
+        try:
+            for number, record in rows:
+                if number <= committed or number in done:
+                    summary['skipped'] += 1
+                    continue
+                batch.append((number, record))
+                if len(batch) >= self.batch_size:
+                    yield from flush()
+                    if stopped:
+                        break
+            if batch and not stopped:
+                yield from flush()
+        except (csv.Error, UnicodeDecodeError) as e:
+            # The rest of the upload cannot be read; rows parsed so far are still written
+            if batch:
+                yield from flush()
+            stopped = stopped or f"Could not parse the upload: {e}"
+
+        yield {'done': not stopped, 'error': stopped, 'committed': committed, **summary}
+
+    def _write_batch(self, batch, headers, resolver, images, results):
+        """Write one batch, appending each row's event to `results` and yielding it as it finishes.
+
+        If the consumer goes away (the generator is closed), rows already
+        sent to the API are waited for and still end up in `results`.
+        """
+        pending = list(batch)
+        running = set()
+        finished = []
+        condition = threading.Condition()
+
+        def write(number, record):
+            result = self._write_row(number, record, headers, resolver, images)
+            with condition:
+                finished.append(result)
+                condition.notify()
+
+        def collect():
+            with condition:
+                while not finished:
+                    condition.wait()
+                ready = finished[:]
+                finished.clear()
+            for result in ready:
+                running.discard(result['row'])
+                results.append(result)
+            return ready
+
+        try:
+            while pending or running:
+                while pending and len(running) < self.concurrency:
+                    number, record = pending.pop(0)
+                    running.add(number)
+                    self._executor.submit(write, number, record)
+                yield from collect()
+        finally:
+            while running:
+                collect()
+
+    def _write_row(self, number, record, headers, resolver, images):
+        try:
+            if isinstance(record, RowError):
+                raise record
+            product_id, payload = self._payload(record, resolver, images)
+        except RowError as e:
+            return {'row': number, 'status': 'failed', 'error': str(e)}
+
+        try:
+            if product_id:
+                response = self.api.put(f"/products/{product_id}", json=payload, headers=headers)
+            else:
+                response = self.api.post('/products', json=payload, headers=headers)
+        except requests.exceptions.RequestException as e:
+            return {'row': number, 'status': 'failed', 'error': str(e), 'retry': True}
+        except Exception as e:
+            print(f"Bulk import of row {number} failed: {e}")
+            return {'row': number, 'status': 'failed', 'error': str(e), 'retry': True}
+
+        try:
+            data = response.json()
+        except ValueError:
+            data = {}
+        if response.status_code >= 400:
+            error = data.get('error') or data.get('message') or f"HTTP {response.status_code}"
+            result = {'row': number, 'status': 'failed', 'error': error}
+            if data.get('details'):
+                result['details'] = data['details']
+            if response.status_code >= 500 or response.status_code in STOP_STATUSES:
+                result['retry'] = True
+            return result
+        product = data.get('product') or {}
+        return {'row': number, 'status': 'updated' if product_id else 'created', 'id': product.get('id', product_id)}
+
+    # ----- rows -----
+
+    def _payload(self, record, resolver, images):
+        """(product id or None, API body) for one row; raises RowError."""
+        product_id = (str(record.get('id') or '')).strip() or None
+        payload = {}
+        for field in TEXT_FIELDS:
+            if not _blank(record.get(field)):
+                payload[field] = str(record[field]).strip()
+        for field in NUMBER_FIELDS:
+            if not _blank(record.get(field)):
+                payload[field] = _parse_number(record[field], field)
+        if not _blank(record.get('featured')):
+            payload['featured'] = _parse_bool(record['featured'], 'featured')
+
+        if not _blank(record.get('categoryId')):
+            payload['categoryId'] = str(record['categoryId']).strip()
+        elif not _blank(record.get('category')):
+            payload['categoryId'] = resolver.resolve(str(record['category']))
+
+        image_urls = record.get('imageUrls')
+        if isinstance(image_urls, str):
+            image_urls = [url for url in image_urls.split('|') if url.strip()]
+        if image_urls:
+            payload['imageUrls'] = [self._image(str(url).strip(), images) for url in image_urls]
+        if not _blank(record.get('imageUrl')):
+            payload['imageUrl'] = self._image(str(record['imageUrl']).strip(), images)
+        elif payload.get('imageUrls') and not product_id:
+            payload['imageUrl'] = payload['imageUrls'][0]
+
+        if not product_id:
+            missing = [field for field in ('name', 'price', 'categoryId') if field not in payload]
+            if missing:
+                raise RowError(f"Missing {', '.join(missing)} for a new product")
+        elif not payload:
+            raise RowError("Nothing to update")
+        return product_id, payload
+
+    def _image(self, value, images):
+        """A data URI or URL for the API from an image column value; raises RowError."""
+        if value.startswith(('data:', 'http://', 'https://')):
+            return value
+        name = value[len('file://'):] if value.startswith('file://') else value
+
+        upload = images.get(os.path.basename(name))
+        if upload is not None:
+            # The same upload may be used by rows written in parallel
+            with self._image_lock:
+                upload.seek(0)
+                body = upload.read(self.max_image_bytes + 1)
+        elif self.image_dir:
+            path = os.path.realpath(os.path.join(self.image_dir, name))
+            if os.path.commonpath([path, self.image_dir]) != self.image_dir:
+                raise RowError(f"Image {value!r} is outside the import image directory")
+            try:
+                with open(path, 'rb') as f:
+                    body = f.read(self.max_image_bytes + 1)
+            except OSError:
+                raise RowError(f"Image {value!r} not found") from None
+        else:
+            raise RowError(f"Image {value!r} was not uploaded (local paths need BULK_IMPORT_IMAGE_DIR)")
+
+        if len(body) > self.max_image_bytes:
+            raise RowError(f"Image {value!r} is larger than {self.max_image_bytes} bytes")
+        mimetype = mimetypes.guess_type(name)[0]
+        if not mimetype or not mimetype.startswith('image/'):
+            raise RowError(f"{value!r} is not an image")
+        return f"data:{mimetype};base64,{base64.b64encode(body).decode('ascii')}"
+
+
+class _CategoryResolver:
+    """Category id from an id, slug or (diacritic-insensitive) name."""
+
+    def __init__(self, categories):
+        self._ids = {}
+        for category in categories:
+            for key in (category.get('id'), category.get('slug'), fold(category.get('name'))):
+                if key:
+                    self._ids.setdefault(key, category['id'])
+
+    def resolve(self, value):
+        value = value.strip()
+        category_id = self._ids.get(value) or self._ids.get(fold(value))
+        if category_id is None:
+            raise RowError(f"Unknown category {value!r}")
+        return category_id
@@ -0,0 +1,168 @@
+"""
+In-process caches used by the Flask frontend to avoid hitting the API on
+every request.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+
+class StaleWhileRevalidate:
+    """Caches the result of a single loader function.
+
+    - Younger than `ttl`: served from memory.
+    - Older than `ttl` but younger than `max_stale`: the stale value is
+      served immediately and one background thread refreshes it.
+    - Missing, invalidated or older than `max_stale`: loaded synchronously.
+
+    If a refresh fails the previous value is kept, so a flaky backend does
+    not blank out the data. `loader` should raise on failure.
+    """
+
+    def __init__(self, loader, ttl=60.0, max_stale=600.0, name='cache'):
+        self.loader = loader
+        self.ttl = ttl
+        self.max_stale = max(max_stale, ttl)
+        self.name = name
+        self._value = None
+        self._loaded_at = None
+        self._version = 0
+        self._lock = threading.Lock()
+        self._refreshing = False
+        self.hits = 0
+        self.misses = 0
+
+    def get(self):
+        with self._lock:
+            value, loaded_at = self._value, self._loaded_at
+        if loaded_at is None:
+            self.misses += 1
+            return self._load()
+
+        age = time.monotonic() - loaded_at
+        if age < self.ttl:
+            self.hits += 1
+            return value
+        if age < self.max_stale:
+            self.hits += 1
+            self._refresh_in_background()
+            return value
+        self.misses += 1
+        try:
+            return self._load()
+        except Exception as e:
+            print(f"Could not refresh {self.name}, serving stale data: {e}")
+            return value
+
+    def _load(self):
+        with self._lock:
+            version = self._version
+        value = self.loader()
+        self._store(value, version)
+        return value
+
+    def _store(self, value, version):
+        with self._lock:
+            # Drop results that raced with an invalidate()
+            if version == self._version:
+                self._value = value
+                self._loaded_at = time.monotonic()
+
+    def _refresh_in_background(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        threading.Thread(target=self._background_refresh, daemon=True).start()
+
+    def _background_refresh(self):
+        try:
+            self._load()
+        except Exception as e:
+            print(f"Background refresh of {self.name} failed: {e}")
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def invalidate(self):
+        """Forget the cached value; the next get() loads it again."""
+        with self._lock:
+            self._version += 1
+            self._value = None
+            self._loaded_at = None
+
+
+class LRUCache:
+    """Thread-safe LRU mapping bounded by entry count and/or total bytes.
+
+    `size` passed to set() is the caller's estimate of the entry's memory
+    footprint; it only matters when `max_bytes` is given.
+    """
+
+    def __init__(self, max_items=None, max_bytes=None):
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self._data = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._data:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self._data.move_to_end(key)
+            return self._data[key][0]
+
+    def set(self, key, value, size=0):
+        with self._lock:
+            if self.max_bytes is not None and size > self.max_bytes:
+                # Never let one oversized entry flush the whole cache
+                self._discard(key)
+                return False
+            self._discard(key)
+            self._data[key] = (value, size)
+            self._bytes += size
+            self._evict()
+            return True
+
+    def pop(self, key, default=None):
+        with self._lock:
+            if key not in self._data:
+                return default
+            value, size = self._data.pop(key)
+            self._bytes -= size
+            return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def items(self):
+        """Snapshot of (key, value) pairs, least recently used first."""
+        with self._lock:
+            return [(key, value) for key, (value, _) in self._data.items()]
+
+    def __len__(self):
+        return len(self._data)
+
+    @property
+    def total_bytes(self):
+        return self._bytes
+
+    def _discard(self, key):
+        if key in self._data:
+            _, size = self._data.pop(key)
+            self._bytes -= size
+
+    def _evict(self):
+        while self._data and (
+            (self.max_items is not None and len(self._data) > self.max_items)
+            or (self.max_bytes is not None and self._bytes > self.max_bytes)
+        ):
+            _, (_, size) = self._data.popitem(last=False)
+            self._bytes -= size
@@ -0,0 +1,139 @@
+"""
+HTTP validators and compression for rendered pages.
+
+- `data_etag()` builds a strong ETag from the versions of the data a page
+  shows (product/banner/category ids with their `updatedAt`, the template
+  sources, the signed-in user), so a view can answer `If-None-Match` with
+  304 as soon as it knows its data, without rendering the template.
+- `Compressor` gzip-encodes (or brotli-encodes, when the optional 'brotli'
+  package is installed) text responses. Compressed bodies of pages that
+  carry an ETag are kept in an LRU keyed by URL + ETag + encoding, so hot
+  anonymous pages are compressed once rather than on every request.
+
+As nginx does, compressed responses carry the weak form of the ETag: the
+bytes differ from the identity representation, while `If-None-Match` uses
+weak comparison, so both forms still revalidate.
+"""
+import gzip
+import hashlib
+import json
+
+from cache import LRUCache
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+COMPRESSIBLE_MIMETYPES = frozenset({
+    'text/html', 'text/plain', 'text/css', 'text/javascript', 'application/javascript',
+    'application/json', 'image/svg+xml',
+})
+
+
+def data_etag(*parts):
+    """Strong ETag value (unquoted) for a page built from JSON-serializable `parts`."""
+    payload = json.dumps(parts, sort_keys=True, default=str, separators=(',', ':'))
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()[:32]
+
+
+def record_versions(records):
+    """(id, updatedAt) pairs of API records, given as dicts or `models` records."""
+    versions = []
+    for record in records or ():
+        if isinstance(record, dict):
+            versions.append((record.get('id'), record.get('updatedAt')))
+        else:
+            versions.append((record.id, record.updatedAt))
+    return versions
+
+
+_template_fingerprints = {}
+
+
+def template_fingerprint(jinja_env):
+    """Hash of all template sources; computed once unless templates auto-reload."""
+    key = id(jinja_env)
+    if key in _template_fingerprints and not jinja_env.auto_reload:
+        return _template_fingerprints[key]
+    digest = hashlib.sha1()
+    for name in jinja_env.list_templates():
+        source, _, _ = jinja_env.loader.get_source(jinja_env, name)
+        digest.update(name.encode('utf-8'))
+        digest.update(source.encode('utf-8'))
+    _template_fingerprints[key] = digest.hexdigest()[:16]
+    return _template_fingerprints[key]
+
+
+class Compressor:
+    """Content-Encoding for text responses, with a cache of pre-compressed bodies."""
+
+    def __init__(self, min_size=1024, gzip_level=6, brotli_quality=5, cache_bytes=32 * 1024 * 1024):
+        self.min_size = min_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self._compressed = LRUCache(max_bytes=cache_bytes)
+
+    @classmethod
+    def from_env(cls, environ):
+        return cls(
+            min_size=int(environ.get('COMPRESS_MIN_SIZE', 1024)),
+            gzip_level=int(environ.get('COMPRESS_GZIP_LEVEL', 6)),
+            brotli_quality=int(environ.get('COMPRESS_BROTLI_QUALITY', 5)),
+            cache_bytes=int(environ.get('COMPRESS_CACHE_MAX_BYTES', 32 * 1024 * 1024)),
+        )
+
+    @property
+    def hits(self):
+        return self._compressed.hits
+
+    @property
+    def misses(self):
+        return self._compressed.misses
+
+    def choose_encoding(self, accept_encodings):
+        """Best supported encoding accepted by the client, or None."""
+        if brotli is not None and accept_encodings['br']:
+            return 'br'
+        if accept_encodings['gzip']:
+            return 'gzip'
+        return None
+
+    def compress(self, data, encoding):
+        if encoding == 'br':
+            return brotli.compress(data, quality=self.brotli_quality)
+        return gzip.compress(data, compresslevel=self.gzip_level, mtime=0)
+
+    def is_compressible(self, response):
+        return (response.status_code == 200
+                and not response.direct_passthrough
+                and not response.is_streamed
+                and 'Content-Encoding' not in response.headers
+                and response.mimetype in COMPRESSIBLE_MIMETYPES)
+
+    def apply(self, request, response, cacheable=False):
+        """Compress `response` in place if the client accepts it; returns the response."""
+        if not self.is_compressible(response):
+            return response
+        response.vary.add('Accept-Encoding')
+        encoding = self.choose_encoding(request.accept_encodings)
+        if encoding is None:
+            return response
+        data = response.get_data()
+        if len(data) < self.min_size:
+            return response
+
+        etag, weak = response.get_etag()
+        key = (request.full_path, etag, encoding) if cacheable and etag else None
+        body = self._compressed.get(key) if key else None
+        if body is None:
+            body = self.compress(data, encoding)
+            if key:
+                self._compressed.set(key, body, size=len(body) + len(request.full_path))
+
+        response.set_data(body)
+        response.headers['Content-Encoding'] = encoding
+        if etag:
+            response.set_etag(etag, weak=True)
+        return response
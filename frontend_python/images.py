@@ -0,0 +1,248 @@
+"""
+Thumbnails for the base64 data-URI images stored in the database.
+
+Product, category and banner images arrive from the API as full
+`data:image/...;base64,...` strings. Inlining them makes list pages
+megabytes large, so templates instead reference `/img/<digest>/<size>.<fmt>`
+URLs produced by the `thumbnail_url` filter:
+
+- the data URI is decoded once and stored on disk under its content hash;
+- thumbnails are generated on first request for a fixed set of size buckets
+  and kept in the same disk cache, which is trimmed (least recently used
+  first) once it grows beyond `max_bytes`. Thumbnails go first; originals
+  are only deleted if that is not enough, since pages and search results
+  already reference their URLs;
+- an evicted original is written back when its data URI is registered
+  again, i.e. when a page using it is rendered. Until then `thumbnail()`
+  returns None, and the caller has to get the data URI registered again
+  (see the image route in app.py). Data URIs themselves are not kept in
+  memory, as they can be megabytes each;
+- URLs are content-addressed, so generated thumbnails can be cached as
+  immutable.
+
+Only raster formats are resized. Other data URIs (SVG) are left inline, and
+a source that Pillow cannot decode, or refuses to (decompression bombs), is
+served as it is for every size. Such fallbacks are not immutable, as the
+failure may be transient; Pillow is retried after `retry_after` seconds.
+
+Resizing needs Pillow. Without it the original image is served for every
+size, which still keeps the base64 out of the HTML.
+"""
+import base64
+import binascii
+import hashlib
+import os
+import threading
+import time
+from collections import namedtuple
+
+from cache import LRUCache
+
+try:
+    from PIL import Image
+except ImportError:  # pragma: no cover - optional dependency
+    Image = None
+
+
+SIZE_BUCKETS = (160, 400, 1200)
+# Data-URI types that are resized; anything else (e.g. image/svg+xml) stays inline
+RASTER_MIMETYPES = frozenset({
+    'image/png', 'image/jpeg', 'image/jpg', 'image/gif', 'image/webp', 'image/bmp', 'image/tiff',
+})
+FORMATS = {
+    'webp': ('WEBP', 'image/webp'),
+    'jpg': ('JPEG', 'image/jpeg'),
+}
+
+# `immutable` is False when the original is served in place of the thumbnail
+Thumbnail = namedtuple('Thumbnail', 'path mimetype immutable')
+
+
+def decode_data_uri(data_uri):
+    """Split a `data:<mime>;base64,<data>` URI into (mimetype, bytes); None if not one"""
+    if not data_uri or not data_uri.startswith('data:'):
+        return None
+    header, _, payload = data_uri.partition(',')
+    mimetype = header[len('data:'):].split(';')[0] or 'application/octet-stream'
+    if not header.endswith(';base64'):
+        return None
+    try:
+        return mimetype, base64.b64decode(payload)
+    except (binascii.Error, ValueError):
+        return None
+
+
+class ThumbnailStore:
+    """Content-hash keyed disk cache of source images and their thumbnails."""
+
+    def __init__(self, cache_dir, max_bytes=512 * 1024 * 1024, quality=80, max_known=8192, retry_after=60.0):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.quality = quality
+        self.retry_after = retry_after
+        # (hash, length) of a data URI -> digest. Python caches str hashes, so
+        # repeat lookups for the same (memoized) product record are O(1)
+        self._digests = LRUCache(max_items=max_known)
+        # thumbnail name -> monotonic time Pillow last failed on it
+        self._failures = LRUCache(max_items=max_known)
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        self._total_bytes = self._scan_size()
+
+    @property
+    def hits(self):
+        return self._digests.hits
+
+    @property
+    def misses(self):
+        return self._digests.misses
+
+    def _scan_size(self):
+        total = 0
+        with os.scandir(self.cache_dir) as entries:
+            for entry in entries:
+                if entry.is_file():
+                    total += entry.stat().st_size
+        return total
+
+    def _path(self, name):
+        return os.path.join(self.cache_dir, name)
+
+    def register(self, data_uri):
+        """Store a raster data-URI image on disk (once) and return its digest, or None."""
+        # Process-salted 64-bit hash plus length: a collision is negligible, and the URI is not pinned
+        key = (hash(data_uri), len(data_uri))
+        digest = self._digests.get(key)
+        if digest is not None and os.path.exists(self._path(f"{digest}.src")):
+            return digest
+
+        decoded = decode_data_uri(data_uri)
+        if not decoded or decoded[0].lower() not in RASTER_MIMETYPES:
+            return None
+        _, body = decoded
+        digest = hashlib.sha256(body).hexdigest()[:32]
+        if not os.path.exists(self._path(f"{digest}.src")):
+            self._write(f"{digest}.src", body)
+        self._digests.set(key, digest)
+        return digest
+
+    def _source(self, digest):
+        """Path of the original image, or None if it is unknown or was evicted."""
+        source_path = self._path(f"{digest}.src")
+        return source_path if os.path.exists(source_path) else None
+
+    def _original(self, source_path):
+        self._touch(source_path)
+        return Thumbnail(source_path, sniff_mimetype(source_path), False)
+
+    def thumbnail(self, digest, size, fmt):
+        """Return the `Thumbnail` for a size bucket, generating it if needed; None if the source is unknown."""
+        name = f"{digest}_{size}.{fmt}"
+        path = self._path(name)
+        if Image is not None and os.path.exists(path):
+            self._touch(path)
+            return Thumbnail(path, FORMATS[fmt][1], True)
+        source_path = self._source(digest)
+        if source_path is None:
+            return None
+        if Image is None:
+            # No Pillow: serve the original image for every size
+            return self._original(source_path)
+        failed_at = self._failures.get(name)
+        if failed_at is not None and time.monotonic() - failed_at < self.retry_after:
+            return self._original(source_path)
+
+        pil_format, mimetype = FORMATS[fmt]
+        tmp_path = self._tmp_path(path)
+        try:
+            with Image.open(source_path) as image:
+                image.thumbnail((size, size))
+                if pil_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+                    image = image.convert('RGB')
+                image.save(tmp_path, pil_format, quality=self.quality)
+        except (OSError, ValueError, Image.DecompressionBombError) as e:
+            # Serve the original rather than a broken image
+            print(f"Could not create thumbnail {name}, serving the original: {e}")
+            self._discard(tmp_path)
+            self._failures.set(name, time.monotonic())
+            # The original may have been evicted while Pillow read it
+            source_path = self._source(digest)
+            if source_path is None:
+                return None
+            return self._original(source_path)
+        self._failures.pop(name)
+        self._commit(tmp_path, path)
+        return Thumbnail(path, mimetype, True)
+
+    @staticmethod
+    def _tmp_path(path):
+        # Thread ids are only unique within a process, and workers share the cache
+        return f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+    @staticmethod
+    def _discard(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def _write(self, name, body):
+        path = self._path(name)
+        tmp_path = self._tmp_path(path)
+        with open(tmp_path, 'wb') as f:
+            f.write(body)
+        self._commit(tmp_path, path)
+
+    def _commit(self, tmp_path, path):
+        # Atomic rename so other workers never read half-written files
+        size = os.path.getsize(tmp_path)
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._total_bytes += size
+            over_budget = self._total_bytes > self.max_bytes
+        if over_budget:
+            self._evict()
+
+    @staticmethod
+    def _touch(path):
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    def _evict(self):
+        """Delete least recently used thumbnails, then originals, until the cache is at 90% of its budget."""
+        with self._lock:
+            files = []
+            with os.scandir(self.cache_dir) as entries:
+                for entry in entries:
+                    if entry.is_file() and not entry.name.endswith('.tmp'):
+                        stat = entry.stat()
+                        files.append((entry.name.endswith('.src'), stat.st_mtime, stat.st_size, entry.path))
+            total = sum(size for _, _, size, _ in files)
+            target = self.max_bytes * 0.9
+            # Thumbnails can be regenerated; originals are needed to serve any size
+            for _, _, size, path in sorted(files):
+                if total <= target:
+                    break
+                try:
+                    os.remove(path)
+                    total -= size
+                except OSError:
+                    pass
+            self._total_bytes = total
+
+
+def sniff_mimetype(path):
+    """Guess an image mimetype from its first bytes (used when Pillow is missing)"""
+    with open(path, 'rb') as f:
+        head = f.read(12)
+    if head.startswith(b'\x89PNG'):
+        return 'image/png'
+    if head.startswith(b'\xff\xd8'):
+        return 'image/jpeg'
+    if head.startswith(b'GIF8'):
+        return 'image/gif'
+    if head.startswith(b'RIFF') and head[8:12] == b'WEBP':
+        return 'image/webp'
+    return 'application/octet-stream'
@@ -0,0 +1,263 @@
+"""
+Lightweight in-process instrumentation for the Flask frontend.
+
+- Counters and histograms rendered in the Prometheus text format by /metrics.
+  Values are per process; with several gunicorn workers scrape each worker
+  or aggregate in Prometheus.
+- `RequestTimings` collects the upstream calls and template renders of the
+  current request (via a ContextVar, so calls made from FanOut threads are
+  included) for the optional `Server-Timing` header.
+- `SlowRequestProfiler` samples the stacks of in-flight requests from a
+  background thread and prints the hottest stacks of requests slower than
+  a threshold. It costs nothing unless enabled.
+"""
+import bisect
+import contextvars
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter as _StackCounter
+
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (1024, 10 * 1024, 100 * 1024, 512 * 1024, 1024 * 1024, 4 * 1024 * 1024, 16 * 1024 * 1024)
+
+
+def _format_labels(names, values):
+    if not names:
+        return ''
+    pairs = ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return '{' + pairs + '}'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Counter:
+    """Monotonic counter with optional labels."""
+
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        for labels, value in items:
+            yield self.name, _format_labels(self.labelnames, labels), value
+
+
+class Histogram:
+    """Cumulative-bucket histogram with optional labels."""
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def samples(self):
+        with self._lock:
+            items = [(labels, (list(counts), total, count)) for labels, (counts, total, count) in self._series.items()]
+        for labels, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                yield (f'{self.name}_bucket',
+                       _format_labels(self.labelnames + ('le',), labels + (le,)), cumulative)
+            yield f'{self.name}_sum', _format_labels(self.labelnames, labels), total
+            yield f'{self.name}_count', _format_labels(self.labelnames, labels), count
+
+
+class Registry:
+    """Holds metrics plus collectors evaluated at scrape time."""
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def counter(self, name, documentation, labelnames=()):
+        metric = Counter(name, documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        metric = Histogram(name, documentation, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def register_collector(self, collector):
+        """`collector()` returns (name, kind, documentation, [(labels_dict, value), ...]) tuples."""
+        self._collectors.append(collector)
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.extend(f'{name}{labels} {value}' for name, labels, value in metric.samples())
+        for collector in self._collectors:
+            for name, kind, documentation, values in collector():
+                lines.append(f'# HELP {name} {documentation}')
+                lines.append(f'# TYPE {name} {kind}')
+                for labels, value in values:
+                    lines.append(f'{name}{_format_labels(tuple(labels), tuple(labels.values()))} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+_ID_SEGMENT = re.compile(r'^(?=.*\d)[A-Za-z0-9_-]{6,}$')
+_KEYWORDS = {'products', 'categories', 'banners', 'users', 'auth', 'category', 'me', 'login', 'register',
+             'update-profile'}
+
+
+def endpoint_label(path):
+    """Collapse ids in an API path so it can be used as a low-cardinality label.
+
+    '/products/clx1abc2/?x=1' -> '/products/:id', '/products/category/ck9..' -> '/products/category/:id'
+    """
+    path = path.split('?', 1)[0]
+    segments = [segment for segment in path.split('/') if segment]
+    named = [segment if segment in _KEYWORDS or not _ID_SEGMENT.match(segment) and len(segment) < 40 else ':id'
+             for segment in segments]
+    return '/' + '/'.join(named)
+
+
+class RequestTimings:
+    """Per-request upstream/template timing totals for the Server-Timing header."""
+
+    _current = contextvars.ContextVar('request_timings', default=None)
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.upstream_calls = 0
+        self.upstream_seconds = 0.0
+        self.render_seconds = 0.0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def start(cls):
+        timings = cls()
+        cls._current.set(timings)
+        return timings
+
+    @classmethod
+    def current(cls):
+        return cls._current.get()
+
+    def add_upstream(self, seconds):
+        with self._lock:
+            self.upstream_calls += 1
+            self.upstream_seconds += seconds
+
+    def add_render(self, seconds):
+        with self._lock:
+            self.render_seconds += seconds
+
+    def header(self):
+        total = (time.perf_counter() - self.started) * 1000
+        return (f'upstream;dur={self.upstream_seconds * 1000:.1f};desc="{self.upstream_calls} API calls", '
+                f'render;dur={self.render_seconds * 1000:.1f}, '
+                f'total;dur={total:.1f}')
+
+
+class SlowRequestProfiler:
+    """Sampling profiler that reports where slow requests spent their time.
+
+    While enabled, a daemon thread snapshots the stack of every registered
+    request thread each `interval` seconds. When a request finishes slower
+    than `threshold` seconds its most frequent stacks are printed and, if
+    `output_dir` is set, written in collapsed-stack format (usable with
+    flamegraph.pl / speedscope).
+    """
+
+    def __init__(self, threshold=1.0, interval=0.005, top=5, output_dir=None):
+        self.threshold = threshold
+        self.interval = interval
+        self.top = top
+        self.output_dir = output_dir
+        self._active = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self.enabled = False
+
+    def enable(self):
+        if self.enabled:
+            return
+        self.enabled = True
+        if self.output_dir:
+            os.makedirs(self.output_dir, exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name='slow-request-profiler', daemon=True)
+        self._thread.start()
+
+    def disable(self):
+        self.enabled = False
+        with self._lock:
+            self._active.clear()
+
+    def begin(self):
+        if self.enabled:
+            with self._lock:
+                self._active[threading.get_ident()] = _StackCounter()
+
+    def end(self, label, elapsed):
+        if not self.enabled:
+            return
+        with self._lock:
+            stacks = self._active.pop(threading.get_ident(), None)
+        if stacks is None or elapsed < self.threshold or not stacks:
+            return
+        total = sum(stacks.values())
+        print(f"Slow request {label}: {elapsed * 1000:.0f} ms, {total} samples")
+        for stack, count in stacks.most_common(self.top):
+            print(f"  {count / total:6.1%}  {stack.rsplit(';', 1)[-1]}")
+        if self.output_dir:
+            name = re.sub(r'[^A-Za-z0-9_.-]+', '_', label)[:80]
+            path = os.path.join(self.output_dir, f"{int(time.time() * 1000)}_{name}.collapsed")
+            with open(path, 'w') as f:
+                f.writelines(f"{stack} {count}\n" for stack, count in stacks.items())
+
+    def _run(self):
+        while self.enabled:
+            time.sleep(self.interval)
+            frames = sys._current_frames()
+            with self._lock:
+                for ident, stacks in self._active.items():
+                    frame = frames.get(ident)
+                    if frame is not None:
+                        stacks[self._collapse(frame)] += 1
+
+    @staticmethod
+    def _collapse(frame):
+        parts = []
+        while frame is not None:
+            code = frame.f_code
+            parts.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+            frame = frame.f_back
+        return ';'.join(reversed(parts))
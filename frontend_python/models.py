@@ -0,0 +1,134 @@
+"""
+Normalized records for data returned by the backend API.
+
+The API serializes Prisma decimals as strings ("129.99") and leaves optional
+fields out, so every route used to coerce prices itself. `ProductNormalizer`
+parses a product once into a compact read-only record and memoizes it by
+(id, updatedAt) plus the version of its embedded category: products that come
+back unchanged, e.g. in cached catalog data or on another page, are not
+parsed again. Renaming a category does not touch its products' `updatedAt`,
+hence the category part of the key.
+
+Records are dataclasses, so Jinja attribute access keeps working and Flask's
+`tojson` serializes them like the original dicts.
+"""
+from dataclasses import dataclass
+
+from cache import LRUCache
+
+
+def _to_float(value, default=0.0):
+    if value is None:
+        return default
+    try:
+        return float(value)
+    except (ValueError, TypeError):
+        return default
+
+
+def _to_int(value, default=0):
+    if value is None:
+        return default
+    try:
+        return int(value)
+    except (ValueError, TypeError):
+        return default
+
+
+@dataclass(frozen=True, slots=True)
+class ProductCategory:
+    id: str
+    name: str
+    slug: str
+    description: str = None
+    imageUrl: str = None
+
+    @classmethod
+    def from_api(cls, data):
+        if not data:
+            return None
+        return cls(
+            id=data.get('id'),
+            name=data.get('name', ''),
+            slug=data.get('slug', ''),
+            description=data.get('description'),
+            imageUrl=data.get('imageUrl'),
+        )
+
+
+@dataclass(frozen=True, slots=True)
+class Product:
+    id: str
+    name: str
+    slug: str
+    description: str
+    price: float
+    discount: float
+    stock: int
+    imageUrl: str
+    imageUrls: tuple
+    featured: bool
+    categoryId: str
+    category: ProductCategory
+    createdAt: str
+    updatedAt: str
+
+    @classmethod
+    def from_api(cls, data):
+        category = ProductCategory.from_api(data.get('category'))
+        return cls(
+            id=data.get('id'),
+            name=data.get('name', ''),
+            slug=data.get('slug', ''),
+            description=data.get('description') or '',
+            price=_to_float(data.get('price')),
+            discount=_to_float(data.get('discount')),
+            stock=_to_int(data.get('stock')),
+            imageUrl=data.get('imageUrl') or '',
+            imageUrls=tuple(data.get('imageUrls') or ()),
+            featured=bool(data.get('featured')),
+            categoryId=data.get('categoryId') or (category.id if category else None),
+            category=category,
+            createdAt=data.get('createdAt'),
+            updatedAt=data.get('updatedAt'),
+        )
+
+
+class ProductNormalizer:
+    """Turns API product dicts into `Product` records, memoized by version."""
+
+    def __init__(self, max_items=4096):
+        self._memo = LRUCache(max_items=max_items)
+
+    @property
+    def hits(self):
+        return self._memo.hits
+
+    @property
+    def misses(self):
+        return self._memo.misses
+
+    def normalize(self, data):
+        if not data:
+            return None
+        if isinstance(data, Product):
+            return data
+        version = data.get('updatedAt')
+        if not version:
+            return Product.from_api(data)
+        category = data.get('category') or {}
+        key = (data.get('id'), version, category.get('id'), category.get('updatedAt'),
+               category.get('slug'), category.get('name'))
+        product = self._memo.get(key)
+        if product is None:
+            product = Product.from_api(data)
+            self._memo.set(key, product)
+        return product
+
+    def clear(self):
+        self._memo.clear()
+
+    def normalize_many(self, items):
+        """Normalize a whole API product list in one pass."""
+        normalize = self.normalize
+        return [product for product in map(normalize, items or ()) if product is not None]
@@ -0,0 +1,202 @@
+"""
+Full-page cache for the public catalog pages (home, category, product detail).
+
+Only anonymous GET requests are cached. Every entry carries tags such as
+'products' or 'banners'; the admin API proxies invalidate those tags after
+a successful write so edits show up immediately, and a TTL bounds how long
+changes made outside this app can go unnoticed.
+
+Two storage backends are available:
+- MemoryPageCacheBackend: per-process LRU with a memory budget (default).
+- RedisPageCacheBackend: shared by all gunicorn workers, and kept across
+  deploys (`flask clear-page-cache` empties it). It only needs a client with
+  the redis-py methods get/set/sadd/expire/smembers/delete/scan_iter, so a
+  local stand-in object can replace a real Redis server.
+"""
+import time
+from functools import wraps
+from urllib.parse import urlencode
+
+from flask import request, session, make_response, g
+
+from cache import LRUCache
+
+
+class MemoryPageCacheBackend:
+    """In-process page store, LRU-evicted once `max_bytes` is exceeded."""
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, max_items=None):
+        self._entries = LRUCache(max_items=max_items, max_bytes=max_bytes)
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry['expires'] <= time.monotonic():
+            self._entries.pop(key)
+            return None
+        return entry['page']
+
+    def set(self, key, page, tags, ttl):
+        entry = {'page': page, 'tags': frozenset(tags), 'expires': time.monotonic() + ttl}
+        self._entries.set(key, entry, size=len(page[0]) + len(key))
+
+    def invalidate_tags(self, tags):
+        tags = set(tags)
+        for key, entry in self._entries.items():
+            if entry['tags'] & tags:
+                self._entries.pop(key)
+
+    def clear(self):
+        self._entries.clear()
+
+
+class RedisPageCacheBackend:
+    """Page store shared between workers through a Redis-compatible client."""
+
+    def __init__(self, client, prefix='pagecache:'):
+        self.client = client
+        self.prefix = prefix
+
+    @classmethod
+    def from_url(cls, url, prefix='pagecache:'):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("PAGE_CACHE_BACKEND=redis requires the 'redis' package (pip install redis)")
+        return cls(redis.Redis.from_url(url), prefix=prefix)
+
+    def get(self, key):
+        blob = self.client.get(self.prefix + key)
+        if blob is None:
+            return None
+        header, _, body = blob.partition(b'\n')
+        status, mimetype, etag = header.decode('ascii').split(' ', 2)
+        return body, int(status), mimetype, etag or None
+
+    def set(self, key, page, tags, ttl):
+        body, status, mimetype, etag = page
+        ttl = max(1, int(ttl))
+        self.client.set(self.prefix + key, f"{status} {mimetype} {etag or ''}\n".encode('ascii') + body, ex=ttl)
+        for tag in tags:
+            tag_key = f"{self.prefix}tag:{tag}"
+            self.client.sadd(tag_key, key)
+            self.client.expire(tag_key, ttl)
+
+    def invalidate_tags(self, tags):
+        for tag in tags:
+            tag_key = f"{self.prefix}tag:{tag}"
+            keys = [self.prefix + (k.decode() if isinstance(k, bytes) else k)
+                    for k in self.client.smembers(tag_key)]
+            self.client.delete(*keys, tag_key)
+
+    def clear(self, batch_size=500):
+        """Delete every page and tag set under the prefix."""
+        batch = []
+        # SCAN walks the keyspace incrementally instead of blocking Redis like KEYS would
+        for key in self.client.scan_iter(match=self.prefix + '*', count=batch_size):
+            batch.append(key)
+            if len(batch) >= batch_size:
+                self.client.delete(*batch)
+                batch = []
+        if batch:
+            self.client.delete(*batch)
+
+
+class PageCache:
+    """Caches rendered pages for anonymous visitors, keyed by path + query."""
+
+    def __init__(self, backend=None, ttl=60.0):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_env(cls, environ):
+        kind = environ.get('PAGE_CACHE_BACKEND', 'memory').lower()
+        ttl = float(environ.get('PAGE_CACHE_TTL', 60))
+        if kind == 'none':
+            return cls(None, ttl)
+        if kind == 'redis':
+            backend = RedisPageCacheBackend.from_url(environ.get('PAGE_CACHE_REDIS_URL', 'redis://localhost:6379/0'))
+        else:
+            backend = MemoryPageCacheBackend(max_bytes=int(environ.get('PAGE_CACHE_MAX_BYTES', 64 * 1024 * 1024)))
+        return cls(backend, ttl)
+
+    @property
+    def enabled(self):
+        return self.backend is not None
+
+    @staticmethod
+    def cache_key():
+        """Route + normalized query string, so ?a=1&b=2 and ?b=2&a=1 share an entry"""
+        query = urlencode(sorted(request.args.items(multi=True)))
+        return f"{request.path}?{query}" if query else request.path
+
+    @staticmethod
+    def is_cacheable_request():
+        # Logged-in pages show user data; pending flashes are rendered once
+        return (request.method == 'GET'
+                and 'current_user' not in session
+                and '_flashes' not in session)
+
+    def lookup(self):
+        """Cached response for the current request, or None on a miss."""
+        page = self.backend.get(self.cache_key())
+        if page is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        body, status, mimetype, etag = page
+        response = make_response(body, status)
+        response.mimetype = mimetype
+        response.headers['X-Cache'] = 'HIT'
+        if etag:
+            # Revalidation of a cached page is answered without touching the view
+            response.set_etag(etag)
+            response.cache_control.no_cache = True
+            response.make_conditional(request)
+        return response
+
+    def store(self, response, tags):
+        """Cache a freshly rendered response for the current request, if it is a complete page.
+
+        Pages rendered while backend calls failed or were shed (`g.upstream_failed`)
+        show fallback data and are not cached.
+        """
+        if (response.status_code == 200 and not response.direct_passthrough
+                and not response.is_streamed and not session.modified
+                and not g.get('upstream_failed')):
+            etag, _ = response.get_etag()
+            self.backend.set(self.cache_key(), (response.get_data(), response.status_code, response.mimetype, etag),
+                             tags, self.ttl)
+        response.headers['X-Cache'] = 'MISS'
+        return response
+
+    def cached(self, tags):
+        """Decorator caching a view's rendered page under the given tags.
+
+        The tags are kept on the view as `page_cache_tags`, so the ASGI
+        serving mode can apply the same caching to its async views.
+        """
+        def decorator(f):
+            @wraps(f)
+            def decorated_function(*args, **kwargs):
+                if not self.enabled or not self.is_cacheable_request():
+                    return f(*args, **kwargs)
+                response = self.lookup()
+                if response is not None:
+                    return response
+                return self.store(make_response(f(*args, **kwargs)), tags)
+            decorated_function.page_cache_tags = tuple(tags)
+            return decorated_function
+        return decorator
+
+    def invalidate(self, *tags):
+        if self.enabled:
+            self.backend.invalidate_tags(tags)
+
+    def clear(self):
+        if self.enabled:
+            self.backend.clear()
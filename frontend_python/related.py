@@ -0,0 +1,79 @@
+"""
+Related-products lookup for the product detail page.
+
+Instead of downloading every product of a category on each product view,
+a bounded candidate list per category is loaded once, kept for a TTL
+(refreshed in the background) and scored in memory.
+"""
+import heapq
+
+from cache import LRUCache, StaleWhileRevalidate
+
+
+class RelatedProductsIndex:
+    """Per-category candidate lists plus a cheap similarity score.
+
+    `loader(category_slug)` returns a list of `models.Product` for that
+    category (at most a bounded number) and raises on failure.
+    """
+
+    # Score weights: a similar price matters most, featured items get a nudge
+    SAME_CATEGORY_WEIGHT = 1.0
+    PRICE_WEIGHT = 1.0
+    FEATURED_WEIGHT = 0.3
+
+    def __init__(self, loader, limit=4, ttl=300.0, max_stale=1800.0, max_categories=256):
+        self.loader = loader
+        self.limit = limit
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self._categories = LRUCache(max_items=max_categories)
+
+    @property
+    def hits(self):
+        return self._categories.hits
+
+    @property
+    def misses(self):
+        return self._categories.misses
+
+    def _candidates(self, category_slug):
+        entry = self._categories.get(category_slug)
+        if entry is None:
+            entry = StaleWhileRevalidate(
+                lambda: self._build_index(category_slug),
+                ttl=self.ttl,
+                max_stale=self.max_stale,
+                name=f"related products for '{category_slug}'"
+            )
+            self._categories.set(category_slug, entry)
+        return entry.get()
+
+    def _build_index(self, category_slug):
+        # Precompute the scoring inputs once per load instead of per view
+        return [(p.id, p.categoryId, p.price, p.featured, p) for p in self.loader(category_slug)]
+
+    def score(self, product, candidate_category_id, candidate_price, candidate_featured):
+        score = 0.0
+        if candidate_category_id == product.categoryId:
+            score += self.SAME_CATEGORY_WEIGHT
+        reference = max(product.price, 1.0)
+        score += self.PRICE_WEIGHT * max(0.0, 1.0 - abs(candidate_price - product.price) / reference)
+        if candidate_featured:
+            score += self.FEATURED_WEIGHT
+        return score
+
+    def for_product(self, product, limit=None):
+        """Return up to `limit` products related to `product` (raises on load failure)."""
+        if not product or not product.category:
+            return []
+        limit = self.limit if limit is None else limit
+        scored = (
+            (self.score(product, category_id, price, featured), candidate)
+            for candidate_id, category_id, price, featured, candidate in self._candidates(product.category.slug)
+            if candidate_id != product.id
+        )
+        return [candidate for _, candidate in heapq.nlargest(limit, scored, key=lambda item: item[0])]
+
+    def invalidate(self):
+        self._categories.clear()
@@ -0,0 +1,372 @@
+"""
+Optional local replica of the catalog (categories, products, banners).
+
+The catalog is copied into a sqlite file on local disk that every worker
+of the host reads, so the home, category and product pages are served
+from indexed local lookups instead of API round-trips, and keep working
+(from the last good snapshot) while the API is down.
+
+Each worker runs a sync thread, but a lock file lets only one of them
+sync at a time:
+
+- Categories and banners are small and are fetched whole; the tables are
+  only rewritten when an (id, updatedAt) differs.
+- Products are pulled incrementally: `/products?sortBy=updated&updatedSince=`
+  returns only rows changed since the stored cursor, in updatedAt order,
+  and the cursor advances page by page (keyset pagination, so rows that
+  change during a sync cannot shift others out of view).
+- Deleted rows do not show up in an incremental pull. Admin deletes made
+  through this app remove them right away; a full pull every
+  `full_sync_interval` seconds drops the rest.
+
+The snapshot becomes readable after the first complete sync. Until then
+(or when disabled) the app calls the API as before.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import requests
+
+from cache import LRUCache
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS products (
+    id TEXT PRIMARY KEY,
+    updated_at TEXT NOT NULL,
+    created_at TEXT,
+    name TEXT,
+    price REAL,
+    featured INTEGER NOT NULL DEFAULT 0,
+    category_slug TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS products_by_created ON products (created_at);
+CREATE INDEX IF NOT EXISTS products_by_category ON products (category_slug, created_at);
+CREATE INDEX IF NOT EXISTS products_by_featured ON products (featured, created_at);
+CREATE TABLE IF NOT EXISTS categories (id TEXT PRIMARY KEY, updated_at TEXT, data TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS banners (id TEXT PRIMARY KEY, updated_at TEXT, data TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+'''
+
+# Listing sort options (see app.LISTING_SORT_OPTIONS) as ORDER BY clauses
+ORDER_BY = {
+    'newest': 'created_at DESC, id',
+    'price_asc': 'price ASC, id',
+    'price_desc': 'price DESC, id',
+    'name': 'name ASC, id',
+}
+
+# Admin proxy resources stored in the replica, by table
+TABLES = {'products': 'products', 'categories': 'categories', 'banners': 'banners'}
+
+
+class ReplicaSyncError(Exception):
+    """The API cannot serve an incremental sync."""
+
+
+class CatalogReplica:
+    """sqlite snapshot of the catalog kept in sync with the API through `api` (a BackendClient)."""
+
+    def __init__(self, path, api, page_size=100, interval=30.0, full_sync_interval=3600.0, decoded_cache_size=4096):
+        self.path = path
+        self.api = api
+        self.page_size = page_size
+        self.interval = interval
+        self.full_sync_interval = full_sync_interval
+        # Callable on_change(kinds) run when the snapshot changed, e.g. to drop page caches
+        self.on_change = None
+        self.hits = 0
+        self.misses = 0
+        self._local = threading.local()
+        self._wake = threading.Event()
+        self._thread = None
+        self._ready = False
+        self._seen_version = None
+        # (id, updatedAt) -> decoded product dict, so hot rows are not parsed on every read
+        self._decoded = LRUCache(max_items=decoded_cache_size)
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connection().executescript(SCHEMA)
+
+    @classmethod
+    def from_env(cls, environ, instance_path, api):
+        return cls(
+            environ.get('CATALOG_REPLICA_PATH') or os.path.join(instance_path, 'catalog.sqlite3'),
+            api,
+            page_size=int(environ.get('CATALOG_REPLICA_PAGE_SIZE', 100)),
+            interval=float(environ.get('CATALOG_REPLICA_SYNC_INTERVAL', 30)),
+            full_sync_interval=float(environ.get('CATALOG_REPLICA_FULL_SYNC_INTERVAL', 3600)),
+        )
+
+    def _connection(self):
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=5)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            self._local.db = db
+        return db
+
+    def _meta(self, key, default=None):
+        row = self._connection().execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else default
+
+    @staticmethod
+    def _set_meta(db, key, value):
+        db.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, str(value)))
+
+    @staticmethod
+    def _bump_version(db):
+        db.execute("INSERT INTO meta (key, value) VALUES ('version', '1') "
+                   "ON CONFLICT (key) DO UPDATE SET value = CAST(value AS INTEGER) + 1")
+
+    # ----- reads -----
+
+    @property
+    def ready(self):
+        """Whether a complete snapshot exists (possibly written by another worker or an earlier run)."""
+        if not self._ready:
+            self._ready = self._meta('synced_at') is not None
+        return self._ready
+
+    @property
+    def synced_at(self):
+        """Wall-clock time of the last successful sync, or None."""
+        value = self._meta('synced_at')
+        return float(value) if value else None
+
+    def __len__(self):
+        return self._connection().execute('SELECT COUNT(*) FROM products').fetchone()[0]
+
+    def categories(self):
+        self.hits += 1
+        rows = self._connection().execute('SELECT data FROM categories').fetchall()
+        return sorted((json.loads(data) for data, in rows), key=lambda category: category.get('name') or '')
+
+    def banners(self, active_only=True):
+        self.hits += 1
+        banners = [json.loads(data) for data, in self._connection().execute('SELECT data FROM banners')]
+        if active_only:
+            banners = [banner for banner in banners if banner.get('active', True)]
+        return sorted(banners, key=lambda banner: banner.get('order') or 0)
+
+    def product(self, product_id):
+        """A product dict, or None if the snapshot does not have it."""
+        self.hits += 1
+        row = self._connection().execute(
+            'SELECT id, updated_at FROM products WHERE id = ?', (product_id,)).fetchone()
+        products = self._decode([row]) if row else []
+        return products[0] if products else None
+
+    def product_page(self, page=1, page_size=24, sort_by='newest', category_slug=None, featured=False):
+        """(product dicts, pagination) like `/products` with the same query parameters."""
+        self.hits += 1
+        where, args = [], []
+        if category_slug:
+            where.append('category_slug = ?')
+            args.append(category_slug)
+        if featured:
+            where.append('featured = 1')
+        where_sql = f" WHERE {' AND '.join(where)}" if where else ''
+        db = self._connection()
+        total = db.execute(f'SELECT COUNT(*) FROM products{where_sql}', args).fetchone()[0]
+        rows = db.execute(
+            f'SELECT id, updated_at FROM products{where_sql} ORDER BY {ORDER_BY.get(sort_by, ORDER_BY["newest"])} '
+            'LIMIT ? OFFSET ?', args + [page_size, (page - 1) * page_size]).fetchall()
+        pagination = {'page': page, 'pageSize': page_size, 'total': total, 'totalPages': -(-total // page_size)}
+        return self._decode(rows), pagination
+
+    def _decode(self, rows):
+        """Product dicts for (id, updated_at) rows, parsing only those not decoded before."""
+        products = [self._decoded.get(row) for row in rows]
+        missing = [row[0] for row, product in zip(rows, products) if product is None]
+        if missing:
+            placeholders = ','.join('?' * len(missing))
+            loaded = {product_id: (updated_at, json.loads(data)) for product_id, updated_at, data in
+                      self._connection().execute(
+                          f'SELECT id, updated_at, data FROM products WHERE id IN ({placeholders})', missing)}
+            for index, row in enumerate(rows):
+                if products[index] is None and row[0] in loaded:
+                    updated_at, product = loaded[row[0]]
+                    self._decoded.set((row[0], updated_at), product)
+                    products[index] = product
+        return [product for product in products if product is not None]
+
+    # ----- writes -----
+
+    def delete(self, resource, item_id):
+        """Drop a row deleted through the admin API (incremental syncs cannot see deletes)."""
+        table = TABLES.get(resource)
+        if not table or not item_id:
+            return
+        db = self._connection()
+        with db:
+            if db.execute(f'DELETE FROM {table} WHERE id = ?', (item_id,)).rowcount:
+                self._bump_version(db)
+
+    def sync(self, full=False):
+        """Pull changes from the API into the snapshot; returns the set of changed kinds.
+
+        Raises `requests` exceptions if the API cannot be reached, leaving
+        the snapshot as it was (apart from rows already pulled).
+        """
+        changed = set()
+        if self._sync_list('categories', '/categories', 'categories'):
+            changed.add('categories')
+            # Slugs/names are copied into every product row
+            full = True
+        if self._sync_list('banners', '/banners?all=true', 'banners'):
+            changed.add('banners')
+        if self._sync_products(full):
+            changed.add('products')
+
+        db = self._connection()
+        with db:
+            now = time.time()
+            self._set_meta(db, 'synced_at', now)
+            if full:
+                self._set_meta(db, 'full_synced_at', now)
+            if changed:
+                self._bump_version(db)
+        return changed
+
+    def _get_json(self, path, **kwargs):
+        response = self.api.get(path, **kwargs)
+        response.raise_for_status()
+        return response.json()
+
+    def _sync_list(self, table, path, key):
+        items = self._get_json(path).get(key, [])
+        db = self._connection()
+        current = dict(db.execute(f'SELECT id, updated_at FROM {table}').fetchall())
+        if current == {item['id']: item.get('updatedAt') for item in items}:
+            return False
+        with db:
+            db.execute(f'DELETE FROM {table}')
+            db.executemany(f'INSERT INTO {table} (id, updated_at, data) VALUES (?, ?, ?)',
+                           [(item['id'], item.get('updatedAt'), json.dumps(item)) for item in items])
+        return True
+
+    def _sync_products(self, full):
+        cursor = None if full else self._meta('products_cursor')
+        seen = set() if full else None
+        changed = False
+        page = 1
+        while True:
+            params = {'sortBy': 'updated', 'pageSize': self.page_size, 'page': page}
+            if cursor:
+                params['updatedSince'] = cursor
+            rows = self._get_json('/products', params=params).get('products', [])
+            if cursor and any((row.get('updatedAt') or '') < cursor for row in rows):
+                raise ReplicaSyncError("The products API ignores sortBy=updated/updatedSince, update the backend")
+            changed |= self._upsert_products(rows)
+            if seen is not None:
+                seen.update(row['id'] for row in rows)
+            if len(rows) < self.page_size:
+                if rows:
+                    cursor = max(cursor or '', rows[-1].get('updatedAt') or '')
+                break
+            last = rows[-1].get('updatedAt')
+            if last == cursor:
+                # A full page with one timestamp: step past it instead of asking again
+                page += 1
+            else:
+                cursor, page = last, 1
+
+        db = self._connection()
+        with db:
+            if seen is not None:
+                stale = [product_id for product_id, in db.execute('SELECT id FROM products')
+                         if product_id not in seen]
+                db.executemany('DELETE FROM products WHERE id = ?', [(product_id,) for product_id in stale])
+                changed |= bool(stale)
+            if cursor:
+                self._set_meta(db, 'products_cursor', cursor)
+        return changed
+
+    def _upsert_products(self, rows):
+        if not rows:
+            return False
+        db = self._connection()
+        placeholders = ','.join('?' * len(rows))
+        current = {product_id: (updated_at, category_slug) for product_id, updated_at, category_slug in db.execute(
+            f'SELECT id, updated_at, category_slug FROM products WHERE id IN ({placeholders})',
+            [row['id'] for row in rows])}
+        changed = []
+        for row in rows:
+            category_slug = (row.get('category') or {}).get('slug')
+            if current.get(row['id']) != (row.get('updatedAt'), category_slug):
+                changed.append((row['id'], row.get('updatedAt'), row.get('createdAt'), row.get('name'),
+                                _to_float(row.get('price')), int(bool(row.get('featured'))), category_slug,
+                                json.dumps(row)))
+        if changed:
+            with db:
+                db.executemany('INSERT OR REPLACE INTO products (id, updated_at, created_at, name, price, '
+                               'featured, category_slug, data) VALUES (?, ?, ?, ?, ?, ?, ?, ?)', changed)
+        return bool(changed)
+
+    # ----- background sync -----
+
+    def start(self):
+        """Start this worker's sync thread."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True, name='catalog-replica')
+            self._thread.start()
+
+    def sync_soon(self):
+        """Wake the sync thread now, e.g. right after an admin write."""
+        self._wake.set()
+
+    def _run(self):
+        woken = False
+        while True:
+            self.sync_once(force=woken)
+            woken = self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def sync_once(self, force=False):
+        """Sync unless another worker is syncing or just did, then report changes made by any worker."""
+        synced_at = self.synced_at
+        if force or synced_at is None or time.time() - synced_at >= self.interval / 2:
+            self._sync_exclusively()
+
+        # The version moves on every change, whichever worker made it
+        version = self._meta('version')
+        if self._seen_version is not None and version != self._seen_version and self.on_change:
+            try:
+                self.on_change({'categories', 'banners', 'products'})
+            except Exception as e:
+                print(f"Catalog replica change handler failed: {e}")
+        self._seen_version = version
+
+    def _sync_exclusively(self):
+        with open(self.path + '.lock', 'a') as lock_file:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    return
+            try:
+                full_synced_at = float(self._meta('full_synced_at') or 0)
+                self.sync(full=time.time() - full_synced_at >= self.full_sync_interval)
+            except (requests.exceptions.RequestException, ReplicaSyncError, ValueError, KeyError) as e:
+                print(f"Catalog replica sync failed, serving the last snapshot: {e}")
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
@@ -0,0 +1,398 @@
+"""
+In-process product search for /search and the topbar typeahead.
+
+The backend can only search with a case-insensitive `contains` on name and
+description, i.e. a full table scan per keystroke. Instead the frontend
+keeps an inverted index (token -> {product id: weight}) over product names,
+descriptions and category names:
+
+- Tokens are lower-cased and folded to ASCII ("Ghế Sofa" -> "ghe", "sofa"),
+  so queries typed without Vietnamese diacritics still match.
+- Every query word may be a prefix of an indexed word; the vocabulary is a
+  sorted list, so prefixes expand with a binary search. All words must
+  match. Whole-word matches rank above prefix matches, and name matches
+  rank above category and description matches.
+- Results can be filtered by category, price range (after discount) and
+  featured flag.
+
+The index is filled page by page from the products API. After `ttl` it
+syncs in the background, asking only for products updated since the newest
+`updatedAt` it has seen. Every `full_sync_interval`, and after category
+writes (renames do not touch products' `updatedAt`), it pages through the
+whole catalog instead and drops products that are gone. Either kind only
+re-indexes products whose (updatedAt, category name) changed. Admin writes
+update single products right away (see app.py).
+
+Every worker keeps the index for the whole catalog, so it stores compact
+SearchDocument records holding just what matching, filtering and result
+cards need. Descriptions are only tokenized, and inline data-URI images are
+replaced by `image_key(url)`, e.g. a key of the on-disk thumbnail store.
+Such a key only works while the store still has the image, and the document
+no longer has the data URI to put it back: when the store loses it, the
+caller reports the key to `refresh_image()`, which re-fetches the products
+using it (and so registers their images again). Full syncs do the same for
+every product.
+"""
+import bisect
+import heapq
+import re
+import threading
+import time
+import unicodedata
+from dataclasses import dataclass
+
+from models import ProductCategory
+
+_WORD = re.compile(r'\w+')
+
+
+def fold(text):
+    """Lower-case `text` and strip diacritics ('Đèn Bàn' -> 'den ban')."""
+    text = unicodedata.normalize('NFKD', (text or '').lower().replace('đ', 'd'))
+    return ''.join(char for char in text if not unicodedata.combining(char))
+
+
+def tokenize(text):
+    return _WORD.findall(fold(text))
+
+
+def effective_price(product):
+    """Price the shopper pays, i.e. after the percentage discount."""
+    if product.discount > 0:
+        return product.price * (1 - product.discount / 100)
+    return product.price
+
+
+@dataclass(frozen=True, slots=True)
+class SearchDocument:
+    """The fields of a `models.Product` that search results use."""
+    id: str
+    name: str
+    slug: str
+    price: float
+    discount: float
+    stock: int
+    imageUrl: str
+    featured: bool
+    category: ProductCategory
+    createdAt: str
+    updatedAt: str
+
+    @classmethod
+    def from_product(cls, product, image_key=None):
+        category = product.category
+        if category is not None:
+            # Without the category's description and (often inline) image
+            category = ProductCategory(id=category.id, name=category.name, slug=category.slug)
+        image_url = product.imageUrl
+        if image_key is not None:
+            image_url = image_key(image_url)
+        return cls(
+            id=product.id,
+            name=product.name,
+            slug=product.slug,
+            price=product.price,
+            discount=product.discount,
+            stock=product.stock,
+            imageUrl=image_url,
+            featured=product.featured,
+            category=category,
+            createdAt=product.createdAt,
+            updatedAt=product.updatedAt,
+        )
+
+
+class SearchIndex:
+    """Inverted index of `models.Product` records, kept as SearchDocuments.
+
+    `loader(page, page_size, updated_since)` returns (products, total_pages)
+    for one page of the catalog, or with `updated_since` of the products
+    updated at or after it, oldest change first. `fetch_one(product_id)`
+    returns a single product or None; both raise on failure.
+    """
+
+    # Weight of a word by the field it appears in
+    FIELD_WEIGHTS = (('name', 3.0), ('category', 2.0), ('description', 1.0))
+    # A query word that is only a prefix of the indexed word counts for less
+    PREFIX_FACTOR = 0.6
+    FEATURED_BOOST = 0.2
+    # Upper bound on the indexed words a single (short) query prefix expands to
+    MAX_PREFIX_EXPANSION = 200
+
+    SORT_KEYS = {
+        'price_asc': lambda item: (effective_price(item[1]), item[1].name),
+        'price_desc': lambda item: (-effective_price(item[1]), item[1].name),
+        'newest': None,
+        'name': lambda item: fold(item[1].name),
+    }
+
+    def __init__(self, loader, fetch_one, ttl=300.0, page_size=200, full_sync_interval=3600.0, image_key=None):
+        self.loader = loader
+        self.fetch_one = fetch_one
+        self.ttl = ttl
+        self.page_size = page_size
+        self.full_sync_interval = full_sync_interval
+        self.image_key = image_key
+        self._postings = {}
+        self._vocabulary = []
+        self._documents = {}
+        self._versions = {}
+        self._lock = threading.RLock()
+        self._build_lock = threading.Lock()
+        self._synced_at = None
+        self._full_synced_at = None
+        # Newest updatedAt seen, where the next incremental sync starts
+        self._cursor = None
+        self._syncing = False
+        self._full_requested = False
+        # Bumped on every change, so pages built from the index can use it as a validator
+        self.version = 0
+        self.searches = 0
+
+    def __len__(self):
+        return len(self._documents)
+
+    @staticmethod
+    def _document_version(product):
+        return (product.updatedAt, product.category.name if product.category else None)
+
+    def _fields(self, product):
+        category_name = product.category.name if product.category else ''
+        return {'name': product.name, 'category': category_name, 'description': product.description}
+
+    # ----- updates -----
+
+    def add(self, product):
+        """Index `product`, replacing any previous version of it."""
+        weights = {}
+        fields = self._fields(product)
+        for field, weight in self.FIELD_WEIGHTS:
+            for token in tokenize(fields[field]):
+                weights[token] = max(weights.get(token, 0.0), weight)
+        with self._lock:
+            self._remove(product.id)
+            for token, weight in weights.items():
+                postings = self._postings.get(token)
+                if postings is None:
+                    postings = self._postings[token] = {}
+                    bisect.insort(self._vocabulary, token)
+                postings[product.id] = weight
+            self._documents[product.id] = (SearchDocument.from_product(product, self.image_key), tuple(weights))
+            self._versions[product.id] = self._document_version(product)
+            self.version += 1
+
+    def remove(self, product_id):
+        with self._lock:
+            if self._remove(product_id):
+                self.version += 1
+
+    def _remove(self, product_id):
+        entry = self._documents.pop(product_id, None)
+        if entry is None:
+            return False
+        self._versions.pop(product_id, None)
+        for token in entry[1]:
+            postings = self._postings.get(token)
+            if postings is None:
+                continue
+            postings.pop(product_id, None)
+            if not postings:
+                del self._postings[token]
+                position = bisect.bisect_left(self._vocabulary, token)
+                if position < len(self._vocabulary) and self._vocabulary[position] == token:
+                    del self._vocabulary[position]
+        return True
+
+    def sync(self, full=True):
+        """Index new/changed products: all of them, or (full=False) those updated since the last sync.
+
+        A full sync also drops products it did not see. Returns (changed,
+        removed) counts; raises if a page cannot be loaded, leaving what was
+        indexed so far in place.
+        """
+        cursor = None if full or self._cursor is None else self._cursor
+        full = cursor is None
+        newest = cursor
+        seen = set()
+        changed = 0
+        page = 1
+        while True:
+            products, total_pages = self.loader(page, self.page_size, cursor)
+            for product in products:
+                seen.add(product.id)
+                if product.updatedAt and (newest is None or product.updatedAt > newest):
+                    newest = product.updatedAt
+                if self._versions.get(product.id) != self._document_version(product):
+                    self.add(product)
+                    changed += 1
+                elif full and self.image_key is not None:
+                    # Puts back image originals the thumbnail store has evicted since
+                    self.image_key(product.imageUrl)
+            if not products or page >= total_pages:
+                break
+            page += 1
+
+        missing = []
+        if full:
+            with self._lock:
+                # A product missed because a delete shifted the pages mid-sync comes back on the next sync
+                missing = [product_id for product_id in self._documents if product_id not in seen]
+                for product_id in missing:
+                    self._remove(product_id)
+                if missing:
+                    self.version += 1
+        self._cursor = newest
+        self._synced_at = time.monotonic()
+        if full:
+            self._full_synced_at = self._synced_at
+        return changed, len(missing)
+
+    def refresh_product(self, product_id):
+        """Re-fetch one product (e.g. after an admin write) and update or drop it."""
+        product = self.fetch_one(product_id)
+        if product is None:
+            self.remove(product_id)
+        else:
+            self.add(product)
+
+    def ensure_fresh(self):
+        """Build the index on first use (blocking), afterwards sync in the background after `ttl`."""
+        if self._synced_at is None:
+            with self._build_lock:
+                if self._synced_at is None:
+                    self.sync()
+            return
+        now = time.monotonic()
+        if now - self._synced_at >= self.ttl:
+            self.refresh(full=now - self._full_synced_at >= self.full_sync_interval)
+
+    @property
+    def built(self):
+        return self._synced_at is not None
+
+    def refresh(self, full=False):
+        """Start a background sync; a no-op until the index is first built.
+
+        If a sync is already running, a requested full sync runs right after it.
+        """
+        with self._lock:
+            if not self.built:
+                return
+            self._full_requested = self._full_requested or full
+            if self._syncing:
+                return
+            self._syncing = True
+        threading.Thread(target=self._background_sync, daemon=True).start()
+
+    def _background_sync(self):
+        while True:
+            with self._lock:
+                full, self._full_requested = self._full_requested, False
+            try:
+                self.sync(full=full)
+            except Exception as e:
+                print(f"Background sync of the search index failed: {e}")
+                with self._lock:
+                    self._full_requested = self._full_requested or full
+                    self._syncing = False
+                return
+            with self._lock:
+                if not self._full_requested:
+                    self._syncing = False
+                    return
+
+    def refresh_product_in_background(self, product_id):
+        """`refresh_product` on a background thread; a no-op until the index is first built."""
+        if not self.built:
+            return
+        threading.Thread(target=self._background_refresh_product, args=(product_id,), daemon=True).start()
+
+    def _background_refresh_product(self, product_id):
+        try:
+            self.refresh_product(product_id)
+        except Exception as e:
+            # The next sync picks the change up instead
+            print(f"Could not update product {product_id} in the search index: {e}")
+
+    def refresh_image(self, image_key):
+        """Re-fetch, in the background, the products whose image is `image_key` (e.g. after it was evicted)."""
+        with self._lock:
+            product_ids = [product_id for product_id, (document, _) in self._documents.items()
+                           if document.imageUrl == image_key]
+        for product_id in product_ids:
+            self.refresh_product_in_background(product_id)
+        return len(product_ids)
+
+    # ----- queries -----
+
+    def _expand(self, word):
+        """Indexed words starting with `word`, at most MAX_PREFIX_EXPANSION of them."""
+        start = bisect.bisect_left(self._vocabulary, word)
+        expansion = []
+        for token in self._vocabulary[start:start + self.MAX_PREFIX_EXPANSION]:
+            if not token.startswith(word):
+                break
+            expansion.append(token)
+        return expansion
+
+    def _match(self, words):
+        scores = None
+        for word in words:
+            word_scores = {}
+            for token in self._expand(word):
+                factor = 1.0 if token == word else self.PREFIX_FACTOR
+                for product_id, weight in self._postings[token].items():
+                    score = weight * factor
+                    if score > word_scores.get(product_id, 0.0):
+                        word_scores[product_id] = score
+            if scores is None:
+                scores = word_scores
+            else:
+                scores = {product_id: score + word_scores[product_id]
+                          for product_id, score in scores.items() if product_id in word_scores}
+            if not scores:
+                return {}
+        return scores
+
+    def search(self, query, category=None, min_price=None, max_price=None, featured=None,
+               sort_by='relevance', offset=0, limit=24):
+        """Return (products, total) of products matching all words of `query` and the filters.
+
+        An empty query matches every product, so the filters alone can be used
+        to browse. `category` is a category slug; prices are compared after discount.
+        """
+        self.searches += 1
+        words = tokenize(query)
+        with self._lock:
+            if words:
+                scores = self._match(words)
+                candidates = [(score, self._documents[product_id][0]) for product_id, score in scores.items()]
+            else:
+                candidates = [(0.0, product) for product, _ in self._documents.values()]
+
+        matches = []
+        for score, product in candidates:
+            if category and (not product.category or product.category.slug != category):
+                continue
+            if featured is not None and product.featured != featured:
+                continue
+            if min_price is not None or max_price is not None:
+                price = effective_price(product)
+                if (min_price is not None and price < min_price) or (max_price is not None and price > max_price):
+                    continue
+            if product.featured:
+                score += self.FEATURED_BOOST
+            matches.append((score, product))
+
+        total = len(matches)
+        if sort_by in self.SORT_KEYS:
+            key = self.SORT_KEYS[sort_by]
+            if key is None:
+                matches.sort(key=lambda item: item[1].createdAt or '', reverse=True)
+            else:
+                matches.sort(key=key)
+            page = matches[offset:offset + limit]
+        else:
+            ranked = heapq.nsmallest(offset + limit, matches, key=lambda item: (-item[0], fold(item[1].name)))
+            page = ranked[offset:]
+        return [product for _, product in page], total
@@ -0,0 +1,261 @@
+"""
+Optional server-side sessions for the Flask frontend.
+
+By default Flask keeps the whole session (user profile, JWT, flashes) in a
+signed cookie that is verified and decoded on every request and re-signed
+whenever it changes. With a server-side backend the cookie only carries an
+opaque random id and the data lives in a store:
+
+- MemorySessionStore: per-process LRU with a TTL (single worker / dev).
+- SqliteSessionStore: sqlite file on local disk, shared by the workers of
+  one host.
+- RedisSessionStore: shared by all hosts. It only needs a client with the
+  redis-py methods get/set(ex=)/delete, so a local stand-in can replace a
+  real Redis server.
+
+Stores hold serialized blobs; `ServerSideSessionInterface` keeps the
+decoded sessions in a small LRU and reuses an entry while the stored blob
+is unchanged, so hot sessions (and the user/role checked by
+`admin_required`) are not parsed again on every request.
+"""
+import os
+import re
+import secrets
+import sqlite3
+import threading
+import time
+
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+
+from cache import LRUCache
+
+_SESSION_ID = re.compile(r'^[A-Za-z0-9_-]{43}$')
+
+
+class MemorySessionStore:
+    """In-process session store, least recently used sessions dropped first."""
+
+    def __init__(self, max_items=10000):
+        self._entries = LRUCache(max_items=max_items)
+
+    def get(self, sid):
+        entry = self._entries.get(sid)
+        if entry is None:
+            return None
+        blob, expires = entry
+        if expires <= time.monotonic():
+            self._entries.pop(sid)
+            return None
+        return blob
+
+    def set(self, sid, blob, ttl):
+        self._entries.set(sid, (blob, time.monotonic() + ttl))
+
+    def delete(self, sid):
+        self._entries.pop(sid)
+
+
+class SqliteSessionStore:
+    """Session store in a local sqlite file (one connection per thread)."""
+
+    # Expired rows are purged after this many writes
+    PURGE_EVERY = 1000
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._writes = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connection() as db:
+            db.execute('CREATE TABLE IF NOT EXISTS sessions '
+                       '(id TEXT PRIMARY KEY, data BLOB NOT NULL, expires REAL NOT NULL)')
+
+    def _connection(self):
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            self._local.db = db
+        return db
+
+    def get(self, sid):
+        row = self._connection().execute(
+            'SELECT data FROM sessions WHERE id = ? AND expires > ?', (sid, time.time())).fetchone()
+        return row[0] if row else None
+
+    def set(self, sid, blob, ttl):
+        db = self._connection()
+        db.execute('INSERT OR REPLACE INTO sessions (id, data, expires) VALUES (?, ?, ?)',
+                   (sid, blob, time.time() + ttl))
+        self._writes += 1
+        if self._writes % self.PURGE_EVERY == 0:
+            db.execute('DELETE FROM sessions WHERE expires <= ?', (time.time(),))
+
+    def delete(self, sid):
+        self._connection().execute('DELETE FROM sessions WHERE id = ?', (sid,))
+
+
+class RedisSessionStore:
+    """Session store shared between workers through a Redis-compatible client."""
+
+    def __init__(self, client, prefix='session:'):
+        self.client = client
+        self.prefix = prefix
+
+    @classmethod
+    def from_url(cls, url, prefix='session:'):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("SESSION_BACKEND=redis requires the 'redis' package (pip install redis)")
+        return cls(redis.Redis.from_url(url), prefix=prefix)
+
+    def get(self, sid):
+        return self.client.get(self.prefix + sid)
+
+    def set(self, sid, blob, ttl):
+        self.client.set(self.prefix + sid, blob, ex=max(1, int(ttl)))
+
+    def delete(self, sid):
+        self.client.delete(self.prefix + sid)
+
+
+class ServerSideSession(CallbackDict, SessionMixin):
+    """Session dict identified by `sid`; tracks modification like Flask's cookie session."""
+
+    def __init__(self, initial=None, sid=None, new=False):
+        def on_update(self):
+            self.modified = True
+            self.accessed = True
+
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.modified = False
+        self.accessed = False
+        self.previous_sid = None
+
+    def __getitem__(self, key):
+        self.accessed = True
+        return super().__getitem__(key)
+
+    def get(self, key, default=None):
+        self.accessed = True
+        return super().get(key, default)
+
+    def setdefault(self, key, default=None):
+        self.accessed = True
+        return super().setdefault(key, default)
+
+    def regenerate(self):
+        """Move the data to a fresh id (call on login to prevent session fixation)."""
+        if self.sid and not self.new:
+            self.previous_sid = self.sid
+        self.sid = None
+        self.new = True
+        self.modified = True
+
+
+class ServerSideSessionInterface(SessionInterface):
+    """Flask session interface keeping session data in `store`."""
+
+    serializer = TaggedJSONSerializer()
+
+    def __init__(self, store, ttl=7 * 24 * 3600, decoded_cache_size=4096):
+        self.store = store
+        self.ttl = ttl
+        # sid -> (stored blob, decoded data) of recently used sessions
+        self._decoded = LRUCache(max_items=decoded_cache_size)
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_env(cls, environ, instance_path):
+        kind = environ.get('SESSION_BACKEND', 'memory').lower()
+        if kind == 'sqlite':
+            store = SqliteSessionStore(environ.get('SESSION_SQLITE_PATH')
+                                       or os.path.join(instance_path, 'sessions.sqlite3'))
+        elif kind == 'redis':
+            store = RedisSessionStore.from_url(environ.get('SESSION_REDIS_URL', 'redis://localhost:6379/0'))
+        else:
+            store = MemorySessionStore(max_items=int(environ.get('SESSION_MAX_ITEMS', 10000)))
+        return cls(
+            store,
+            ttl=float(environ.get('SESSION_TTL', 7 * 24 * 3600)),
+            decoded_cache_size=int(environ.get('SESSION_DECODED_CACHE_SIZE', 4096)),
+        )
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if not sid or not _SESSION_ID.match(sid):
+            return ServerSideSession(new=True)
+        data = self._load(sid)
+        if data is None:
+            return ServerSideSession(new=True)
+        return ServerSideSession(data, sid=sid)
+
+    def _load(self, sid):
+        blob = self.store.get(sid)
+        if blob is None:
+            self._decoded.pop(sid)
+            return None
+        cached = self._decoded.get(sid)
+        if cached is not None and cached[0] == blob:
+            self.hits += 1
+            data = cached[1]
+        else:
+            self.misses += 1
+            data = self.serializer.loads(blob.decode('utf-8') if isinstance(blob, bytes) else blob)
+            self._decoded.set(sid, (blob, data))
+        return self._copy(data)
+
+    @staticmethod
+    def _copy(data):
+        # One level of copying is enough: values are replaced, not mutated in place,
+        # except lists/dicts such as the pending flashes list
+        return {key: value.copy() if isinstance(value, (dict, list)) else value for key, value in data.items()}
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        secure = self.get_cookie_secure(app)
+        partitioned = self.get_cookie_partitioned(app)
+        samesite = self.get_cookie_samesite(app)
+        httponly = self.get_cookie_httponly(app)
+
+        if session.accessed:
+            response.vary.add('Cookie')
+
+        if session.previous_sid:
+            self._delete(session.previous_sid)
+        if not session:
+            if session.modified and session.sid:
+                self._delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path, secure=secure,
+                                       partitioned=partitioned, samesite=samesite, httponly=httponly)
+                response.vary.add('Cookie')
+            return
+
+        if session.modified:
+            if session.sid is None:
+                session.sid = secrets.token_urlsafe(32)
+            blob = self.serializer.dumps(dict(session)).encode('utf-8')
+            self.store.set(session.sid, blob, self.ttl)
+            self._decoded.set(session.sid, (blob, self._copy(session)))
+
+        # The id never changes, so an existing cookie only needs refreshing for permanent sessions
+        if session.new or (session.permanent and app.config['SESSION_REFRESH_EACH_REQUEST']):
+            response.set_cookie(name, session.sid, expires=self.get_expiration_time(app, session),
+                                httponly=httponly, domain=domain, path=path, secure=secure,
+                                partitioned=partitioned, samesite=samesite)
+            response.vary.add('Cookie')
+
+    def _delete(self, sid):
+        self.store.delete(sid)
+        self._decoded.pop(sid)
@@ -0,0 +1,265 @@
+"""
+Request coalescing ("single-flight") for identical concurrent backend GETs.
+
+When a cached value expires under load, every request thread misses at
+the same moment and sends the same `GET /categories` or featured-products
+call. With coalescing, the first caller of a key (URL + auth scope) makes
+the call and every caller that arrives while it is in flight waits for
+and receives the same result (or exception).
+
+- SingleFlight: threads of one worker process.
+- FileSingleFlight: optional second layer shared by the workers of one
+  host. The leader of each process takes an flock on a per-key lock file;
+  the process holding it publishes its response to a small file, and
+  processes that were waiting on the lock reuse that response if it was
+  written after they started waiting. Only successful (< 500) responses
+  are shared; on errors each worker calls the backend itself. Calls with
+  an Authorization header are never written to disk, and a response file
+  is deleted by the last worker that was waiting for it.
+- AsyncSingleFlight: the same for coroutines of the ASGI serving mode.
+
+Shared responses are the same object for all waiters, so callers must
+treat them as read-only (which `.json()` / `.status_code` callers do).
+"""
+import asyncio
+import errno
+import hashlib
+import json
+import os
+import threading
+import time
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+def flight_key(url, params=None, headers=None):
+    """Coalescing key of a GET: the full URL with its query string plus the auth scope.
+
+    Callers with different Authorization headers never share a response;
+    the token itself is hashed so it is not kept in the key.
+    """
+    if params:
+        url = requests.Request('GET', url, params=params).prepare().url
+    auth = (headers or {}).get('Authorization')
+    return url, hashlib.sha1(auth.encode('utf-8')).hexdigest() if auth else ''
+
+
+class _Flight:
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Merges concurrent calls with the same key into one call of `fn`."""
+
+    def __init__(self, shared=None):
+        # Optional FileSingleFlight the leader goes through, to also merge with other workers
+        self.shared = shared
+        self._flights = {}
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.coalesced = 0
+
+    def do(self, key, fn):
+        """Return fn(), or the result of an identical call already in flight."""
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self.calls += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = self.shared.do(key, fn) if self.shared else fn()
+            return flight.result
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    @property
+    def dedup_ratio(self):
+        """Share of calls answered by another caller's upstream request."""
+        total = self.calls + self.coalesced
+        return self.coalesced / total if total else 0.0
+
+
+class FileSingleFlight:
+    """Cross-process coalescing of `requests` GETs through flock'ed files in `directory`.
+
+    `wait_timeout` bounds how long a worker waits for another one before
+    calling the backend itself. Every worker interested in a key holds a
+    shared record lock (`fcntl.lockf`) on its `.wait` file, so the lock
+    holder can tell whether anyone still needs the response file: the first
+    to find itself alone does not publish, or deletes what was published.
+    Record locks, unlike flock, are upgraded atomically: a worker that fails
+    to upgrade keeps its shared lock. They belong to the process, which is
+    fine as SingleFlight sends one call per key through here.
+    """
+
+    POLL_INTERVAL = 0.005
+
+    def __init__(self, directory, wait_timeout=10.0):
+        if fcntl is None:
+            raise RuntimeError("API_SINGLE_FLIGHT_SHARED requires fcntl (a POSIX system)")
+        self.directory = directory
+        self.wait_timeout = wait_timeout
+        # Responses published by another worker and reused here
+        self.reused = 0
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+
+    def _paths(self, key):
+        name = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+        base = os.path.join(self.directory, name)
+        return base + '.lock', base + '.wait', base + '.json'
+
+    @staticmethod
+    def _open(path):
+        return os.fdopen(os.open(path, os.O_RDWR | os.O_CREAT, 0o600), 'r+b')
+
+    def do(self, key, fn):
+        if key[1]:
+            # Responses for an Authorization header (key[1], see flight_key) stay in this process
+            return fn()
+        lock_path, wait_path, result_path = self._paths(key)
+        started = time.time()
+        with self._open(wait_path) as wait_file, self._open(lock_path) as lock_file:
+            fcntl.lockf(wait_file, fcntl.LOCK_SH)
+            locked = self._acquire(lock_file)
+            try:
+                if locked:
+                    response = self._read(result_path, started)
+                    if response is not None:
+                        self.reused += 1
+                        if self._alone(wait_file):
+                            self._remove(result_path)
+                        return response
+                response = fn()
+                if locked:
+                    if self._alone(wait_file):
+                        # Nobody is waiting: don't leave an older response behind either
+                        self._remove(result_path)
+                    elif response.status_code < 500:
+                        self._write(result_path, response)
+                return response
+            finally:
+                if locked:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+                fcntl.lockf(wait_file, fcntl.LOCK_UN)
+
+    def _acquire(self, lock_file):
+        deadline = time.monotonic() + self.wait_timeout
+        while True:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return True
+            except BlockingIOError:
+                if time.monotonic() >= deadline:
+                    return False
+                time.sleep(self.POLL_INTERVAL)
+
+    @staticmethod
+    def _alone(wait_file):
+        """True if no other worker waits on the key; it then cannot start waiting until we unlock."""
+        try:
+            fcntl.lockf(wait_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except OSError as e:
+            # EAGAIN or EACCES, depending on the system
+            if e.errno not in (errno.EAGAIN, errno.EACCES):
+                raise
+            return False
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"Could not remove shared response {path}: {e}")
+
+    @staticmethod
+    def _read(path, started):
+        """Response published by another worker since `started`, or None."""
+        try:
+            if os.stat(path).st_mtime < started:
+                return None
+            with open(path, 'rb') as f:
+                header, _, body = f.read().partition(b'\n')
+        except OSError:
+            return None
+        meta = json.loads(header)
+        response = requests.Response()
+        response.status_code = meta['status']
+        response.reason = meta['reason']
+        response.url = meta['url']
+        response.encoding = meta['encoding']
+        response.headers = CaseInsensitiveDict(meta['headers'])
+        response._content = body
+        return response
+
+    @staticmethod
+    def _write(path, response):
+        meta = {
+            'status': response.status_code,
+            'reason': response.reason,
+            'url': response.url,
+            'encoding': response.encoding,
+            'headers': dict(response.headers),
+        }
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with os.fdopen(os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'wb') as f:
+                f.write(json.dumps(meta).encode('utf-8') + b'\n' + response.content)
+            os.replace(temp_path, path)
+        except OSError as e:
+            print(f"Could not share response for {response.url}: {e}")
+
+
+class AsyncSingleFlight:
+    """SingleFlight for coroutines running on one event loop."""
+
+    def __init__(self):
+        self._flights = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    dedup_ratio = SingleFlight.dedup_ratio
+
+    async def do(self, key, fn):
+        """Return await fn(), or the result of an identical call already in flight."""
+        flight = self._flights.get(key)
+        if flight is not None:
+            self.coalesced += 1
+            # shield: a cancelled waiter must not cancel the leader's call
+            return await asyncio.shield(flight)
+
+        self.calls += 1
+        flight = self._flights[key] = asyncio.ensure_future(fn())
+        try:
+            return await asyncio.shield(flight)
+        finally:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
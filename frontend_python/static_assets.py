@@ -0,0 +1,167 @@
+"""
+Precompiled, fingerprinted static assets.
+
+Pages used to load the Tailwind "play" CDN script, which builds the CSS in
+the browser on every page load, and Alpine.js from a floating CDN URL.
+`flask build-assets` replaces both at deploy time:
+
+1. the Tailwind CLI (installed with `npm install` in `assets/`) scans the
+   templates and emits one minified stylesheet holding only the classes
+   they use;
+2. the pinned Alpine.js and Cropper.js builds are copied from
+   `assets/node_modules`;
+3. every file is written to `static/dist` as `<name>.<content hash>.<ext>`,
+   next to precompressed `.gz` (and, with the optional 'brotli' package,
+   `.br`) variants, and `manifest.json` maps logical names to those files.
+
+Templates call `asset_url('app.css')`. Since a changed file gets a new
+name, files are served with a one-year `immutable` Cache-Control, and the
+precompressed variant the client accepts is sent as it is. Files of older
+builds are kept, so pages cached before a deploy still find their assets.
+
+Until the assets are built, `asset_url` returns None and the templates fall
+back to the CDN, so a checkout without Node still renders.
+"""
+import gzip
+import hashlib
+import json
+import os
+import subprocess
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+ASSETS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'assets')
+
+# Logical name -> source file relative to ASSETS_DIR ('build/' files come from the Tailwind CLI)
+BUNDLES = {
+    'app.css': 'build/app.css',
+    'alpine.js': 'node_modules/alpinejs/dist/cdn.min.js',
+    'cropper.js': 'node_modules/cropperjs/dist/cropper.min.js',
+    'cropper.css': 'node_modules/cropperjs/dist/cropper.min.css',
+}
+
+# Content-Encoding -> file suffix of the precompressed variants, best first
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+MIMETYPES = {'.css': 'text/css; charset=utf-8', '.js': 'text/javascript; charset=utf-8'}
+
+
+class AssetBuildError(RuntimeError):
+    """The asset sources are missing or the Tailwind build failed."""
+
+
+def fingerprinted_name(name, body):
+    """'app.css' -> 'app.<first 12 hex digits of the SHA-256 of body>.css'."""
+    stem, extension = os.path.splitext(name)
+    return f"{stem}.{hashlib.sha256(body).hexdigest()[:12]}{extension}"
+
+
+def _write(path, body):
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, 'wb') as f:
+        f.write(body)
+    os.replace(temp_path, path)
+
+
+def write_asset(output_dir, name, body, brotli_quality=11):
+    """Write `body` under its fingerprinted name plus compressed variants; returns the file name."""
+    filename = fingerprinted_name(name, body)
+    path = os.path.join(output_dir, filename)
+    # Same content hash, same bytes: a rebuild leaves existing files alone
+    if not os.path.exists(path):
+        _write(path + '.gz', gzip.compress(body, compresslevel=9, mtime=0))
+        if brotli is not None:
+            _write(path + '.br', brotli.compress(body, quality=brotli_quality))
+        _write(path, body)
+    return filename
+
+
+def run_tailwind(source_dir=ASSETS_DIR, command=None):
+    """Build `build/app.css` with the Tailwind CLI (`command` overrides the npx call)."""
+    command = command or ['npx', '--no-install', 'tailwindcss']
+    os.makedirs(os.path.join(source_dir, 'build'), exist_ok=True)
+    try:
+        subprocess.run(
+            [*command, '-c', 'tailwind.config.js', '-i', 'styles.css', '-o', 'build/app.css', '--minify'],
+            cwd=source_dir, check=True,
+        )
+    except (OSError, subprocess.CalledProcessError) as e:
+        raise AssetBuildError(f"Tailwind build failed ({e}); run `npm install` in {source_dir} first") from None
+
+
+def build(output_dir, source_dir=ASSETS_DIR, tailwind_command=None, skip_css=False):
+    """Build all BUNDLES into `output_dir` and write its manifest; returns the manifest."""
+    if not skip_css:
+        run_tailwind(source_dir, tailwind_command)
+    os.makedirs(output_dir, exist_ok=True)
+    files = {}
+    for name, source in BUNDLES.items():
+        try:
+            with open(os.path.join(source_dir, source), 'rb') as f:
+                body = f.read()
+        except OSError as e:
+            raise AssetBuildError(f"Missing asset source for {name}: {e}") from None
+        files[name] = write_asset(output_dir, name, body)
+
+    manifest = {'version': hashlib.sha1(json.dumps(files, sort_keys=True).encode('utf-8')).hexdigest()[:16],
+                'files': files}
+    _write(os.path.join(output_dir, 'manifest.json'), json.dumps(manifest, indent=2).encode('utf-8'))
+    return manifest
+
+
+class AssetManifest:
+    """Resolves logical asset names through `<output_dir>/manifest.json`.
+
+    With `auto_reload` the manifest is re-read when the file changes (for
+    development); otherwise it is read once.
+    """
+
+    def __init__(self, output_dir, auto_reload=False):
+        self.output_dir = output_dir
+        self.auto_reload = auto_reload
+        self._path = os.path.join(output_dir, 'manifest.json')
+        self._mtime = None
+        self._files = {}
+        self._version = None
+        self._load()
+
+    def _load(self):
+        try:
+            mtime = os.stat(self._path).st_mtime
+            if mtime == self._mtime:
+                return
+            with open(self._path) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            self._mtime, self._files, self._version = None, {}, None
+            return
+        self._mtime = mtime
+        self._files = manifest.get('files', {})
+        self._version = manifest.get('version')
+
+    @property
+    def version(self):
+        """Version of the current build (part of page ETags), or None if not built."""
+        if self.auto_reload:
+            self._load()
+        return self._version
+
+    def filename(self, name):
+        """Fingerprinted file name of a logical asset name, or None if it was not built."""
+        if self.auto_reload:
+            self._load()
+        return self._files.get(name)
+
+    def variant(self, filename, accept_encodings):
+        """(file to send, Content-Encoding or None) for a request's Accept-Encoding."""
+        for encoding, suffix in ENCODINGS:
+            if accept_encodings[encoding] and os.path.isfile(os.path.join(self.output_dir, filename + suffix)):
+                return filename + suffix, encoding
+        return filename, None
+
+    @staticmethod
+    def mimetype(filename):
+        return MIMETYPES.get(os.path.splitext(filename)[1], 'application/octet-stream')
+
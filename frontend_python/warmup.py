@@ -0,0 +1,76 @@
+"""
+Startup warm-up so a fresh worker serves its first requests at full speed.
+
+- Every template is loaded once. Jinja compiles it (or, with the app's
+  bytecode cache, loads the code compiled by an earlier process or by
+  `flask --app app compile-templates` at build time) and keeps it in memory.
+- A few pages are requested through the app's test client before the
+  server accepts connections, which primes the category cache, the page
+  cache, the product normalizer and the related-products index exactly as
+  a real visitor would.
+- The time from process start to ready is printed and kept for /metrics.
+"""
+import time
+
+
+def compile_templates(jinja_env):
+    """Load (and thereby compile) every template; returns how many were loaded."""
+    names = jinja_env.list_templates(extensions=('html',))
+    for name in names:
+        jinja_env.get_template(name)
+    return len(names)
+
+
+def warm_paths(app, paths):
+    """GET each path through the full request pipeline; returns {path: status or None}."""
+    client = app.test_client()
+    statuses = {}
+    for path in paths:
+        try:
+            statuses[path] = client.get(path).status_code
+        except Exception as e:
+            # A page that cannot be rendered yet must not keep the worker from starting
+            print(f"Warm-up request {path} failed: {e}")
+            statuses[path] = None
+    return statuses
+
+
+class StartupReport:
+    """Durations of the startup phases, from `started` (a perf_counter value)."""
+
+    def __init__(self, started):
+        self.started = started
+        self.phases = {}
+        self.details = {}
+        self.ready_seconds = None
+
+    def phase(self, name, seconds, detail=None):
+        self.phases[name] = seconds
+        if detail:
+            self.details[name] = detail
+
+    def ready(self):
+        self.ready_seconds = time.perf_counter() - self.started
+        details = ', '.join(
+            f"{name} {seconds * 1000:.0f} ms" + (f" [{self.details[name]}]" if name in self.details else '')
+            for name, seconds in self.phases.items())
+        print(f"Ready in {self.ready_seconds * 1000:.0f} ms ({details})", flush=True)
+
+
+def warm_up(app, paths=(), started=None):
+    """Precompile templates and request `paths`; returns a StartupReport."""
+    report = StartupReport(time.perf_counter() if started is None else started)
+    report.phase('app', time.perf_counter() - report.started)
+
+    phase_started = time.perf_counter()
+    count = compile_templates(app.jinja_env)
+    report.phase('templates', time.perf_counter() - phase_started, f'{count} loaded')
+
+    if paths:
+        phase_started = time.perf_counter()
+        statuses = warm_paths(app, paths)
+        warmed = sum(1 for status in statuses.values() if status and status < 500)
+        report.phase('pages', time.perf_counter() - phase_started, f'{warmed}/{len(paths)} rendered')
+
+    report.ready()
+    return report